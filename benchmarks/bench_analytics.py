@@ -0,0 +1,95 @@
+# 文件: benchmarks/bench_analytics.py
+# 比较年度报告的两种算法：原 annual_report 中逐条遍历记录的循环 vs analytics 月度立方体。
+# 用法: python benchmarks/bench_analytics.py [--sizes 10000 100000 1000000]
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import analytics  # noqa: E402
+from aggregates import AggregateIndex  # noqa: E402
+from analytics import LedgerColumns, build_cube  # noqa: E402
+from synthetic import generate_records  # noqa: E402
+
+
+def _best_of(fn, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def loop_report(records, year):
+    """原 annual_report 中的计算方式"""
+    year_records = [r for r in records if r['date'].startswith(year)]
+    total_income = sum(r['amount'] for r in year_records if r['type'] == 'income')
+    total_expense = sum(r['amount'] for r in year_records if r['type'] == 'expense')
+    expense_by_category = defaultdict(float)
+    monthly_trends = {f'{year}-{m:02d}': {'income': 0, 'expense': 0} for m in range(1, 13)}
+    for r in year_records:
+        if r['date'][:7] in monthly_trends:
+            if r['type'] == 'income':
+                monthly_trends[r['date'][:7]]['income'] += r['amount']
+            else:
+                monthly_trends[r['date'][:7]]['expense'] += r['amount']
+                expense_by_category[r['category']] += r['amount']
+    return total_income, total_expense, dict(expense_by_category), monthly_trends
+
+
+def cube_report(cube, year):
+    return (cube.total(year, 'income'), cube.total(year, 'expense'),
+            cube.category_totals(year, 'expense'), cube.monthly_trends(year))
+
+
+def run(size):
+    # 每天的记录数随规模增加，让账本跨度保持在 10 年左右，与真实使用接近
+    records = generate_records(size, records_per_day=max(5, size // 3650), description_length=0)
+    years = sorted({r['date'][:4] for r in records})
+    year = years[-1]
+
+    loop_s, expected = _best_of(lambda: loop_report(records, year))
+    loop_all_s, _ = _best_of(lambda: [loop_report(records, y) for y in years])
+    # 冷启动：从记录构建汇总索引和立方体（进程启动或重新加载数据文件时发生一次）
+    cold_s, cube = _best_of(lambda: build_cube(LedgerColumns.from_rows(AggregateIndex(records).month_rows())))
+    # 写入之后：汇总索引已增量更新，只需从月度汇总重建立方体
+    aggregates = AggregateIndex(records)
+    rebuild_s, _ = _best_of(lambda: build_cube(LedgerColumns.from_rows(aggregates.month_rows())))
+    # 直接从逐条记录按列构建（不经过汇总索引），体现向量化分组求和本身的开销
+    columns_s, _ = _best_of(lambda: build_cube(LedgerColumns.from_records(records)))
+    query_s, actual = _best_of(lambda: cube_report(cube, year))
+    query_all_s, _ = _best_of(lambda: [cube_report(cube, y) for y in years])
+    analytics_s, _ = _best_of(lambda: (cube.year_over_year(year), cube.rolling(12), cube.category_share()))
+
+    assert abs(actual[0] - expected[0]) < 0.01 and abs(actual[1] - expected[1]) < 0.01
+    return {
+        'records': len(records),
+        'years': len(years),
+        'engine': 'numpy' if analytics.np is not None else 'python',
+        'loop_report_ms': round(loop_s * 1000, 2),
+        'loop_all_years_ms': round(loop_all_s * 1000, 2),
+        'cube_cold_build_ms': round(cold_s * 1000, 2),
+        'cube_rebuild_from_aggregates_ms': round(rebuild_s * 1000, 2),
+        'cube_build_from_records_ms': round(columns_s * 1000, 2),
+        'cube_report_ms': round(query_s * 1000, 3),
+        'cube_all_years_ms': round(query_all_s * 1000, 3),
+        'cube_yoy_rolling_share_ms': round(analytics_s * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+    print(json.dumps([run(size) for size in args.sizes], indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+# 文件: benchmarks/bench_app.py
+# 端到端基准：按不同规模生成 data.json，通过 Flask test client 测量热点路径的耗时。
+# 用法: python benchmarks/bench_app.py [--years 1 5 20] [--backend json|sqlite|partitioned] [--output report.json]
+#       python benchmarks/bench_app.py --baseline report.json [--tolerance 1.5]
+# 指定 --baseline 时，任何一项比基线慢 tolerance 倍以上（且至少慢 1 毫秒）都会以状态码 1 退出。
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import add_ledger_arguments, ledger_kwargs, write_ledger  # noqa: E402
+
+# 比较基线时忽略差距小于这个值的项目，避免把计时噪声当成回退
+NOISE_FLOOR_MS = 1.0
+# 批量添加时每批的记录条数，大约是一个月的账单
+ADD_BATCH_SIZE = 30
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def _timings(fn, repeat):
+    """返回 (第一次耗时, 中位数耗时)；第一次通常包含冷缓存的开销"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return _ms(samples[0]), _ms(statistics.median(samples))
+
+
+def _get(ledger_app, client, url, cached):
+    """cached 为 False 时每次请求前清空已渲染响应的缓存（conditional_view），测量真正渲染页面的耗时"""
+    def request():
+        if not cached:
+            with ledger_app._rendered_cache_lock:
+                ledger_app._rendered_cache.clear()
+        response = client.get(url)
+        response.get_data()
+        assert response.status_code == 200, (url, response.status_code)
+    return request
+
+
+def measure(repeat):
+    """在已准备好数据目录的子进程中运行，返回各项耗时"""
+    sys.path.insert(0, SRC_DIR)
+    import app as ledger_app
+
+    start = time.perf_counter()
+    ledger_app._initialize_app_env()
+    data = ledger_app.load_data()
+    result = {'records': len(data['records']), 'startup_and_first_load_ms': _ms(time.perf_counter() - start)}
+    client = ledger_app.app.test_client()
+
+    result['load_data_first_ms'], result['load_data_ms'] = _timings(ledger_app.load_data, repeat)
+    result['save_data_first_ms'], result['save_data_ms'] = _timings(lambda: ledger_app.save_data(data), repeat)
+
+    records = sorted(data['records'], key=lambda r: r['date'])
+    latest_day = records[-1]['date']
+    pages = {
+        'index': '/',
+        'records': f'/records?selected_date={latest_day}',
+        'annual_report': f'/annual_report?year={latest_day[:4]}',
+        'export_csv': '/export_csv',
+    }
+    # 账本没有变化时重复打开同一页面会直接复用已渲染的响应：*_ms 是每次都重新渲染的耗时，*_cached_ms 是复用的耗时
+    for name, url in pages.items():
+        result[f'{name}_first_ms'], result[f'{name}_ms'] = _timings(_get(ledger_app, client, url, cached=False), repeat)
+        if name != 'export_csv':  # 导出是流式响应，不经过渲染缓存
+            _, result[f'{name}_cached_ms'] = _timings(_get(ledger_app, client, url, cached=True), repeat)
+
+    # 编辑和删除都会合并/删除同一天同类别的所有记录，每次操作选不同日期的记录
+    targets = iter(records[::max(len(records) // (2 * repeat + 1), 1)])
+
+    def edit():
+        record = next(targets)
+        response = client.post(f"/edit_record/{record['id']}", data={
+            'type': record['type'], 'category': record['category'], 'amount': record['amount'],
+            'description': record['description'], 'date': record['date'],
+        })
+        assert response.status_code == 302, response.status_code
+
+    def delete():
+        response = client.post(f"/delete_record/{next(targets)['id']}")
+        assert response.status_code == 302, response.status_code
+
+    result['edit_record_first_ms'], result['edit_record_ms'] = _timings(edit, repeat)
+    result['delete_record_first_ms'], result['delete_record_ms'] = _timings(delete, repeat)
+
+    # 逐条添加 vs 一次批量添加 ADD_BATCH_SIZE 条（补录一个月的账单）
+    item = {'type': 'expense', 'category': records[-1]['category'], 'amount': '12.5',
+            'description': 'bench', 'date': latest_day}
+
+    def add_one():
+        response = client.post('/add_record', data=item)
+        assert response.status_code == 302, response.status_code
+
+    def add_batch():
+        response = client.post('/api/records/batch', json=[dict(item, amount=12.5)] * ADD_BATCH_SIZE)
+        assert response.status_code == 200 and response.get_json()['added'] == ADD_BATCH_SIZE, response.status_code
+
+    result['add_record_first_ms'], result['add_record_ms'] = _timings(add_one, repeat)
+    result['add_batch_first_ms'], result['add_batch_ms'] = _timings(add_batch, repeat)
+
+    payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    def import_json():
+        response = client.post('/import_json', data={
+            'json_file': (io.BytesIO(payload), 'data.json'), 'mode': 'replace',
+        })
+        assert response.status_code == 302, response.status_code
+
+    result['import_json_first_ms'], result['import_json_ms'] = _timings(import_json, repeat)
+    return result
+
+
+def run(years, args):
+    """在临时数据目录中生成账本，并在独立的子进程中测量（每个规模都从冷启动开始）"""
+    data_dir = tempfile.mkdtemp(prefix='ledger-bench-')
+    try:
+        write_ledger(os.path.join(data_dir, 'data.json'), years=years, **ledger_kwargs(args))
+        env = dict(os.environ, LEDGER_DATA_DIR=data_dir, LEDGER_BACKEND=args.backend)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--measure', '--repeat', str(args.repeat)],
+            env=env, check=True, stdout=subprocess.PIPE, text=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        return dict({'years': years}, **result)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def compare(report, baseline, tolerance):
+    """返回相同规模下比基线慢 tolerance 倍以上的项目"""
+    base_by_years = {entry['years']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in report['results']:
+        base = base_by_years.get(entry['years'])
+        if base is None:
+            continue
+        for key, value in entry.items():
+            old = base.get(key)
+            if key.endswith('_ms') and old is not None and value > old * tolerance and value - old > NOISE_FLOOR_MS:
+                regressions.append({'years': entry['years'], 'metric': key, 'baseline_ms': old, 'current_ms': value})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--backend', choices=('json', 'sqlite', 'partitioned'), default='json')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    add_ledger_arguments(parser)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.repeat)))
+        return 0
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': args.backend,
+        'repeat': args.repeat,
+        'ledger': ledger_kwargs(args),
+        'results': [run(years, args) for years in args.years],
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+        status = 1 if report['regressions'] else 0
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
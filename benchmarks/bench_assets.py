@@ -0,0 +1,63 @@
+# 文件: benchmarks/bench_assets.py
+# 统计打开首页（桌面端 / 移动端）时页面和同源静态资源的传输字节数：不压缩 vs 客户端支持 gzip、br。
+# 先运行 python src_py/assets.py 构建静态资源，否则资源按原文件发送（只有 HTML 会被压缩）。
+# 用法: python benchmarks/bench_assets.py [--years 1]
+import argparse
+import gzip
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py')
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_ledger  # noqa: E402
+
+USER_AGENTS = {'desktop': 'Mozilla/5.0 (X11; Linux x86_64)', 'mobile': 'Mozilla/5.0 (Linux; Android 14) Mobile'}
+ASSET_RE = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+
+def page_bytes(client, user_agent, accept_encoding):
+    """返回 {'html': 字节数, 'assets': 字节数, 'external': [重定向到 CDN 的资源]}"""
+    headers = {'User-Agent': user_agent, 'Accept-Encoding': accept_encoding}
+    page = client.get('/', headers=headers)
+    result = {'html': len(page.data), 'assets': 0, 'external': []}
+    # 通过 test client 取回的正文是原样的，解压后再找资源地址
+    html = page.get_data()
+    if page.headers.get('Content-Encoding') == 'gzip':
+        html = gzip.decompress(html)
+    for url in ASSET_RE.findall(html.decode('utf-8')):
+        response = client.get(url, headers=headers)
+        if response.status_code == 200:
+            result['assets'] += len(response.get_data())
+        else:
+            result['external'].append(url)
+        response.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--years', type=float, default=1)
+    args = parser.parse_args()
+    data_dir = tempfile.mkdtemp(prefix='ledger-assets-')
+    try:
+        write_ledger(os.path.join(data_dir, 'data.json'), years=args.years)
+        os.environ['LEDGER_DATA_DIR'] = data_dir
+        import app
+        client = app.app.test_client()
+        results = {'built_assets': len(app.static_assets.files)}
+        for device, user_agent in USER_AGENTS.items():
+            for label, accept_encoding in (('identity', 'identity'), ('gzip', 'gzip'), ('gzip_br', 'gzip, br')):
+                results[f'{device}_{label}'] = page_bytes(client, user_agent, accept_encoding)
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# 文件: benchmarks/bench_partitions.py
+# 比较冷启动后第一次打开首页/年度报表的开销：整份 data.json（json 后端）vs 按年分区（partitioned 后端）。
+# 用法: python benchmarks/bench_partitions.py [--years 1 5 20]
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from storage import DATA_FILENAME, open_ledger_store  # noqa: E402
+from synthetic import generate_ledger  # noqa: E402
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def dashboard(store, day):
+    """首页用到的查询：类别/预算、本月合计、当天合计和当天的记录"""
+    store.meta()
+    store.period_summary(day[:7])
+    store.period_summary(day)
+    store.records_on(day)
+
+
+def annual_report(store, year):
+    store.years()
+    store.monthly_cube().total(year, 'expense')
+
+
+def run(years, data_dir):
+    shutil.rmtree(data_dir, ignore_errors=True)
+    os.makedirs(data_dir)
+    ledger = generate_ledger(years=years)
+    with open(os.path.join(data_dir, DATA_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(ledger, f, ensure_ascii=False, indent=4)
+    day = max(r['date'] for r in ledger['records'])
+    result = {'years': years, 'records': len(ledger['records'])}
+    # 先打开一次 partitioned 后端，完成从 data.json 的迁移
+    result['migrate_ms'] = _timed(lambda: open_ledger_store('partitioned', data_dir))
+    for backend in ('json', 'partitioned'):
+        # 每项都用新的存储对象，模拟进程刚启动、内存中什么都没有的情况
+        result[f'{backend}_dashboard_ms'] = _timed(lambda: dashboard(open_ledger_store(backend, data_dir), day))
+        result[f'{backend}_annual_report_ms'] = _timed(lambda: annual_report(open_ledger_store(backend, data_dir), day[:4]))
+        store = open_ledger_store(backend, data_dir)
+        result[f'{backend}_edit_ms'] = _timed(lambda: store.commit(remove=[r['id'] for r in store.records_on(day)[:1]]))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5, 20])
+    args = parser.parse_args()
+    data_dir = tempfile.mkdtemp(prefix='ledger-partitions-')
+    try:
+        print(json.dumps([run(years, data_dir) for years in args.years], indent=2))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
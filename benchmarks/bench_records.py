@@ -0,0 +1,82 @@
+# 文件: benchmarks/bench_records.py
+# 比较两种内存表示：json.load 得到的字典列表 vs records.Record 紧凑对象。
+# 用法: python benchmarks/bench_records.py [--sizes 10000 100000]
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from records import Record, day_text  # noqa: E402
+from synthetic import generate_records  # noqa: E402
+
+
+def _measure(build):
+    """返回 (构建结果, 结果占用的字节数)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def _best_of(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def aggregate_dicts(records):
+    totals = defaultdict(float)
+    for r in records:
+        totals[(r['date'][:7], r['type'], r['category'])] += r['amount']
+    return totals
+
+
+def aggregate_records(records):
+    totals = defaultdict(int)
+    month_of = {}  # 日序号 -> 'YYYY-MM'，每个不同的日期只换算一次
+    for r in records:
+        month = month_of.get(r.day)
+        if month is None:
+            month = month_of[r.day] = day_text(r.day)[:7]
+        totals[(month, r.type, r.category)] += r.cents
+    return {key: cents / 100 for key, cents in totals.items()}
+
+
+def run(size):
+    # 经过一次 JSON 序列化/解析，字符串的共享情况与 load_data() 读取 data.json 时一致
+    payload = json.dumps(generate_records(size), ensure_ascii=False)
+    dicts, dict_bytes = _measure(lambda: json.loads(payload))
+    compact, compact_bytes = _measure(lambda: [Record.from_dict(r) for r in json.loads(payload)])
+    count = len(dicts)
+    return {
+        'records': count,
+        'dict_bytes_per_record': round(dict_bytes / count, 1),
+        'record_bytes_per_record': round(compact_bytes / count, 1),
+        'memory_ratio': round(dict_bytes / compact_bytes, 2),
+        'dict_aggregate_ms': round(_best_of(lambda: aggregate_dicts(dicts)) * 1000, 2),
+        'record_aggregate_ms': round(_best_of(lambda: aggregate_records(compact)) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+    print(json.dumps([run(size) for size in args.sizes], indent=2))
+
+
+if __name__ == '__main__':
+    main()
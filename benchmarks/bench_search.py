@@ -0,0 +1,58 @@
+# 文件: benchmarks/bench_search.py
+# 比较备注/类别检索的两种方式：逐条扫描字符串（/api/records?q= 的做法）vs search 倒排索引。
+# 用法: python benchmarks/bench_search.py [--sizes 10000 100000] [--queries airport 餐饮 午饭taxi 饭]
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from search import SearchIndex  # noqa: E402
+from storage import LedgerIndex  # noqa: E402
+from synthetic import generate_ledger  # noqa: E402
+
+
+def _best_of(fn, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def scan(records, query):
+    needle = query.casefold()
+    return [r for r in records if needle in r['description'].casefold() or needle in r['category'].casefold()]
+
+
+def run(size, queries):
+    ledger = generate_ledger(years=max(size / (5 * 365), 1 / 365))
+    ledger['records'] = ledger['records'][:size]
+    records = list(LedgerIndex(ledger).records.values())
+    build_s, index = _best_of(lambda: SearchIndex(records), repeat=1)
+    result = {'records': len(records), 'index_build_ms': round(build_s * 1000, 1), 'queries': {}}
+    for query in queries:
+        scan_s, scanned = _best_of(lambda: scan(records, query))
+        search_s, (_, total) = _best_of(lambda: index.search(query))
+        result['queries'][query] = {
+            'scan_hits': len(scanned), 'index_hits': total,
+            'scan_ms': round(scan_s * 1000, 2), 'index_ms': round(search_s * 1000, 2),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--queries', nargs='+', default=['airport', '餐饮', '午饭taxi', '饭'])
+    args = parser.parse_args()
+    print(json.dumps([run(size, args.queries) for size in args.sizes], indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
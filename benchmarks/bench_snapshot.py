@@ -0,0 +1,59 @@
+# 文件: benchmarks/bench_snapshot.py
+# 比较两种 data.json 快照格式：indent=4 的普通 JSON vs snapshot 紧凑格式（文件大小、读取、写入）。
+# 用法: python benchmarks/bench_snapshot.py [--sizes 10000 100000]
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from storage import JsonLedgerStore, LedgerIndex  # noqa: E402
+from synthetic import generate_ledger  # noqa: E402
+
+
+def _best_of(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(size, data_dir):
+    ledger = generate_ledger(years=max(size / (5 * 365), 1 / 365))
+    ledger['records'] = ledger['records'][:size]
+    result = {'records': len(ledger['records'])}
+    for snapshot_format in ('json', 'compact'):
+        path = os.path.join(data_dir, f'{snapshot_format}.json')
+        store = JsonLedgerStore(path, snapshot_format=snapshot_format)
+        index = LedgerIndex(ledger)
+        write_s = _best_of(lambda: store._write_snapshot(index))
+        # 读取 = 解析快照文件并建立内存索引，即进程启动后第一次 load_data() 的主要开销
+        read_s = _best_of(lambda: LedgerIndex(JsonLedgerStore._parse_file(path)))
+        result[f'{snapshot_format}_bytes'] = os.path.getsize(path)
+        result[f'{snapshot_format}_read_ms'] = round(read_s * 1000, 2)
+        result[f'{snapshot_format}_write_ms'] = round(write_s * 1000, 2)
+    result['size_ratio'] = round(result['json_bytes'] / result['compact_bytes'], 2)
+    result['read_speedup'] = round(result['json_read_ms'] / result['compact_read_ms'], 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+    data_dir = tempfile.mkdtemp(prefix='ledger-snapshot-')
+    try:
+        print(json.dumps([run(size, data_dir) for size in args.sizes], indent=2))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# 文件: benchmarks/bench_sync.py
+# 在本机启动两个应用实例（A 带合成账本，B 为空），通过 /sync/peer 让 B 与 A 同步，
+# 然后两边各自增删改几条记录再同步一次：检查两边的账本一致，并比较增量同步与整份 export_json 的传输量。
+# 用法: python benchmarks/bench_sync.py [--years 1 5] [--backend json|sqlite|partitioned] [--edits 20]
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import write_ledger  # noqa: E402
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py')
+
+
+def _call(url, data=None):
+    body = None if data is None else json.dumps(data, ensure_ascii=False).encode('utf-8')
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=300) as response:
+        return response.read()
+
+
+def _start(data_dir, port, backend, peers):
+    env = dict(os.environ, LEDGER_DATA_DIR=data_dir, LEDGER_BACKEND=backend, HOST='127.0.0.1', PORT=str(port),
+               SYNC_PEERS=','.join(peers))
+    process = subprocess.Popen([sys.executable, 'app.py'], cwd=SRC_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    for _ in range(300):
+        try:
+            _call(f'{base}/sync?since=0')
+            return process, base
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'instance on port {port} did not start')
+
+
+def _records(base):
+    return {r['id']: r for r in json.loads(_call(f'{base}/export_json'))['records']}
+
+
+def _sync(client, peer):
+    start = time.perf_counter()
+    result = json.loads(_call(f'{client}/sync/peer', {'url': peer}))
+    return result, round((time.perf_counter() - start) * 1000, 1)
+
+
+def _edit(base, edits, day, tag):
+    """添加 edits 条记录，删除其中一半（通过批量添加接口和删除路由）"""
+    items = [{'type': 'expense', 'category': '餐饮', 'amount': 10 + i, 'description': f'{tag}-{i}', 'date': day}
+             for i in range(edits)]
+    added = json.loads(_call(f'{base}/api/records/batch', items))['results']
+    for item in added[::2]:
+        # 删除路由会删除同日同类别的整组记录，这里直接通过 /sync 推送一条墓碑
+        _call(f'{base}/sync', {'replica': 'bench', 'changes': [
+            {'id': item['id'], 'updated_at': time.time() + 1, 'origin': 'bench', 'deleted': True}]})
+
+
+def run(years, args, ports):
+    root = tempfile.mkdtemp(prefix='ledger-sync-')
+    processes = []
+    try:
+        dir_a, dir_b = os.path.join(root, 'a'), os.path.join(root, 'b')
+        os.makedirs(dir_a)
+        os.makedirs(dir_b)
+        count = write_ledger(os.path.join(dir_a, 'data.json'), years=years)
+        a, b = (f'http://127.0.0.1:{port}' for port in ports)
+        # /sync/peer 只与 SYNC_PEERS 中的地址同步
+        for data_dir, port in ((dir_a, ports[0]), (dir_b, ports[1])):
+            process, base = _start(data_dir, port, args.backend, [a, b])
+            processes.append(process)
+
+        result = {'years': years, 'records': count, 'export_json_bytes': len(_call(f'{a}/export_json'))}
+        initial, result['initial_sync_ms'] = _sync(b, a)
+        result['initial_pulled'] = initial['pulled']
+
+        # 记下 A 当前的日志位置，之后 A 上的变更就是增量
+        cursor = json.loads(_call(f'{a}/sync?since=0&replica=none'))['latest']
+        day = time.strftime('%Y-%m-%d')
+        _edit(a, args.edits, day, 'a')
+        _edit(b, args.edits, day, 'b')
+        query = urllib.parse.urlencode({'since': cursor, 'replica': 'none'})
+        result['delta_bytes_from_a'] = len(_call(f'{a}/sync?{query}'))
+        delta, result['delta_sync_ms'] = _sync(b, a)
+        result['delta_pulled'] = delta['pulled']
+        result['delta_pushed'] = delta['pushed']
+
+        records_a, records_b = _records(a), _records(b)
+        result['converged'] = records_a == records_b
+        result['records_after'] = len(records_a)
+        return result
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5])
+    parser.add_argument('--backend', choices=('json', 'sqlite', 'partitioned'), default='json')
+    parser.add_argument('--edits', type=int, default=20)
+    parser.add_argument('--ports', type=int, nargs=2, default=[5101, 5102])
+    args = parser.parse_args()
+    results = [run(years, args, args.ports) for years in args.years]
+    print(json.dumps(results, indent=2))
+    return 0 if all(r['converged'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# 文件: benchmarks/synthetic.py (生成合成账本数据，供基准测试使用)
+# 用法: python benchmarks/synthetic.py -o data.json [--years 3] [--records-per-day 5] ...
+import argparse
+import json
+import random
+import uuid
+from datetime import date, timedelta
+
+EXPENSE_CATEGORIES = ['餐饮', '交通', '购物', '住房', '娱乐', '医疗', '教育', '通讯', '旅行', '日用', '服饰', '社交',
+                      '宠物', '运动', '保险', '数码', '家居', '水电', '美容', '礼物']
+INCOME_CATEGORIES = ['工资', '奖金', '理财', '兼职', '报销', '红包']
+DESCRIPTION_WORDS = ['午饭', '地铁', '机场', '超市', 'airport', 'coffee', '打车', '房租', '电影', '水果',
+                     'taxi', '外卖', '生日', '会员', '加油', 'book', '网购', '聚餐', '早餐', 'lunch']
+
+
+def _category_names(pool, count, prefix):
+    names = pool[:count]
+    names += [f'{prefix}{i}' for i in range(len(names), count)]
+    return names
+
+
+def generate_ledger(years=3, records_per_day=5, expense_categories=12, income_categories=3,
+                    description_length=12, end=None, seed=0):
+    """生成与 data.json 结构相同的账本字典。
+
+    每天约 records_per_day 条记录（泊松近似），约 10% 为收入；描述由随机词拼接到约
+    description_length 个字符。同样的参数和 seed 总是生成同样的数据。
+    """
+    rng = random.Random(seed)
+    expense = _category_names(EXPENSE_CATEGORIES, expense_categories, '支出')
+    income = _category_names(INCOME_CATEGORIES, income_categories, '收入')
+    end = end or date.today()
+    start = end - timedelta(days=365 * years)
+
+    records = []
+    day = start
+    while day <= end:
+        day_text = day.isoformat()
+        for _ in range(max(0, round(rng.gauss(records_per_day, records_per_day ** 0.5)))):
+            is_income = rng.random() < 0.1
+            description = ''
+            while len(description) < description_length * rng.random():
+                description += rng.choice(DESCRIPTION_WORDS)
+            records.append({
+                'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                'type': 'income' if is_income else 'expense',
+                'category': rng.choice(income if is_income else expense),
+                'amount': round(rng.uniform(100, 20000) if is_income else rng.lognormvariate(3.5, 1.0), 2),
+                'description': description,
+                'date': day_text,
+            })
+        day += timedelta(days=1)
+
+    return {
+        'records': records,
+        'categories': {'expense': expense, 'income': income},
+        'budgets': {name: 1000.0 for name in expense[:5]},
+        'settings': {'keep_last_date': False},
+    }
+
+
+def generate_records(count, seed=0, **kwargs):
+    """生成大约 count 条记录（按每天 5 条推算跨度），只返回记录列表"""
+    records_per_day = kwargs.pop('records_per_day', 5)
+    years = max(count / (records_per_day * 365), 1 / 365)
+    ledger = generate_ledger(years=years, records_per_day=records_per_day, seed=seed, **kwargs)
+    return ledger['records'][:count]
+
+
+def write_ledger(path, **kwargs):
+    """生成账本并按 data.json 的格式写入 path，返回记录数"""
+    ledger = generate_ledger(**kwargs)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(ledger, f, ensure_ascii=False, indent=4)
+    return len(ledger['records'])
+
+
+def add_ledger_arguments(parser):
+    """generate_ledger 的参数，bench_app.py 也使用同一组命令行参数"""
+    parser.add_argument('--records-per-day', type=float, default=5)
+    parser.add_argument('--expense-categories', type=int, default=12)
+    parser.add_argument('--income-categories', type=int, default=3)
+    parser.add_argument('--description-length', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def ledger_kwargs(args):
+    return {
+        'records_per_day': args.records_per_day,
+        'expense_categories': args.expense_categories,
+        'income_categories': args.income_categories,
+        'description_length': args.description_length,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成的 data.json')
+    parser.add_argument('-o', '--output', default='data.json')
+    parser.add_argument('--years', type=float, default=3)
+    add_ledger_arguments(parser)
+    args = parser.parse_args()
+    count = write_ledger(args.output, years=args.years, **ledger_kwargs(args))
+    print(f'{args.output}: {count} records')
+
+
+if __name__ == '__main__':
+    main()
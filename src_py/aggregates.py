@@ -0,0 +1,103 @@
+# 文件: aggregates.py (按日/月/年预先汇总的金额索引)
+from collections import defaultdict
+
+# 日期字符串前缀长度：'YYYY-MM-DD' / 'YYYY-MM' / 'YYYY'
+PERIOD_LENGTHS = (10, 7, 4)
+
+
+class AggregateIndex:
+    """以 (日期, 类型, 类别) 为键维护金额合计，并向上汇总到月和年。
+
+    新增/删除记录时增量更新，查询某个时间段的合计只和类别数量有关，与记录总数无关。
+    """
+
+    def __init__(self, records=()):
+        # {前缀长度: {时间段: {(类型, 类别): [金额合计, 记录条数]}}}
+        self._levels = {n: defaultdict(dict) for n in PERIOD_LENGTHS}
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        key = (record['type'], record['category'])
+        amount = record['amount']
+        for n, periods in self._levels.items():
+            bucket = periods[record['date'][:n]]
+            cell = bucket.get(key)
+            if cell is None:
+                bucket[key] = [amount, 1]
+            else:
+                cell[0] += amount
+                cell[1] += 1
+
+    def remove(self, record):
+        key = (record['type'], record['category'])
+        for n, periods in self._levels.items():
+            period = record['date'][:n]
+            bucket = periods.get(period)
+            cell = bucket.get(key) if bucket else None
+            if cell is None:
+                continue
+            cell[0] -= record['amount']
+            cell[1] -= 1
+            # 条数归零时整格删除，避免浮点误差残留成 0.0000001 之类的金额
+            if cell[1] <= 0:
+                del bucket[key]
+                if not bucket:
+                    del periods[period]
+
+    def add_days(self, records):
+        """只把记录汇总到“日”一级；月和年的合计已经由 add_month() 预先填入时使用"""
+        days = self._levels[10]
+        for record in records:
+            key = (record['type'], record['category'])
+            bucket = days[record['date'][:10]]
+            cell = bucket.get(key)
+            if cell is None:
+                bucket[key] = [record['amount'], 1]
+            else:
+                cell[0] += record['amount']
+                cell[1] += 1
+
+    def add_month(self, month, key, amount, count):
+        """直接填入某月某 (类型, 类别) 的合计，并向上汇总到年"""
+        for n in (7, 4):
+            bucket = self._levels[n][month[:n]]
+            cell = bucket.get(key)
+            if cell is None:
+                bucket[key] = [amount, count]
+            else:
+                cell[0] += amount
+                cell[1] += count
+
+    def month_cells(self):
+        """按月汇总的 {月份: [[类型, 类别, 金额合计, 记录条数], ...]}，可直接写入 JSON"""
+        return {
+            month: [[record_type, category, cell[0], cell[1]] for (record_type, category), cell in bucket.items()]
+            for month, bucket in self._levels[7].items()
+        }
+
+    def summary(self, period):
+        """返回某一天/月/年的 {(类型, 类别): 金额合计}"""
+        periods = self._levels.get(len(period))
+        bucket = periods.get(period) if periods is not None else None
+        if not bucket:
+            return {}
+        return {key: cell[0] for key, cell in bucket.items()}
+
+    def month_rows(self):
+        """按月汇总的 (月份, 类型, 类别, 金额合计) 行"""
+        for month, bucket in self._levels[7].items():
+            for (record_type, category), cell in bucket.items():
+                yield (month, record_type, category, cell[0])
+
+    def years(self):
+        """出现过记录的年份，倒序"""
+        return sorted(self._levels[4].keys(), reverse=True)
+
+
+def type_total(summary, record_type):
+    return sum(amount for (t, _), amount in summary.items() if t == record_type)
+
+
+def category_totals(summary, record_type):
+    return {category: amount for (t, category), amount in summary.items() if t == record_type}
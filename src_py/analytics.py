@@ -0,0 +1,207 @@
+# 文件: analytics.py (按列批量计算的年/月/类别汇总引擎)
+# 安装了 NumPy 时用 bincount 做向量化分组求和，否则退回纯 Python 循环，结果完全相同。
+try:
+    import numpy as np
+except ImportError:  # Android / 精简镜像中通常没有 NumPy
+    np = None
+
+TYPES = ('income', 'expense')
+
+
+def month_index(text):
+    """'YYYY-MM...' -> 连续的月份编号 (year * 12 + month - 1)"""
+    return int(text[:4]) * 12 + int(text[5:7]) - 1
+
+
+def month_text(index):
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+class LedgerColumns:
+    """按列存放的账本：月份编号、类型编码（0 收入 / 1 支出）、类别编码和金额（分）"""
+
+    def __init__(self, months, types, categories, cents, category_names):
+        self.months = months
+        self.types = types
+        self.categories = categories
+        self.cents = cents
+        self.category_names = category_names
+
+    @classmethod
+    def from_rows(cls, rows):
+        """由 (日期或月份字符串, 类型, 类别, 金额) 行构建，行可以是原始记录，也可以是已汇总的合计"""
+        months, types, categories, cents = [], [], [], []
+        codes, names = {}, []
+        month_of = {}  # 同一日期字符串只解析一次
+        for period, record_type, category, amount in rows:
+            month = month_of.get(period)
+            if month is None:
+                try:
+                    month = month_of[period] = month_index(period)
+                except ValueError:
+                    month = month_of[period] = -1  # 日期格式不合法的记录不参与按月统计
+            if month < 0:
+                continue
+            code = codes.get(category)
+            if code is None:
+                code = codes[category] = len(names)
+                names.append(category)
+            months.append(month)
+            # 与原年度报告一致：不是收入的都算作支出
+            types.append(0 if record_type == 'income' else 1)
+            categories.append(code)
+            cents.append(round(amount * 100))
+        if np is not None:
+            months = np.asarray(months, dtype=np.int64)
+            types = np.asarray(types, dtype=np.int64)
+            categories = np.asarray(categories, dtype=np.int64)
+            cents = np.asarray(cents, dtype=np.int64)
+        return cls(months, types, categories, cents, names)
+
+    @classmethod
+    def from_records(cls, records):
+        return cls.from_rows((r['date'], r['type'], r['category'], r['amount']) for r in records)
+
+    def __len__(self):
+        return len(self.months)
+
+
+def _group_sum(keys, weights, size):
+    """按整数键分组求和，返回长度为 size 的列表"""
+    if np is not None and isinstance(keys, np.ndarray):
+        return np.bincount(keys, weights=weights, minlength=size).astype(np.int64).tolist()
+    totals = [0] * size
+    for key, weight in zip(keys, weights):
+        totals[key] += weight
+    return totals
+
+
+def build_cube(columns):
+    """一次批量分组，得到 (月份, 类型, 类别) 三维的金额合计"""
+    n_categories = max(len(columns.category_names), 1)
+    if len(columns) == 0:
+        return MonthlyCube(0, 0, columns.category_names, [])
+    if np is not None and isinstance(columns.months, np.ndarray):
+        first = int(columns.months.min())
+        n_months = int(columns.months.max()) - first + 1
+        keys = ((columns.months - first) * 2 + columns.types) * n_categories + columns.categories
+    else:
+        first = min(columns.months)
+        n_months = max(columns.months) - first + 1
+        keys = [((m - first) * 2 + t) * n_categories + c
+                for m, t, c in zip(columns.months, columns.types, columns.categories)]
+    values = _group_sum(keys, columns.cents, n_months * 2 * n_categories)
+    return MonthlyCube(first, n_months, columns.category_names, values)
+
+
+class MonthlyCube:
+    """按月、类型、类别展开的金额合计（单位：分），所有查询只和月数 × 类别数有关。"""
+
+    def __init__(self, first_month, n_months, category_names, values):
+        self.first_month = first_month
+        self.n_months = n_months
+        self.category_names = category_names
+        self.values = values
+
+    def _cell_range(self, month, type_code):
+        offset = ((month - self.first_month) * 2 + type_code) * len(self.category_names)
+        return offset, offset + len(self.category_names)
+
+    def _months_of(self, period):
+        """period 为 'YYYY' 或 'YYYY-MM'，返回落在数据范围内的月份编号"""
+        if len(period) == 4:
+            start = int(period) * 12
+            candidates = range(start, start + 12)
+        else:
+            candidates = [month_index(period)]
+        last = self.first_month + self.n_months
+        return [m for m in candidates if self.first_month <= m < last]
+
+    def month_total(self, month, record_type):
+        """某个月份编号、某个类型的合计（元）"""
+        if not self.first_month <= month < self.first_month + self.n_months:
+            return 0.0
+        lo, hi = self._cell_range(month, TYPES.index(record_type))
+        return sum(self.values[lo:hi]) / 100
+
+    def total(self, period, record_type):
+        return sum(self.month_total(m, record_type) for m in self._months_of(period))
+
+    def category_totals(self, period, record_type):
+        """{类别: 合计}，只包含金额不为 0 的类别"""
+        sums = [0] * len(self.category_names)
+        for m in self._months_of(period):
+            lo, hi = self._cell_range(m, TYPES.index(record_type))
+            for i, v in enumerate(self.values[lo:hi]):
+                sums[i] += v
+        return {name: v / 100 for name, v in zip(self.category_names, sums) if v}
+
+    def years(self):
+        seen = {(self.first_month + i) // 12 for i in range(self.n_months)
+                if any(self.month_total(self.first_month + i, t) for t in TYPES)}
+        return [str(y) for y in sorted(seen, reverse=True)]
+
+    def monthly_trends(self, year):
+        """某年 12 个月的 {'YYYY-MM': {'income': .., 'expense': ..}}"""
+        base = int(year) * 12
+        return {month_text(m): {t: self.month_total(m, t) for t in TYPES} for m in range(base, base + 12)}
+
+    def year_over_year(self, year):
+        """某年与上一年逐月对比"""
+        year = int(year)
+        current = self.monthly_trends(str(year))
+        previous = self.monthly_trends(str(year - 1))
+        months = []
+        for (month, cur), prev in zip(current.items(), previous.values()):
+            row = {'month': month}
+            for t in TYPES:
+                row[t] = cur[t]
+                row[f'previous_{t}'] = prev[t]
+                row[f'{t}_change'] = _change_ratio(cur[t], prev[t])
+            months.append(row)
+        totals = {}
+        for t in TYPES:
+            totals[t] = self.total(str(year), t)
+            totals[f'previous_{t}'] = self.total(str(year - 1), t)
+            totals[f'{t}_change'] = _change_ratio(totals[t], totals[f'previous_{t}'])
+        return {'year': str(year), 'previous_year': str(year - 1), 'months': months, 'totals': totals}
+
+    def rolling(self, window=12, start=None, end=None):
+        """每个月份截止的最近 window 个月滚动合计"""
+        if self.n_months == 0:
+            return []
+        monthly = {t: [self.month_total(self.first_month + i, t) for i in range(self.n_months)] for t in TYPES}
+        first = month_index(start) if start else self.first_month
+        last = month_index(end) if end else self.first_month + self.n_months - 1
+        result = []
+        running = {t: 0.0 for t in TYPES}
+        # 从窗口起点开始滑动，每个月加上新进入的、减去移出窗口的
+        for m in range(first - window + 1, last + 1):
+            for t in TYPES:
+                running[t] += _at(monthly[t], m - self.first_month)
+                running[t] -= _at(monthly[t], m - window - self.first_month)
+            if m >= first:
+                result.append({'month': month_text(m), **{t: round(running[t], 2) for t in TYPES}})
+        return result
+
+    def category_share(self, record_type='expense'):
+        """每年各类别占该类型全年合计的比例"""
+        shares = {}
+        for year in sorted(self.years()):
+            totals = self.category_totals(year, record_type)
+            grand = sum(totals.values())
+            if grand:
+                shares[year] = {name: round(v / grand, 4)
+                                for name, v in sorted(totals.items(), key=lambda item: item[1], reverse=True)}
+        return shares
+
+
+def _at(series, i):
+    return series[i] if 0 <= i < len(series) else 0.0
+
+
+def _change_ratio(current, previous):
+    """同比变化率；上一期为 0 时无法计算，返回 None"""
+    if not previous:
+        return None
+    return round((current - previous) / previous, 4)
@@ -1,28 +1,70 @@
 # 文件: app.py (最终修复版 - 增加日期记忆开关)
+import time
+_import_started = time.perf_counter()  # 启动耗时从开始导入本模块算起
+
 import json
 import uuid
+import base64
 import csv
+import functools
+import hashlib
+import hmac
 import io
 import os
 import logging
+import math
 import sys
-import traceback
-from datetime import datetime, date
-from collections import defaultdict
-from flask import Flask, render_template, request, redirect, url_for, flash, Response, send_from_directory, session
+import tempfile
+import threading
+from datetime import datetime, date, timezone
+from collections import OrderedDict, defaultdict
+from flask import Flask, render_template, request, redirect, url_for, flash, Response, session, jsonify
+from jinja2 import FileSystemBytecodeCache
+from flask.sessions import SecureCookieSessionInterface
 from markupsafe import escape
+from werkzeug.serving import make_server
+from aggregates import category_totals, type_total
+from assets import StaticAssets, compress_response
+from jsonstream import RECORD_TYPES, LedgerFormatError, is_iso_date, iter_ledger_json, iter_ledger_json_text
+from logbuffer import DEFAULT_MAX_BYTES, DEFAULT_MAX_LINES, RingBufferHandler
+from metrics import PHASES, QUANTILES, WINDOW, RequestMetrics, StartupTimer, instrument_store, timed
+from records import is_whole_cents
+from storage import open_ledger_store
+from sync import SYNC_FILENAME, LedgerSync
+
+# 模板渲染耗时单独计入 render_template 阶段
+render_template = timed('render_template')(render_template)
 
 _env_initialized = False
+_env_lock = threading.Lock()
 IS_ANDROID = False
 DATA_DIR = None
 DATA_FILE = None
-log_capture_string = io.StringIO()
+ledger_store = None
+ledger_sync = None
+# /debuglog 显示的日志只保留最近的部分，上限可通过环境变量调整
+log_buffer = RingBufferHandler(
+    max_lines=int(os.environ.get('LOG_BUFFER_LINES', DEFAULT_MAX_LINES)),
+    max_bytes=int(os.environ.get('LOG_BUFFER_BYTES', DEFAULT_MAX_BYTES)),
+)
+request_metrics = RequestMetrics()
+startup = StartupTimer(_import_started)
+# 冷启动目标：从导入 app 模块到开始接受请求的毫秒数，超出时在日志中警告
+STARTUP_TARGET_MS = int(os.environ.get('STARTUP_TARGET_MS', 1500))
  
 def _initialize_app_env():
-    global _env_initialized, IS_ANDROID, DATA_DIR, DATA_FILE
     if _env_initialized:
         return
- 
+    with _env_lock:
+        if not _env_initialized:
+            _initialize_app_env_locked()
+
+def _initialize_app_env_locked():
+    with startup.phase('env'):
+        _setup_app_env()
+
+def _setup_app_env():
+    global _env_initialized, IS_ANDROID, DATA_DIR, DATA_FILE, ledger_store, ledger_sync
     try:
         from com.chaquo.python import android
         context = android.get_application()
@@ -46,9 +88,8 @@ def _initialize_app_env():
     console_handler.setFormatter(formatter)
     root_logger.addHandler(console_handler)
 
-    string_io_handler = logging.StreamHandler(log_capture_string)
-    string_io_handler.setFormatter(formatter)
-    root_logger.addHandler(string_io_handler)
+    log_buffer.setFormatter(formatter)
+    root_logger.addHandler(log_buffer)
 
     OLD_DATA_DIR = os.path.join(BASE_DIR, 'data')
     NEW_DATA_DIR = os.path.join(BASE_DIR, 'user_data')
@@ -61,14 +102,89 @@ def _initialize_app_env():
         except OSError as e:
             logging.critical(f"FATAL: Failed to migrate data from old directory: {e}", exc_info=True)
 
-    DATA_DIR = NEW_DATA_DIR
+    # LEDGER_DATA_DIR 可以把数据目录指到别处（例如 Docker 卷或基准测试生成的账本）
+    DATA_DIR = os.environ.get('LEDGER_DATA_DIR') or NEW_DATA_DIR
     DATA_FILE = os.path.join(DATA_DIR, 'data.json')
     os.makedirs(DATA_DIR, exist_ok=True)
 
+    # 编译后的模板缓存在磁盘上，进程重启后不必重新编译
+    jinja_cache_dir = os.path.join(BASE_DIR, 'cache', 'jinja')
+    try:
+        os.makedirs(jinja_cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(jinja_cache_dir)
+    except OSError as e:
+        logging.warning(f"DIAGNOSTIC: Template bytecode cache disabled: {e}")
+
+    # 按配置选择存储后端（json / sqlite）；读取账本、回放变更日志放在 warm_up() 中
+    store = open_ledger_store(app.config['LEDGER_BACKEND'], DATA_DIR, app.config['LEDGER_SNAPSHOT_FORMAT'])
+    # 账本的每次修改同时记入变更日志，供 /sync 与其他实例增量同步
+    ledger_sync = LedgerSync(store, os.path.join(DATA_DIR, SYNC_FILENAME))
+    ledger_store = instrument_store(store)
+    # 多个 worker 进程同时启动时，由账本锁保证只有一个进程生成会话密钥
+    with ledger_store.lock:
+        app.secret_key = _load_secret_key(DATA_DIR)
+
     _env_initialized = True
 
+SECRET_KEY_FILENAME = 'secret_key'
+
+def _load_secret_key(data_dir):
+    """会话签名密钥：优先使用环境变量 SECRET_KEY，否则使用数据目录中保存的随机密钥，
+    这样多个 worker 进程之间、以及重启前后，登录会话和 flash 消息都能继续使用"""
+    if os.environ.get('SECRET_KEY'):
+        return os.environ['SECRET_KEY']
+    path = os.path.join(data_dir, SECRET_KEY_FILENAME)
+    try:
+        with open(path, 'r', encoding='ascii') as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    key = os.urandom(32).hex()
+    fd, tmp_path = tempfile.mkstemp(prefix=SECRET_KEY_FILENAME + '.', dir=data_dir)
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        f.write(key)
+    os.replace(tmp_path, path)
+    logging.info(f"DIAGNOSTIC: Generated a new session secret key at '{path}'.")
+    return key
+
+class LedgerSessionInterface(SecureCookieSessionInterface):
+    """密钥保存在数据目录里，读取会话前需要先完成环境初始化"""
+
+    def get_signing_serializer(self, app):
+        _initialize_app_env()
+        return super().get_signing_serializer(app)
+
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+app.session_interface = LedgerSessionInterface()
+# 存储后端：json（data.json）、sqlite 或 partitioned（按年分区，只加载用到的年份）
+app.config['LEDGER_BACKEND'] = os.environ.get('LEDGER_BACKEND', 'json')
+# 与其他实例同步时使用的共享口令：设置后 /sync 要求 "Authorization: Bearer <口令>"，向对端同步时也会带上
+app.config['SYNC_TOKEN'] = os.environ.get('SYNC_TOKEN') or None
+# 允许通过 /sync/peer 同步的对端地址（逗号分隔）；口令只会发送给这些地址，不会发送给请求方填写的任意地址
+app.config['SYNC_PEERS'] = [u.strip().rstrip('/') for u in os.environ.get('SYNC_PEERS', '').split(',') if u.strip()]
+# data.json（或各年份分区文件）的格式：json（缩进，便于阅读）或 compact（紧凑格式，加载更快），读取时自动识别
+app.config['LEDGER_SNAPSHOT_FORMAT'] = os.environ.get('LEDGER_SNAPSHOT_FORMAT', 'json')
+
+# 静态资源：构建过（python assets.py）时 url_for('static', ...) 生成带指纹的地址，
+# 按 Accept-Encoding 发送预压缩的 .br / .gz 并允许长期缓存；HTML / JSON 响应按需 gzip 压缩
+static_assets = StaticAssets(app.static_folder)
+app.url_defaults(static_assets.url_defaults)
+app.endpoint('static')(static_assets.send)
+app.after_request(compress_response)
+
+# 不参与耗时统计的路由
+UNTIMED_ENDPOINTS = ('static', 'metrics')
+
+@app.before_request
+def _start_request_timing():
+    if request.endpoint not in UNTIMED_ENDPOINTS:
+        request_metrics.begin()
+
+@app.teardown_request
+def _finish_request_timing(exc):
+    request_metrics.end(request.endpoint)
 
 def is_mobile():
     _initialize_app_env()
@@ -81,7 +197,7 @@ def is_mobile():
 def inject_global_vars():
     """向所有模板注入全局变量"""
     _initialize_app_env()
-    data = load_data()
+    data = ledger_store.meta()
     
     if data.get('settings', {}).get('keep_last_date', False) and 'last_used_date' in session:
         date_for_new_record = session['last_used_date']
@@ -97,44 +213,113 @@ def inject_global_vars():
     }
  
 def save_data(data):
+    """整体替换账本；日常的增删改请使用 ledger_store.commit()"""
     _initialize_app_env()
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    ledger_store.replace(data)
 
 def load_data():
+    """返回完整账本的可修改副本；视图请优先使用 ledger_store 的查询方法"""
     _initialize_app_env()
-    
-    initial_data = {
-        "records": [],
-        "categories": {
-            "expense": ["交通"],
-            "income": ["工资"]
-        },
-        "budgets": {},
-        "settings": {
-            "keep_last_date": False
-        }
-    }
+    return ledger_store.load()
 
-    try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            data.setdefault('records', [])
-            data.setdefault('categories', {}).setdefault('expense', [])
-            data.setdefault('categories', {}).setdefault('income', [])
-            data.setdefault('budgets', {})
-            data.setdefault('settings', {}).setdefault('keep_last_date', False)
-            return data
-    except (FileNotFoundError, json.JSONDecodeError):
-        save_data(initial_data)
-        return initial_data
+def ledger_transaction(view):
+    """读-改-写类路由的装饰器：整个请求期间持有账本锁，避免并发请求互相覆盖修改"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        _initialize_app_env()
+        with ledger_store.lock:
+            return view(*args, **kwargs)
+    return wrapper
+
+RENDERED_CACHE_SIZE = 32  # 按 ETag 缓存的已渲染响应条数
+RENDERED_CACHE_MAX_BYTES = 512 * 1024  # 超过这个大小的响应不缓存
+_rendered_cache = OrderedDict()
+_rendered_cache_lock = threading.Lock()
+
+def _code_build_id():
+    """代码和模板文件的 (路径, mtime, size) 摘要；所有 worker 进程一致，重新部署后改变"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = sorted(d for d in dirs if d in ('templates', 'mobile'))
+        for name in sorted(files):
+            if name.endswith(('.py', '.html')):
+                st = os.stat(os.path.join(root, name))
+                digest.update(f'{root}/{name}:{st.st_mtime_ns}:{st.st_size};'.encode('utf-8'))
+    return digest.hexdigest()[:8]
+
+# 静态资源重新构建后页面中的资源地址会变，也算作代码版本的一部分
+BUILD_ID = _code_build_id() + static_assets.version
+
+def _response_etag(ledger_version):
+    """强 ETag：账本版本 + 代码版本 + 路由、参数，以及会影响页面内容的请求上下文（移动端、当天日期、补录日期）"""
+    variant = '\0'.join([
+        BUILD_ID, request.endpoint or '', request.query_string.decode('latin-1'),
+        'mobile' if is_mobile() else 'desktop', date.today().isoformat(), session.get('last_used_date', ''),
+    ])
+    return f"{ledger_version}-{hashlib.sha1(variant.encode('utf-8')).hexdigest()[:16]}"
+
+def conditional_view(view):
+    """只读路由的装饰器：按账本版本设置 ETag / Last-Modified，客户端缓存仍有效时返回 304；
+    同一版本下重复请求同一页面时直接复用已渲染的响应。"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        _initialize_app_env()
+        if request.method not in ('GET', 'HEAD'):
+            return view(*args, **kwargs)
+        # 待显示的 flash 消息会被渲染进页面，这样的页面不能被缓存复用
+        if session.get('_flashes'):
+            response = app.make_response(view(*args, **kwargs))
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
+        ledger_version, modified_at = ledger_store.version()
+        etag = _response_etag(ledger_version)
+        last_modified = datetime.fromtimestamp(int(modified_at), timezone.utc)
+        # 按弱比较匹配：gzip 压缩后的响应带的是同一 ETag 的弱形式
+        if request.if_none_match.contains_weak(etag) or (
+                not request.if_none_match and request.if_modified_since is not None
+                and last_modified <= request.if_modified_since):
+            response = Response(status=304)
+        else:
+            with _rendered_cache_lock:
+                cached = _rendered_cache.get(etag)
+            if cached is not None:
+                body, mimetype = cached
+                response = Response(body, mimetype=mimetype)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                # 重定向、参数错误等响应按原样返回，不参与缓存
+                if response.status_code != 200:
+                    return response
+                if not response.is_streamed and len(response.get_data()) <= RENDERED_CACHE_MAX_BYTES:
+                    with _rendered_cache_lock:
+                        _rendered_cache[etag] = (response.get_data(), response.mimetype)
+                        while len(_rendered_cache) > RENDERED_CACHE_SIZE:
+                            _rendered_cache.popitem(last=False)
+        # 读到版本号之后才生成内容，期间若有写入，ETag 只会比内容旧，下次请求会拿到完整响应
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.update(('User-Agent', 'Cookie'))
+        return response
+    return wrapper
 
 # --- 路由和视图函数 ---
 
+def _monthly_summary_payload(month):
+    summary = ledger_store.period_summary(month)
+    return {
+        'income': type_total(summary, 'income'),
+        'expense': type_total(summary, 'expense'),
+        'expense_by_category': category_totals(summary, 'expense'),
+    }
+
 @app.route('/')
+@conditional_view
 def index():
-    data = load_data()
-    all_records = data['records']
+    _initialize_app_env()
+    data = ledger_store.meta()
     now = datetime.now()
  
     # 【核心修改 1/2】: 智能判断月份来源
@@ -162,18 +347,16 @@ def index():
         selected_date_str = now.strftime('%Y-%m-%d')
         target_month_str = now.strftime('%Y-%m')
     
-    # 所有月度计算都基于最终确定的 target_month_str
-    monthly_records = [r for r in all_records if r['date'].startswith(target_month_str)]
-    monthly_income_total = sum(r['amount'] for r in monthly_records if r['type'] == 'income')
-    monthly_expense_total = sum(r['amount'] for r in monthly_records if r['type'] == 'expense')
+    # 所有月度计算都基于最终确定的 target_month_str，月度合计按月缓存，只有该月的记录变化后才重新计算
+    monthly = ledger_store.report('monthly_summary', target_month_str,
+                                  lambda: _monthly_summary_payload(target_month_str))
+    monthly_income_total = monthly['income']
+    monthly_expense_total = monthly['expense']
     monthly_savings = monthly_income_total - monthly_expense_total
     
-    # 预算计算逻辑不变，它会自动使用正确的 monthly_records
+    # 预算计算逻辑不变（预算可能随时修改，不进入缓存），按类别的支出同样来自月度汇总
     budgets = defaultdict(float, data.get('budgets', {}))
-    monthly_expense_by_category = defaultdict(float)
-    for record in monthly_records:
-        if record['type'] == 'expense':
-            monthly_expense_by_category[record['category']] += record['amount']
+    monthly_expense_by_category = monthly['expense_by_category']
     
     total_budget = sum(budgets.values())
     budget_progress = {}
@@ -197,8 +380,9 @@ def index():
                                selected_month=target_month_str) # <-- 新增变量
     else: 
         # 桌面端的日度计算（基于 selected_date_str）
-        daily_income = sum(r['amount'] for r in all_records if r['date'] == selected_date_str and r['type'] == 'income')
-        daily_expense = sum(r['amount'] for r in all_records if r['date'] == selected_date_str and r['type'] == 'expense')
+        daily_summary = ledger_store.period_summary(selected_date_str)
+        daily_income = type_total(daily_summary, 'income')
+        daily_expense = type_total(daily_summary, 'expense')
         
         return render_template('index.html',
                                daily_income=daily_income, 
@@ -219,43 +403,65 @@ def add_form():
     else:
         return redirect(url_for('index'))
  
-@app.route('/add_record', methods=['POST'])
-def add_record():
-    data = load_data()
+def _form_text(fields, name):
+    value = fields.get(name)
+    return value.strip() if isinstance(value, str) else ''
+
+MAX_RECORD_AMOUNT = 100_000_000  # 单条记录金额的上限
+
+def _new_record(fields, from_json=False):
+    """按添加记录表单的规则校验并生成一条新记录，返回 (记录, None) 或 (None, 错误信息)。
+
+    fields 可以是表单，也可以是 JSON 对象（from_json=True）；类别为 '--custom--' 时使用 custom_category_input 中的自定义类别。
+    """
+    amount = fields.get('amount')
+    # 表单的金额是字符串；JSON 中必须是数字，float() 会把 true 和 "12.5" 也转换成金额
+    if from_json and (isinstance(amount, bool) or not isinstance(amount, (int, float))):
+        return None, '金额必须是数字！'
     try:
-        amount_float = float(request.form.get('amount'))
+        amount_float = float(amount)
     except (ValueError, TypeError):
-        flash('金额必须是有效的数字！', 'danger')
-        return redirect(url_for('add_form') if is_mobile() else url_for('index'))
- 
-    category = ""
-    if is_mobile():
-        selected_category = request.form.get('category')
-        if selected_category == '--custom--':
-            category = request.form.get('custom_category_input', '').strip()
-            if not category:
-                flash('选择了自定义类别，但未填写名称！', 'danger')
-                return redirect(url_for('add_form'))
-        else:
-            category = selected_category
-    else:
-        category = request.form.get('category', '').strip()
- 
+        return None, '金额必须是有效的数字！'
+    # float() 接受 'inf'、'nan' 和 '1e309' 这样的输入
+    if not math.isfinite(amount_float) or amount_float > MAX_RECORD_AMOUNT:
+        return None, f'金额必须是不超过 {MAX_RECORD_AMOUNT} 的有效数字！'
+    # 金额按“分”存储，0.004 这样的金额会被悄悄存成 0.00
+    if not is_whole_cents(amount_float):
+        return None, '金额最多保留两位小数！'
+
+    category = _form_text(fields, 'category')
+    if category == '--custom--':
+        category = _form_text(fields, 'custom_category_input')
+        if not category:
+            return None, '选择了自定义类别，但未填写名称！'
+
     new_record = {
         'id': str(uuid.uuid4()),
-        'type': request.form.get('type'),
+        'type': fields.get('type'),
         'category': category,
         'amount': amount_float,
-        'description': request.form.get('description', '').strip(),
-        'date': request.form.get('date') or datetime.now().strftime('%Y-%m-%d')
+        'description': _form_text(fields, 'description'),
+        'date': fields.get('date') or datetime.now().strftime('%Y-%m-%d')
     }
-    
     if not all([new_record['type'], new_record['category'], new_record['amount'] > 0]):
-        flash('类型、类别和金额都是必填项!', 'danger')
+        return None, '类型、类别和金额都是必填项!'
+    # 表单的类型和日期由下拉框和日期控件限定，JSON 请求或手工构造的表单需要额外检查
+    if new_record['type'] not in RECORD_TYPES:
+        return None, 'type 只能是 income 或 expense'
+    if not is_iso_date(new_record['date']):
+        return None, '日期格式应为 YYYY-MM-DD'
+    return new_record, None
+
+@app.route('/add_record', methods=['POST'])
+@ledger_transaction
+def add_record():
+    _initialize_app_env()
+    new_record, error = _new_record(request.form)
+    if error:
+        flash(error, 'danger')
         return redirect(url_for('add_form') if is_mobile() else url_for('index'))
  
-    data['records'].append(new_record)
-    save_data(data)
+    ledger_store.commit(add=[new_record])
  
     session['last_used_date'] = new_record['date']
     
@@ -268,20 +474,16 @@ def add_record():
         return redirect(url_for('index', selected_date=new_record['date']))
 
 @app.route('/edit_record/<record_id>', methods=['GET', 'POST'])
+@ledger_transaction
 def edit_record(record_id):
-    data = load_data()
-    original_record = next((r for r in data['records'] if r['id'] == record_id), None)
+    original_record = ledger_store.get_record(record_id)
     if not original_record:
         flash('未找到该记录！', 'danger')
         return redirect(url_for('records'))
 
     # ✅ 获取该日该类别所有记录
-    same_category_records = [
-        r for r in data['records']
-        if r['date'] == original_record['date']
-        and r['type'] == original_record['type']
-        and r['category'] == original_record['category']
-    ]
+    same_category_records = ledger_store.group_records(
+        original_record['date'], original_record['type'], original_record['category'])
 
     # ✅ 计算合并后的金额和备注
     merged_amount = sum(r['amount'] for r in same_category_records)
@@ -292,40 +494,17 @@ def edit_record(record_id):
     )
 
     if request.method == 'POST':
-        try:
-            amount = float(request.form.get('amount'))
-        except:
-            flash('金额无效', 'danger')
+        # ✅ 按添加记录表单的规则校验，生成一条合并后的新记录
+        new_record, error = _new_record(request.form)
+        if error:
+            flash(error, 'danger')
             return redirect(url_for('edit_record', record_id=record_id))
 
-        category = request.form.get('category')
-        new_type = request.form.get('type')
-        new_date = request.form.get('date')
-        description = request.form.get('description', '').strip()
-
-        # ✅ 删除该日该类别所有记录
-        data['records'] = [
-            r for r in data['records'] if not (
-                r['date'] == original_record['date'] and
-                r['type'] == original_record['type'] and
-                r['category'] == original_record['category']
-            )
-        ]
-
-        # ✅ 新增一条合并后的记录
-        new_record = {
-            'id': str(uuid.uuid4()),
-            'type': new_type,
-            'category': category,
-            'amount': amount,
-            'description': description,
-            'date': new_date
-        }
-        data['records'].append(new_record)
-        save_data(data)
+        # ✅ 删除该日该类别所有记录，并写入合并后的记录
+        ledger_store.commit(remove=[r['id'] for r in same_category_records], add=[new_record])
 
         flash('记录已更新（已合并）', 'success')
-        return redirect(url_for('records', selected_date=new_date))
+        return redirect(url_for('records', selected_date=new_record['date']))
 
     # ✅ 传递给前端的记录是合并后的
     merged_record = {
@@ -341,28 +520,25 @@ def edit_record(record_id):
     return render_template(template_name, record=merged_record)
     
 @app.route('/delete_record/<record_id>', methods=['POST'])
+@ledger_transaction
 def delete_record(record_id):
-    data = load_data()
-    record = next((r for r in data['records'] if r['id'] == record_id), None)
+    record = ledger_store.get_record(record_id)
     if not record:
         flash('未找到该记录', 'danger')
         return redirect(url_for('records'))
 
     # ✅ 删除该日该类别所有记录
-    data['records'] = [r for r in data['records'] if not (
-        r['date'] == record['date'] and
-        r['type'] == record['type'] and
-        r['category'] == record['category']
-    )]
-    save_data(data)
+    group = ledger_store.group_records(record['date'], record['type'], record['category'])
+    ledger_store.commit(remove=[r['id'] for r in group])
     flash('已删除该类别所有记录', 'success')
     return redirect(url_for('records', selected_date=record['date']))
 
 @app.route('/records')
+@conditional_view
 def records():
-    data = load_data()
+    _initialize_app_env()
     selected_date_str = request.args.get('selected_date', date.today().isoformat())
-    records_for_day = [r for r in data['records'] if r['date'] == selected_date_str]
+    records_for_day = ledger_store.records_on(selected_date_str)
 
     # ✅ 合并逻辑：按 (type, category) 分组
     merged = defaultdict(lambda: {
@@ -397,8 +573,9 @@ def records():
 
     income_records = [r for r in merged_records if r['type'] == 'income']
     expense_records = [r for r in merged_records if r['type'] == 'expense']
-    daily_income_total = sum(r['amount'] for r in income_records)
-    daily_expense_total = sum(r['amount'] for r in expense_records)
+    daily_summary = ledger_store.period_summary(selected_date_str)
+    daily_income_total = type_total(daily_summary, 'income')
+    daily_expense_total = type_total(daily_summary, 'expense')
 
     template_name = 'mobile/records.html' if is_mobile() else 'records.html'
     return render_template(template_name,
@@ -410,8 +587,10 @@ def records():
                            daily_expense_total=daily_expense_total)
 
 @app.route('/settings', methods=['GET', 'POST'])
+@ledger_transaction
+@conditional_view
 def settings():
-    data = load_data()
+    data = ledger_store.meta()
     if request.method == 'POST':
         updated_budgets = {}
         for key, value in request.form.items():
@@ -421,8 +600,7 @@ def settings():
                     budget_amount = float(value) if value else 0.0
                     if budget_amount >= 0: updated_budgets[category_name] = budget_amount
                 except (ValueError, TypeError): pass
-        data['budgets'] = updated_budgets
-        save_data(data)
+        ledger_store.commit(budgets=updated_budgets)
         flash('预算已更新！', 'success')
         return redirect(url_for('settings'))
     
@@ -431,18 +609,19 @@ def settings():
     return render_template(template_name, 
                            categories=data['categories'], 
                            budgets=budgets,
-                           settings=data.get('settings', {})) # 传递settings
+                           settings=data.get('settings', {}), # 传递settings
+                           sync_peers=app.config['SYNC_PEERS'],
+                           sync_token_required=bool(app.config['SYNC_TOKEN']))
 
 @app.route('/toggle_keep_date', methods=['POST'])
+@ledger_transaction
 def toggle_keep_date():
     """【新增】处理日期记忆开关的切换"""
-    data = load_data()
+    data = ledger_store.meta()
     should_keep_date = 'keep_last_date' in request.form
     
-    if 'settings' not in data:
-        data['settings'] = {}
     data['settings']['keep_last_date'] = should_keep_date
-    save_data(data)
+    ledger_store.commit(settings=data['settings'])
     
     if should_keep_date:
         flash('已开启补录模式：日期将保持为您上次使用的日期。', 'success')
@@ -454,8 +633,9 @@ def toggle_keep_date():
     return redirect(url_for('settings'))
 
 @app.route('/add_category', methods=['POST'])
+@ledger_transaction
 def add_category():
-    data = load_data()
+    data = ledger_store.meta()
     category_type = request.form.get('type')
     new_category = request.form.get('new_category', '').strip()
     if not new_category or category_type not in ['expense', 'income']:
@@ -465,45 +645,52 @@ def add_category():
         flash(f"类别 '{new_category}' 已存在！", 'danger')
     else:
         data['categories'][category_type].append(new_category)
-        save_data(data)
+        ledger_store.commit(categories=data['categories'])
         flash(f"类别 '{new_category}' 添加成功！", 'success')
     return redirect(url_for('settings'))
 
 @app.route('/delete_category', methods=['POST'])
+@ledger_transaction
 def delete_category():
-    data = load_data()
+    data = ledger_store.meta()
     category_type = request.form.get('type')
     category_to_delete = request.form.get('category')
     if category_to_delete in data['categories'][category_type]:
         data['categories'][category_type].remove(category_to_delete)
         if category_to_delete in data.get('budgets', {}): del data['budgets'][category_to_delete]
-        save_data(data)
+        ledger_store.commit(categories=data['categories'], budgets=data['budgets'])
         flash(f"类别 '{category_to_delete}' 已删除。", 'success')
     else:
         flash('要删除的类别不存在！', 'danger')
     return redirect(url_for('settings'))
 
+def _annual_report_payload(year):
+    """年度合计、各月趋势和类别分布都来自按列批量计算的月度立方体，不再逐条扫描该年的记录"""
+    cube = ledger_store.monthly_cube()
+    expense_by_category = cube.category_totals(year, 'expense')
+    return {
+        'total_income': cube.total(year, 'income'),
+        'total_expense': cube.total(year, 'expense'),
+        'monthly_trends': cube.monthly_trends(year),
+        'top_expense_categories': sorted(expense_by_category.items(), key=lambda item: item[1], reverse=True),
+    }
+
 @app.route('/annual_report')
+@conditional_view
 def annual_report():
-    data = load_data()
-    all_records = data['records']
-    all_years = sorted(list(set(r['date'][:4] for r in all_records)), reverse=True)
+    _initialize_app_env()
+    all_years = ledger_store.years()
     current_year_str = str(datetime.now().year)
     selected_year = request.args.get('year', all_years[0] if all_years else current_year_str)
-    year_records = [r for r in all_records if r['date'].startswith(selected_year)]
-
-    total_income = sum(r['amount'] for r in year_records if r['type'] == 'income')
-    total_expense = sum(r['amount'] for r in year_records if r['type'] == 'expense')
-    expense_by_category = defaultdict(float)
-    monthly_trends = {f'{selected_year}-{m:02d}': {'income': 0, 'expense': 0} for m in range(1, 13)}
 
-    for r in year_records:
-        if r['date'][:7] in monthly_trends:
-            if r['type'] == 'income': monthly_trends[r['date'][:7]]['income'] += r['amount']
-            else:
-                monthly_trends[r['date'][:7]]['expense'] += r['amount']
-                expense_by_category[r['category']] += r['amount']
-    top_expense_cat = sorted(expense_by_category.items(), key=lambda item: item[1], reverse=True)
+    if not (selected_year.isdigit() and len(selected_year) == 4):
+        selected_year = all_years[0] if all_years else current_year_str
+    # 按年缓存，往年的数据很少变化，只有该年的记录被增删后才重新计算
+    report = ledger_store.report('annual_report', selected_year, lambda: _annual_report_payload(selected_year))
+    total_income = report['total_income']
+    total_expense = report['total_expense']
+    monthly_trends = report['monthly_trends']
+    top_expense_cat = report['top_expense_categories']
     ai_summary = "该年度无足够数据生成摘要。"
     if total_expense > 0:
         top_cat_name = top_expense_cat[0][0] if top_expense_cat else "未知"
@@ -518,35 +705,339 @@ def annual_report():
     template_name = 'mobile/annual_report.html' if is_mobile() else 'annual_report.html'
     return render_template(template_name, **render_params)
 
+@app.route('/api/report_cache')
+def report_cache_stats():
+    """报表缓存的命中/未命中次数，供监控使用"""
+    _initialize_app_env()
+    with ledger_store.lock:
+        return jsonify(ledger_store.reports.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 抓取端点：各路由的请求耗时分位数（按阶段拆分）和报表缓存命中情况"""
+    _initialize_app_env()
+    with ledger_store.lock:
+        report_cache = ledger_store.reports.stats()
+    return Response(request_metrics.prometheus(report_cache, startup), mimetype='text/plain; version=0.0.4')
+
+# --- 多年分析 API ---
+
+def _year_arg(default):
+    year = request.args.get('year', default)
+    return year if year.isdigit() and len(year) == 4 else None
+
+@app.route('/api/analytics/yoy')
+@conditional_view
+def analytics_year_over_year():
+    """某年与上一年的逐月收支对比: ?year=YYYY"""
+    _initialize_app_env()
+    year = _year_arg(str(datetime.now().year))
+    if year is None:
+        return jsonify({'error': 'year 应为 YYYY'}), 400
+    return jsonify(ledger_store.monthly_cube().year_over_year(year))
+
+@app.route('/api/analytics/rolling')
+@conditional_view
+def analytics_rolling():
+    """滚动收支合计: ?window=12&start=YYYY-MM&end=YYYY-MM"""
+    _initialize_app_env()
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    try:
+        window = int(request.args.get('window', 12))
+        for value in (start, end):
+            if value:
+                datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        return jsonify({'error': 'window 应为 1-120 的整数，start/end 应为 YYYY-MM'}), 400
+    if not 1 <= window <= 120:
+        return jsonify({'error': 'window 应为 1-120 的整数，start/end 应为 YYYY-MM'}), 400
+    return jsonify({'window': window, 'months': ledger_store.monthly_cube().rolling(window, start, end)})
+
+@app.route('/api/analytics/category_share')
+@conditional_view
+def analytics_category_share():
+    """每年各类别的占比: ?type=expense|income"""
+    _initialize_app_env()
+    record_type = request.args.get('type', 'expense')
+    if record_type not in ('income', 'expense'):
+        return jsonify({'error': 'type 只能是 income 或 expense'}), 400
+    return jsonify({'type': record_type, 'years': ledger_store.monthly_cube().category_share(record_type)})
+
+# --- 记录查询 API ---
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+API_RECORD_FIELDS = ['id', 'type', 'category', 'amount', 'description', 'date']
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    """游标是上一页最后一条记录的 [日期, id]，无法解析时抛出 ValueError"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (UnicodeError, ValueError, TypeError):
+        raise ValueError(cursor)
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(v, str) for v in key)):
+        raise ValueError(cursor)
+    return tuple(key)
+
+@app.route('/api/records')
+@conditional_view
+def api_records():
+    """分页查询记录: ?start=&end=(YYYY-MM-DD)&type=&category=&q=&limit=&order=desc|asc&cursor=
+
+    返回 {"fields": [...], "rows": [[...], ...], "next": 下一页游标或 null}，按日期排序，
+    把 next 作为 cursor 传回即可取下一页。
+    """
+    _initialize_app_env()
+    args = request.args
+    start = args.get('start') or None
+    end = args.get('end') or None
+    record_type = args.get('type') or None
+    order = args.get('order', 'desc')
+    try:
+        for value in (start, end):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+        limit = int(args.get('limit', API_PAGE_SIZE))
+        after = _decode_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': '参数无效：日期应为 YYYY-MM-DD，limit 应为整数，cursor 应为上一页返回的 next'}), 400
+    if record_type not in (None, 'income', 'expense'):
+        return jsonify({'error': 'type 只能是 income 或 expense'}), 400
+    if order not in ('desc', 'asc'):
+        return jsonify({'error': 'order 只能是 desc 或 asc'}), 400
+    if not 1 <= limit <= API_MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit 应在 1-{API_MAX_PAGE_SIZE} 之间'}), 400
+
+    records, next_key = ledger_store.query_page(
+        start=start, end=end, record_type=record_type, category=args.get('category') or None,
+        text=args.get('q') or None, after=after, limit=limit, descending=order == 'desc'
+    )
+    body = {
+        'fields': API_RECORD_FIELDS,
+        'rows': [[r[f] for f in API_RECORD_FIELDS] for r in records],
+        'next': _encode_cursor(next_key) if next_key else None,
+    }
+    # 字段名只出现一次、不缩进，翻页拉取历史时响应尽量小
+    return Response(json.dumps(body, ensure_ascii=False, separators=(',', ':')), mimetype='application/json')
+
+BATCH_MAX_RECORDS = 1000  # 一次批量添加的最大条数
+
+@app.route('/api/records/batch', methods=['POST'])
+@ledger_transaction
+def api_add_records():
+    """批量添加记录: 请求体是记录对象组成的 JSON 数组，字段与添加记录表单相同
+    （type、category、custom_category_input、amount、description、date）。
+
+    每条都按添加记录表单的规则校验，有效的记录在一次提交中全部写入，无效的跳过；
+    返回 {"added": 条数, "failed": 条数, "results": [{"index": 0, "id": ...} 或 {"index": 1, "error": ...}]}。
+    """
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        return jsonify({'error': '请求体应为记录对象组成的 JSON 数组'}), 400
+    if len(items) > BATCH_MAX_RECORDS:
+        return jsonify({'error': f'一次最多添加 {BATCH_MAX_RECORDS} 条记录'}), 413
+
+    new_records, results = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            record, error = None, '记录必须是 JSON 对象'
+        else:
+            record, error = _new_record(item, from_json=True)
+        if error:
+            results.append({'index': index, 'error': error})
+        else:
+            new_records.append(record)
+            results.append({'index': index, 'id': record['id']})
+
+    if new_records:
+        ledger_store.commit(add=new_records)
+        # 与逐条添加一致，记住最后一条的日期，供“保留上次日期”补录使用
+        session['last_used_date'] = new_records[-1]['date']
+    return jsonify({'added': len(new_records), 'failed': len(items) - len(new_records), 'results': results})
+
+# --- 实例之间的增量同步 ---
+
+def _sync_authorized():
+    """没有设置口令时放行；否则要求 "Authorization: Bearer <口令>"，设置页的表单用 sync_token 字段提交口令"""
+    token = app.config['SYNC_TOKEN']
+    if not token:
+        return True
+    if hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return not request.is_json and hmac.compare_digest(request.form.get('sync_token', ''), token)
+
+@app.route('/sync', methods=['GET', 'POST'])
+def sync_changes():
+    """增量同步协议（对端实例调用）。
+
+    GET ?since=<seq>&replica=<请求方的 replica>：返回本机 seq 大于 since 的变更
+    {"replica": 本机 replica, "latest": 最新 seq, "changes": [...], "next": 下一次的 since, "more": 是否还有}；
+    POST {"replica": ..., "changes": [...]}：按“最后修改者优先”合并对端推送的变更。
+    """
+    _initialize_app_env()
+    if not _sync_authorized():
+        return jsonify({'error': '同步口令无效'}), 401
+    if request.method == 'GET':
+        try:
+            since = int(request.args.get('since', 0))
+        except ValueError:
+            return jsonify({'error': 'since 应为整数'}), 400
+        changes, next_seq, more = ledger_sync.changes_since(since, exclude_origin=request.args.get('replica'))
+        body = {'replica': ledger_sync.log.replica, 'latest': ledger_sync.log.latest_seq(),
+                'changes': changes, 'next': next_seq, 'more': more}
+        return Response(json.dumps(body, ensure_ascii=False, separators=(',', ':')), mimetype='application/json')
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('changes'), list):
+        return jsonify({'error': '请求体应为 {"replica": ..., "changes": [...]}'}), 400
+    result = ledger_sync.apply(payload['changes'])
+    logging.info(f"DIAGNOSTIC: Sync push from '{payload.get('replica')}': applied {result['applied']}, "
+                 f"skipped {result['skipped']}, rejected {len(result['errors'])}.")
+    return jsonify(result)
+
+@app.route('/sync/peer', methods=['POST'])
+def sync_with_peer():
+    """与另一个实例（如 Docker 服务器）双向同步：表单字段 peer_url，或 JSON {"url": ...}。
+
+    需要与 /sync 相同的口令，且对端必须在 SYNC_PEERS 中：口令只发送给配置好的对端地址。
+    """
+    def fail(error, status):
+        if request.is_json:
+            return jsonify({'error': error}), status
+        flash(error, 'danger')
+        return redirect(url_for('settings'))
+
+    _initialize_app_env()
+    if not _sync_authorized():
+        return fail('同步口令不正确', 401)
+    payload = request.get_json(silent=True) if request.is_json else request.form
+    url = ((payload or {}).get('url') or (payload or {}).get('peer_url') or '')
+    url = url.strip().rstrip('/') if isinstance(url, str) else ''
+    peers = app.config['SYNC_PEERS']
+    if not peers:
+        return fail('没有配置可同步的对端，请通过环境变量 SYNC_PEERS 设置对端地址', 403)
+    if url not in peers:
+        return fail(f"对端地址不在 SYNC_PEERS 中，可选：{', '.join(peers)}", 403)
+    try:
+        result = ledger_sync.sync_with(url, app.config['SYNC_TOKEN'])
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"DIAGNOSTIC: Sync with '{url}' failed: {e}")
+        return fail(f'同步失败：{e}', 502)
+    if request.is_json:
+        return jsonify(result)
+    flash(f"同步完成：收到 {result['pulled']} 条变更（合并 {result['applied']} 条），发送 {result['pushed']} 条。", 'success')
+    return redirect(url_for('settings'))
+
+SEARCH_PAGE_SIZE = 20
+
+@app.route('/api/search')
+def api_search():
+    """全文检索备注和类别: ?q=&type=&category=&start=&end=(YYYY-MM-DD)&offset=&limit=
+
+    q 中的每个词都需命中：连续的中文按相邻两字匹配，单个汉字和英文/数字词按子串匹配
+    （"port" 可以找到 "airport"）。结果按相关度排序，
+    返回 {"total": 命中总数, "took_ms": 检索耗时, "fields": [...], "rows": [...]}，
+    rows 的最后一列为得分；offset 加上 limit 即为下一页。
+    """
+    _initialize_app_env()
+    args = request.args
+    query = (args.get('q') or '').strip()
+    start = args.get('start') or None
+    end = args.get('end') or None
+    record_type = args.get('type') or None
+    if not query:
+        return jsonify({'error': '缺少检索词 q'}), 400
+    try:
+        for value in (start, end):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+        offset = int(args.get('offset', 0))
+        limit = int(args.get('limit', SEARCH_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': '参数无效：日期应为 YYYY-MM-DD，offset 和 limit 应为整数'}), 400
+    if record_type not in (None, 'income', 'expense'):
+        return jsonify({'error': 'type 只能是 income 或 expense'}), 400
+    if offset < 0 or not 1 <= limit <= API_MAX_PAGE_SIZE:
+        return jsonify({'error': f'offset 不能为负数，limit 应在 1-{API_MAX_PAGE_SIZE} 之间'}), 400
+
+    started = time.perf_counter()
+    hits, total = ledger_store.search(query, record_type=record_type, category=args.get('category') or None,
+                                      start=start, end=end, offset=offset, limit=limit)
+    body = {
+        'query': query,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+        'fields': API_RECORD_FIELDS + ['score'],
+        'rows': [[r[f] for f in API_RECORD_FIELDS] + [score] for r, score in hits],
+    }
+    return Response(json.dumps(body, ensure_ascii=False, separators=(',', ':')), mimetype='application/json')
+
+CSV_HEADER = ['ID', '类型', '类别', '金额', '备注', '日期']
+CSV_CHUNK_ROWS = 500  # 每攒够这么多行就向客户端发送一次
+
+def _iter_csv(records):
+    """逐块生成 CSV 文本，内存占用与账本大小无关"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff') # BOM for Excel
+    writer.writerow(CSV_HEADER)
+    for i, r in enumerate(records, 1):
+        writer.writerow([r.get('id', ''), '收入' if r.get('type') == 'income' else '支出', r.get('category', ''), r.get('amount', 0), r.get('description', ''), r.get('date', '')])
+        if i % CSV_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
 @app.route('/export_csv')
+@conditional_view
 def export_csv():
-    data = load_data()
-    records = data.get('records', [])
-    output = io.StringIO()
-    output.write('\ufeff') # BOM for Excel
-    writer = csv.writer(output)
-    writer.writerow(['ID', '类型', '类别', '金额', '备注', '日期'])
-    for r in records:
-        writer.writerow([r.get('id', ''), '收入' if r.get('type') == 'income' else '支出', r.get('category', ''), r.get('amount', 0), r.get('description', ''), r.get('date', '')])
-    output.seek(0)
+    """导出 CSV，可选参数: start / end (YYYY-MM-DD，含两端)、type (income/expense)、category"""
+    _initialize_app_env()
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    record_type = request.args.get('type') or None
+    category = request.args.get('category') or None
+    try:
+        for value in (start, end):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        flash('导出失败：日期格式应为 YYYY-MM-DD。', 'danger')
+        return redirect(url_for('settings'))
+    if record_type not in (None, 'income', 'expense'):
+        flash('导出失败：类型只能是 income 或 expense。', 'danger')
+        return redirect(url_for('settings'))
+
+    records = ledger_store.iter_records(start=start, end=end, record_type=record_type, category=category)
     return Response(
-        output.getvalue(),
+        _iter_csv(records),
         mimetype="text/csv; charset=utf-8",
         headers={"Content-Disposition": f"attachment;filename=records_{datetime.now().strftime('%Y%m%d')}.csv"}
     )
 @app.route('/export_json')
+@conditional_view
 def export_json():
-    if not os.path.exists(DATA_FILE):
-        flash('数据文件不存在，无法导出。', 'danger')
-        return redirect(url_for('settings'))
-    return send_from_directory(
-        directory=DATA_DIR, 
-        path=os.path.basename(DATA_FILE), 
-        as_attachment=True,
-        download_name='sunshine_accounting_backup.json'
+    # 磁盘上的快照可能尚未合并日志（或使用的是 SQLite 后端），因此直接从存储后端逐条流式生成单文件备份
+    _initialize_app_env()
+    return Response(
+        iter_ledger_json_text(ledger_store.meta(), ledger_store.iter_records()),
+        mimetype="application/json; charset=utf-8",
+        headers={"Content-Disposition": "attachment;filename=sunshine_accounting_backup.json"}
     )
+
+JSON_IMPORT_BATCH_RECORDS = 1000  # 流式导入时每批解析、校验并写入的记录数
+
 @app.route('/import_json', methods=['POST'])
+@ledger_transaction
 def import_json():
+    """导入 JSON 备份：replace 覆盖全部数据（默认），merge 只追加新的记录"""
     if 'json_file' not in request.files:
         flash('没有文件被上传。', 'danger')
         return redirect(url_for('settings'))
@@ -554,15 +1045,20 @@ def import_json():
     if file.filename == '':
         flash('未选择任何文件。', 'danger')
         return redirect(url_for('settings'))
+    mode = request.form.get('mode', 'replace')
+    if mode not in ('replace', 'merge'):
+        flash('导入失败：未知的导入模式。', 'danger')
+        return redirect(url_for('settings'))
     if file and file.filename.endswith('.json'):
         try:
-            file_content = file.stream.read().decode('utf-8')
-            new_data = json.loads(file_content)
-            if 'records' in new_data and 'categories' in new_data and 'budgets' in new_data:
-                save_data(new_data)
-                flash('数据导入成功！您的所有数据已被更新。', 'success')
+            events = iter_ledger_json(file.stream, batch_size=JSON_IMPORT_BATCH_RECORDS)
+            imported, skipped = ledger_store.import_batches(events, mode=mode)
+            if mode == 'replace':
+                flash(f'数据导入成功！您的所有数据已被更新（共 {imported} 条记录）。', 'success')
             else:
-                flash('导入失败：JSON文件结构不正确，缺少必要的键 (records, categories, budgets)。', 'danger')
+                flash(f'合并导入完成：新增 {imported} 条记录，跳过已存在的 {skipped} 条。', 'success')
+        except LedgerFormatError as e:
+            flash(f'导入失败：{e}', 'danger')
         except (json.JSONDecodeError, UnicodeDecodeError):
             flash('导入失败：文件不是有效的UTF-8编码JSON文件。', 'danger')
         except Exception as e:
@@ -570,9 +1066,133 @@ def import_json():
     else:
         flash('导入失败：请上传一个 .json 文件。', 'danger')
     return redirect(url_for('settings'))
+
+CSV_TYPE_LABELS = {'收入': 'income', '支出': 'expense', 'income': 'income', 'expense': 'expense'}
+CSV_IMPORT_BATCH_ROWS = 1000  # 每批校验的行数（批量查询已存在的 ID）
+CSV_IMPORT_MAX_REPORTED_ERRORS = 10
+
+def _parse_csv_row(row):
+    """把 export_csv() 格式的一行转换为记录，格式不对时抛出 ValueError"""
+    if len(row) != len(CSV_HEADER):
+        raise ValueError(f'应有 {len(CSV_HEADER)} 列，实际 {len(row)} 列')
+    record_id, type_label, category, amount, description, date_str = (v.strip() for v in row)
+    record_type = CSV_TYPE_LABELS.get(type_label)
+    if record_type is None:
+        raise ValueError(f"未知的类型 '{type_label}'")
+    if not category:
+        raise ValueError('类别为空')
+    try:
+        amount_value = float(amount)
+    except ValueError:
+        raise ValueError(f"金额 '{amount}' 不是有效的数字")
+    if not amount_value > 0:
+        raise ValueError('金额必须大于 0')
+    # float() 接受 'inf' 和 '1e309' 这样的输入
+    if not math.isfinite(amount_value) or amount_value > MAX_RECORD_AMOUNT:
+        raise ValueError(f"金额 '{amount}' 超出有效范围")
+    if not is_whole_cents(amount_value):
+        raise ValueError(f"金额 '{amount}' 最多保留两位小数")
+    if not is_iso_date(date_str):
+        raise ValueError(f"日期 '{date_str}' 格式应为 YYYY-MM-DD")
+    return {
+        'id': record_id or str(uuid.uuid4()),
+        'type': record_type,
+        'category': category,
+        'amount': amount_value,
+        'description': description,
+        'date': date_str
+    }
+
+def import_csv_records(stream):
+    """流式解析并分批校验 CSV，返回 (新记录, 跳过的重复条数, 错误列表)；不写入账本"""
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = next(reader, None)
+    if header is None or [h.strip() for h in header] != CSV_HEADER:
+        raise ValueError(f"表头应为: {','.join(CSV_HEADER)}")
+
+    new_records, errors = [], []
+    seen_ids = set()
+    duplicates = 0
+    batch = []
+
+    def flush_batch():
+        nonlocal duplicates
+        existing = ledger_store.existing_ids([r['id'] for r in batch])
+        for record in batch:
+            if record['id'] in existing or record['id'] in seen_ids:
+                duplicates += 1
+                continue
+            seen_ids.add(record['id'])
+            new_records.append(record)
+        batch.clear()
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            batch.append(_parse_csv_row(row))
+        except ValueError as e:
+            errors.append(f'第 {reader.line_num} 行: {e}')
+        if len(batch) >= CSV_IMPORT_BATCH_ROWS:
+            flush_batch()
+    flush_batch()
+    return new_records, duplicates, errors
+
+@app.route('/import_csv', methods=['POST'])
+@ledger_transaction
+def import_csv():
+    """批量导入 export_csv() 格式的 CSV：按 ID 去重追加，所有有效行一次性提交"""
+    file = request.files.get('csv_file')
+    if file is None or file.filename == '':
+        flash('未选择任何文件。', 'danger')
+        return redirect(url_for('settings'))
+    if not file.filename.lower().endswith('.csv'):
+        flash('导入失败：请上传一个 .csv 文件。', 'danger')
+        return redirect(url_for('settings'))
+    try:
+        new_records, duplicates, errors = import_csv_records(file.stream)
+    except UnicodeDecodeError:
+        flash('导入失败：文件不是有效的UTF-8编码CSV文件。', 'danger')
+        return redirect(url_for('settings'))
+    except (ValueError, csv.Error) as e:
+        flash(f'导入失败：{e}', 'danger')
+        return redirect(url_for('settings'))
+
+    if new_records:
+        # 未出现过的类别一并加入类别列表，方便之后在表单中选择
+        categories = ledger_store.meta()['categories']
+        for record in new_records:
+            if record['category'] not in categories[record['type']]:
+                categories[record['type']].append(record['category'])
+        ledger_store.commit(add=new_records, categories=categories)
+
+    logging.info(f"DIAGNOSTIC: CSV import added {len(new_records)} records, skipped {duplicates} duplicates, {len(errors)} invalid rows.")
+    flash(f'CSV 导入完成：新增 {len(new_records)} 条，跳过重复 {duplicates} 条，无效 {len(errors)} 行。',
+          'danger' if errors and not new_records else 'success')
+    for error in errors[:CSV_IMPORT_MAX_REPORTED_ERRORS]:
+        flash(error, 'danger')
+    if len(errors) > CSV_IMPORT_MAX_REPORTED_ERRORS:
+        flash(f'……另有 {len(errors) - CSV_IMPORT_MAX_REPORTED_ERRORS} 行错误未显示。', 'danger')
+    return redirect(url_for('settings'))
+LOG_LEVELS = ('INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+def _log_level_arg():
+    level = request.args.get('level', '').upper()
+    return (level, logging.getLevelName(level)) if level in LOG_LEVELS else ('', logging.NOTSET)
+
 @app.route('/debuglog')
 def debug_log():
+    """日志查看页面；带 since=<序号> 时只以 JSON 返回该序号之后的新日志，供页面增量刷新"""
     _initialize_app_env()
+    level_name, level = _log_level_arg()
+    if 'since' in request.args:
+        try:
+            since = int(request.args['since'])
+        except ValueError:
+            return jsonify({'error': 'since 必须是整数'}), 400
+        entries, last_seq = log_buffer.entries(since, level)
+        return jsonify({'entries': [entry.to_dict() for entry in entries], 'last_seq': last_seq})
+
     html_head = '''
     <head>
         <title>App Debug Log</title>
@@ -580,7 +1200,7 @@ def debug_log():
         <style>
             body { background: #1a1a1a; color: #dcdcdc; font-family: Consolas, Monaco, monospace; line-height: 1.6; padding: 2em; margin: 0; }
             .controls { position: fixed; top: 10px; right: 15px; background: #333; padding: 10px; border-radius: 5px; box-shadow: 0 2px 5px rgba(0,0,0,0.5); z-index: 10; }
-            .controls button { background: #555; color: white; border: none; padding: 8px 12px; margin-left: 10px; cursor: pointer; border-radius: 3px; }
+            .controls button, .controls select { background: #555; color: white; border: none; padding: 8px 12px; margin-left: 10px; cursor: pointer; border-radius: 3px; }
             .controls button:hover { background: #666; }
             h1 { color: #87ceeb; margin-top: 50px; }
             pre { white-space: pre-wrap; word-wrap: break-word; }
@@ -589,24 +1209,28 @@ def debug_log():
             .ERROR { color: #ff6b6b; font-weight: bold; }
             .CRITICAL { color: #ff4757; font-weight: bold; background: #570000; display: block; padding: 2px 5px; }
             .DIAGNOSTIC { color: #87ceeb; }
+            table.timing { border-collapse: collapse; margin-bottom: 1em; }
+            table.timing th, table.timing td { border: 1px solid #444; padding: 2px 8px; text-align: right; }
+            table.timing th:first-child, table.timing td:first-child { text-align: left; }
         </style>
     </head>
     '''
-    log_contents = log_capture_string.getvalue()
-    colored = []
-    for line in log_contents.splitlines():
-        escaped = escape(line)
-        if " | ERROR " in escaped:
-            colored.append(f'<span class="ERROR">{escaped}</span>')
-        elif " | WARNING " in escaped:
-            colored.append(f'<span class="WARNING">{escaped}</span>')
-        elif " | CRITICAL" in escaped:
-            colored.append(f'<span class="CRITICAL">{escaped}</span>')
-        elif "DIAGNOSTIC:" in escaped:
-            colored.append(f'<span class="DIAGNOSTIC">{escaped}</span>')
-        else:
-            colored.append(f'<span class="INFO">{escaped}</span>')
-    colored_logs = "<br>".join(colored)
+    entries, last_seq = log_buffer.entries(0, level)
+    colored_logs = "".join(f'<span class="{entry.css_class}">{entry.html}</span>\n' for entry in entries)
+    level_options = "".join(
+        f'<option value="{name}"{" selected" if name == level_name else ""}>{name or "全部级别"}</option>'
+        for name in ('',) + LOG_LEVELS)
+    timing_rows = []
+    for route, count, mean, quantiles in request_metrics.summary():
+        cells = [escape(route), str(count), f'{mean * 1000:.1f}']
+        cells += [f"{quantiles['total'][q] * 1000:.1f}" for q in QUANTILES]
+        cells += [f"{quantiles[phase][0.5] * 1000:.1f}" for phase in PHASES]
+        timing_rows.append('<tr>' + ''.join(f'<td>{cell}</td>' for cell in cells) + '</tr>')
+    timing_header = ''.join(f'<th>{name}</th>' for name in
+                            ['路由', '次数', '平均'] + [f'p{int(q * 100)}' for q in QUANTILES] +
+                            [f'{phase} p50' for phase in PHASES])
+    timing_table = (f'<table class="timing"><tr>{timing_header}</tr>{"".join(timing_rows)}</table>'
+                    if timing_rows else '<p>暂无请求统计。</p>')
     return f"""
     <html>{html_head}
     <body>
@@ -614,30 +1238,92 @@ def debug_log():
             <form method="POST" action="/debuglog/clear" style="display:inline;">
                 <button type="submit">清空日志</button>
             </form>
-            <button onclick="location.reload()">刷新</button>
+            <select onchange="location.search = this.value ? '?level=' + this.value : ''">{level_options}</select>
+            <button onclick="fetchNewLogs()">刷新</button>
         </div>
+        <h1>请求耗时 (毫秒，最近 {WINDOW} 次请求)</h1>
+        {timing_table}
         <h1>应用后端实时日志</h1>
-        <pre>{colored_logs}</pre>
-        <script>window.scrollTo(0, document.body.scrollHeight);</script>
+        <pre id="log">{colored_logs}</pre>
+        <script>
+            var lastSeq = {last_seq};
+            var level = {json.dumps(level_name)};
+            function fetchNewLogs() {{
+                fetch('/debuglog?since=' + lastSeq + (level ? '&level=' + level : ''))
+                    .then(function (r) {{ return r.json(); }})
+                    .then(function (data) {{
+                        var log = document.getElementById('log');
+                        data.entries.forEach(function (entry) {{
+                            var span = document.createElement('span');
+                            span.className = entry['class'];
+                            span.textContent = entry.text + '\\n';
+                            log.appendChild(span);
+                        }});
+                        lastSeq = data.last_seq;
+                        if (data.entries.length) window.scrollTo(0, document.body.scrollHeight);
+                    }});
+            }}
+            window.scrollTo(0, document.body.scrollHeight);
+        </script>
     </body>
     </html>
     """
+
 @app.route('/debuglog/clear', methods=['POST'])
 def clear_debug_log():
     _initialize_app_env()
-    log_capture_string.truncate(0)
-    log_capture_string.seek(0)
+    log_buffer.clear()
     logging.info("DIAGNOSTIC: Log has been manually cleared by user.")
     return redirect(url_for('debug_log'))
 
+def _env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def warm_up():
+    """后台预热：回放变更日志并加载账本、构建汇总索引，预编译全部模板，
+    让第一个请求不再承担这些开销。预热期间到达的请求会等待账本锁，不会读到不完整的数据。"""
+    try:
+        _initialize_app_env()
+        with startup.phase('ledger'):
+            ledger_store.recover()
+            ledger_sync.recover()
+            ledger_store.years()
+            ledger_store.monthly_cube()
+        with startup.phase('templates'):
+            for name in app.jinja_env.list_templates(extensions=['html']):
+                app.jinja_env.get_template(name)
+        startup.mark('warm')
+    except Exception as e:
+        logging.error(f"DIAGNOSTIC: Warm-up failed: {e}", exc_info=True)
+        return
+    logging.info(f"DIAGNOSTIC: Startup timing: {startup.summary()}")
+    ready_ms = startup.milestones.get('ready', 0) * 1000
+    if ready_ms > STARTUP_TARGET_MS:
+        logging.warning(f"DIAGNOSTIC: Cold start took {ready_ms:.0f}ms, over the {STARTUP_TARGET_MS}ms target.")
+
+def start_background_warmup():
+    """服务已可以接受请求时调用：记下就绪时间，并在后台线程中预热"""
+    startup.mark('ready')
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
 def start_server():
+    """Android 前台服务调用的入口：多线程 WSGI 服务器，不启用调试器和自动重载"""
     try:
+        _initialize_app_env()
         logging.info("=" * 20 + " Sunshine Accounting 服务器启动 (Android) " + "=" * 20)
-        app.run(host='0.0.0.0', port=5001, debug=False)
+        server = make_server('0.0.0.0', 5001, app, threaded=True)
+        start_background_warmup()
+        server.serve_forever()
     except Exception as e:
         logging.critical(f"FATAL: Flask server failed to start: {e}", exc_info=True)
- 
-if __name__ == '__main__':
-    logging.info("=" * 20 + " Sunshine Accounting 应用启动 (Local/Docker) " + "=" * 20)
-    app.run(host='0.0.0.0', port=5001, debug=True)
 
+if __name__ == '__main__':
+    # 本地开发用的 Werkzeug 服务器；生产环境（Docker）请使用 gunicorn 加载 wsgi:app
+    _initialize_app_env()
+    logging.info("=" * 20 + " Sunshine Accounting 应用启动 (Local) " + "=" * 20)
+    start_background_warmup()
+    app.run(host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5001)),
+            debug=_env_flag('FLASK_DEBUG'))
@@ -0,0 +1,261 @@
+# 文件: assets.py (静态资源：构建时下载第三方库、压缩、按内容指纹命名并预压缩；运行时按指纹发送，动态响应 gzip 压缩)
+# 构建: python assets.py [--refresh] [--no-fetch]
+# 构建结果写入 static/dist/（manifest.json + 带哈希的文件及其 .gz / .br），没有构建过时按原文件名发送。
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import sys
+import tempfile
+import urllib.request
+
+from flask import redirect, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # 只有构建时才需要；没有安装时只生成 .gz
+    brotli = None
+try:
+    import rjsmin
+except ImportError:  # 没有安装时 JS 只做指纹和预压缩，不做精简
+    rjsmin = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIRNAME = 'dist'
+MANIFEST_FILENAME = 'manifest.json'
+SOURCE_DIRS = ('css', 'js', 'vendor')
+# 第三方库固定版本，构建时下载到 static/vendor/；尚未下载时运行期重定向到 CDN 上的同一文件
+VENDOR_ASSETS = {
+    'vendor/chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+    'vendor/sweetalert2.all.min.js': 'https://cdn.jsdelivr.net/npm/sweetalert2@11.10.5/dist/sweetalert2.all.min.js',
+    'vendor/sweetalert2.min.css': 'https://cdn.jsdelivr.net/npm/sweetalert2@11.10.5/dist/sweetalert2.min.css',
+}
+HASH_LENGTH = 10
+# 带指纹的文件内容永不改变，浏览器可以缓存一年且不必再验证
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 动态响应的 gzip 压缩：只压缩 HTML / JSON，太小的响应压缩后省不了多少
+COMPRESSIBLE_MIMETYPES = ('text/html', 'application/json')
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def minify_css(text):
+    """去掉注释（保留 /*! 开头的版权注释）和多余的空白；字符串原样保留"""
+    out = []
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if c in '"\'':
+            end = i + 1
+            while end < n and text[end] != c:
+                end += 2 if text[end] == '\\' else 1
+            out.append(text[i:end + 1])
+            i = end + 1
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            if text.startswith('/*!', i):
+                out.append(text[i:end])
+            i = end
+        elif c.isspace():
+            while i < n and text[i].isspace():
+                i += 1
+            # 选择器里的空格（后代选择器、a :hover）有意义，只去掉这些符号两侧的空白
+            prev = out[-1][-1:] if out else ''
+            if prev and prev not in '{};,>:' and (i >= n or text[i] not in '{};,>'):
+                out.append(' ')
+        else:
+            if c == '}' and out and out[-1] == ';':
+                out.pop()
+            out.append(c)
+            i += 1
+    return ''.join(out).strip()
+
+
+def _minify(name, data):
+    if name.startswith('vendor/'):  # 第三方库本身已是发布版本，原样使用
+        return data
+    if name.endswith('.css'):
+        return minify_css(data.decode('utf-8')).encode('utf-8')
+    if name.endswith('.js') and rjsmin is not None:
+        return rjsmin.jsmin(data.decode('utf-8')).encode('utf-8')
+    return data
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _precompress(path, data):
+    """写出 .gz（以及安装了 brotli 时的 .br）；压缩后没有变小的变体不写"""
+    variants = [('.gz', gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            _write(path + suffix, compressed)
+
+
+def fetch_vendor(static_dir=STATIC_DIR, refresh=False):
+    """下载 VENDOR_ASSETS 中尚未下载的文件；下载失败时保留原状，运行期会重定向到 CDN"""
+    for name, url in VENDOR_ASSETS.items():
+        path = os.path.join(static_dir, name)
+        if os.path.exists(path) and not refresh:
+            continue
+        try:
+            with urllib.request.urlopen(url, timeout=60) as response:
+                data = response.read()
+        except OSError as e:
+            logging.warning(f"DIAGNOSTIC: Could not download '{url}': {e}")
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        logging.info(f"DIAGNOSTIC: Vendored '{url}' as '{name}' ({len(data)} bytes).")
+
+
+def build(static_dir=STATIC_DIR):
+    """把 css/、js/、vendor/ 下的文件精简后按内容哈希命名写入 dist/，并生成预压缩变体和 manifest.json"""
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    manifest = {}
+    for source_dir in SOURCE_DIRS:
+        root_dir = os.path.join(static_dir, source_dir)
+        if not os.path.isdir(root_dir):
+            continue
+        for root, _, files in os.walk(root_dir):
+            for filename in sorted(files):
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, static_dir).replace(os.sep, '/')
+                if not name.endswith(('.css', '.js')):
+                    continue
+                with open(path, 'rb') as f:
+                    source = f.read()
+                data = _minify(name, source)
+                stem, ext = os.path.splitext(name)
+                hashed = f'{stem}.{_digest(data)[:HASH_LENGTH]}{ext}'
+                target = os.path.join(dist_dir, hashed)
+                _write(target, data)
+                _precompress(target, data)
+                manifest[name] = {'file': hashed, 'source': _digest(source)}
+    _write(os.path.join(dist_dir, MANIFEST_FILENAME),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+class StaticAssets:
+    """运行期的静态资源映射：url_for('static', filename=...) 生成带指纹的地址，发送时按 Accept-Encoding 选预压缩变体"""
+
+    def __init__(self, static_dir=STATIC_DIR):
+        self.static_dir = static_dir
+        self.dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+        self.files = self._load_manifest()
+        self.version = _digest(json.dumps(self.files, sort_keys=True).encode('utf-8'))[:8]
+
+    def _load_manifest(self):
+        """{原文件名: 带指纹的文件名}；构建后又改过的源文件不使用旧的构建结果"""
+        try:
+            with open(os.path.join(self.dist_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"DIAGNOSTIC: Ignoring unreadable asset manifest: {e}")
+            return {}
+        files = {}
+        for name, entry in manifest.items():
+            try:
+                with open(os.path.join(self.static_dir, name), 'rb') as f:
+                    fresh = _digest(f.read()) == entry['source']
+            except OSError:
+                fresh = False
+            if fresh and os.path.exists(os.path.join(self.dist_dir, entry['file'])):
+                files[name] = entry['file']
+            else:
+                logging.warning(f"DIAGNOSTIC: Built asset for '{name}' is stale, serving the source file.")
+        return files
+
+    def url_defaults(self, endpoint, values):
+        """注册为 app.url_defaults：把 static 路由的文件名换成 dist/ 下带指纹的文件名"""
+        if endpoint == 'static':
+            hashed = self.files.get(values.get('filename'))
+            if hashed is not None:
+                values['filename'] = f'{DIST_DIRNAME}/{hashed}'
+
+    def send(self, filename):
+        """static 路由的视图函数"""
+        if filename.startswith(DIST_DIRNAME + '/'):
+            return self._send_fingerprinted(filename[len(DIST_DIRNAME) + 1:])
+        if filename in VENDOR_ASSETS and not os.path.exists(os.path.join(self.static_dir, filename)):
+            return redirect(VENDOR_ASSETS[filename])
+        return send_from_directory(self.static_dir, filename)
+
+    def _send_fingerprinted(self, filename):
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for suffix, encoding in (('.br', 'br'), ('.gz', 'gzip')):
+            if request.accept_encodings[encoding] and os.path.exists(os.path.join(self.dist_dir, filename + suffix)):
+                response = send_from_directory(self.dist_dir, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.dist_dir, filename, mimetype=mimetype)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def compress_response(response):
+    """注册为 app.after_request：客户端支持 gzip 时压缩 HTML / JSON 响应。
+    压缩后的内容与原内容不同，强 ETag 改为弱 ETag（与 nginx 的 gzip 一致），条件请求按弱比较匹配。"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, COMPRESS_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='构建静态资源：下载第三方库，精简、加指纹并预压缩')
+    parser.add_argument('--refresh', action='store_true', help='重新下载已经存在的第三方库')
+    parser.add_argument('--no-fetch', action='store_true', help='不下载第三方库，只使用已有的文件')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-8s | %(message)s')
+    if not args.no_fetch:
+        fetch_vendor(refresh=args.refresh)
+    manifest = build()
+    dist_dir = os.path.join(STATIC_DIR, DIST_DIRNAME)
+    for name, entry in sorted(manifest.items()):
+        path = os.path.join(dist_dir, entry['file'])
+        sizes = [os.path.getsize(os.path.join(STATIC_DIR, name)), os.path.getsize(path)]
+        sizes += [os.path.getsize(path + s) for s in ('.gz', '.br') if os.path.exists(path + s)]
+        print(f"{name} -> {DIST_DIRNAME}/{entry['file']}  " + ' / '.join(str(s) for s in sizes))
+    missing = [name for name in VENDOR_ASSETS if name not in manifest]
+    if missing:
+        print(f"not vendored (served from CDN): {', '.join(missing)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,13 @@
+# 文件: gunicorn.conf.py (Docker 镜像中的生产服务器配置，均可通过环境变量覆盖)
+import os
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5001')}"
+# 多个 worker 进程之间通过数据目录中的 .lock 文件互斥访问账本
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+# 大文件导入/导出可能较慢
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
@@ -0,0 +1,217 @@
+# 文件: jsonstream.py (账本 JSON 的流式读写)
+import codecs
+import json
+import math
+import textwrap
+from collections.abc import Mapping
+from datetime import date
+
+from records import is_whole_cents
+
+READ_CHUNK_SIZE = 64 * 1024
+REQUIRED_SECTIONS = ('records', 'categories', 'budgets')
+RECORD_TYPES = ('income', 'expense')
+
+_WHITESPACE = ' \t\n\r'
+
+
+class LedgerFormatError(ValueError):
+    """上传的 JSON 结构不是本应用的账本格式"""
+
+
+def is_iso_date(text):
+    """是否为规范的 'YYYY-MM-DD' 日期字符串"""
+    try:
+        return date.fromisoformat(text).isoformat() == text
+    except (TypeError, ValueError):
+        return False
+
+
+def validate_record(record, index):
+    """检查单条记录的结构，返回补齐默认值后的记录（普通字典）；也接受 records.Record"""
+    if not isinstance(record, Mapping):
+        raise LedgerFormatError(f'第 {index + 1} 条记录不是对象')
+    for key in ('id', 'type', 'category', 'date'):
+        if not isinstance(record.get(key), str) or not record[key]:
+            raise LedgerFormatError(f"第 {index + 1} 条记录缺少有效的 '{key}' 字段")
+    if record['type'] not in RECORD_TYPES:
+        raise LedgerFormatError(f"第 {index + 1} 条记录的类型 '{record['type']}' 无效")
+    if not is_iso_date(record['date']):
+        raise LedgerFormatError(f"第 {index + 1} 条记录的日期 '{record['date']}' 不是 YYYY-MM-DD 格式")
+    amount = record.get('amount')
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount):
+        raise LedgerFormatError(f"第 {index + 1} 条记录的金额无效")
+    # 金额以“分”存储，不足一分或超过两位小数的部分会被悄悄舍去
+    if amount < 0.01 or not is_whole_cents(amount):
+        raise LedgerFormatError(f"第 {index + 1} 条记录的金额 {amount} 应不小于 0.01 且最多两位小数")
+    description = record.get('description') or ''
+    if not isinstance(description, str):
+        raise LedgerFormatError(f"第 {index + 1} 条记录的备注无效")
+    return {
+        'id': record['id'], 'type': record['type'], 'category': record['category'],
+        'amount': float(amount), 'description': description, 'date': record['date'],
+    }
+
+
+def validate_meta(section, value):
+    """检查类别、预算或设置的结构，返回规范化后的副本：
+    categories 必须同时有 expense 和 income 两个类别名列表，budgets 是 类别 → 非负金额，
+    settings 的 keep_last_date 必须是布尔值"""
+    if not isinstance(value, dict):
+        raise LedgerFormatError(f"'{section}' 必须是对象")
+    if section == 'categories':
+        if set(value) != set(RECORD_TYPES):
+            raise LedgerFormatError("'categories' 应当只有 expense 和 income 两个列表")
+        for names in value.values():
+            if not isinstance(names, list) or not all(isinstance(n, str) and n for n in names):
+                raise LedgerFormatError("'categories' 中的类别名必须是非空字符串")
+        return {record_type: list(names) for record_type, names in value.items()}
+    if section == 'budgets':
+        for category, amount in value.items():
+            if isinstance(amount, bool) or not isinstance(amount, (int, float)) \
+                    or not math.isfinite(amount) or amount < 0:
+                raise LedgerFormatError(f"类别 '{category}' 的预算无效")
+        return {category: float(amount) for category, amount in value.items()}
+    if section == 'settings':
+        if not isinstance(value.get('keep_last_date', False), bool):
+            raise LedgerFormatError("'settings' 中的 keep_last_date 必须是布尔值")
+        return dict(value)
+    raise LedgerFormatError(f"未知的设置项 '{section}'")
+
+
+class _Reader:
+    """在字节流上按需解码、按需读取的小型 JSON 词法读取器"""
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.decoder_json = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buf = self.buf[self.pos:] + self.decoder.decode(b'', final=True)
+        else:
+            self.buf = self.buf[self.pos:] + self.decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """跳过空白并返回下一个字符，流结束时返回空串"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise LedgerFormatError(f"JSON 结构不正确：期望 '{char}'，实际为 '{found or '文件结尾'}'")
+        self.pos += 1
+
+    def value(self):
+        """解析下一个完整的 JSON 值；数据不足时继续读取，直到值之后还有字符或到达结尾"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder_json.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # 数字、true 等可能恰好被块边界截断，值后面必须还有字符才能确认它是完整的
+            if end < len(self.buf) or self.eof:
+                self.pos = end
+                return value
+            self._fill()
+
+
+def iter_ledger_json(stream, batch_size=1000, chunk_size=READ_CHUNK_SIZE):
+    """流式解析账本 JSON。
+
+    依次产出 ('records', [最多 batch_size 条记录]) 和 ('section', 键, 值)，
+    records 数组逐条解析并校验，类别、预算、设置按 validate_meta() 检查，
+    内存占用只与批大小有关，与上传文件大小无关。缺少必要的键或结构不对时抛出 LedgerFormatError / json.JSONDecodeError。
+    """
+    reader = _Reader(stream, chunk_size)
+    seen = set()
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise LedgerFormatError('JSON 结构不正确：对象的键必须是字符串')
+            reader.expect(':')
+            seen.add(key)
+            if key == 'records':
+                yield from _iter_record_batches(reader, batch_size)
+            else:
+                value = reader.value()
+                if key in ('categories', 'budgets', 'settings'):
+                    if not isinstance(value, dict):
+                        raise LedgerFormatError(f"JSON 结构不正确：'{key}' 必须是对象")
+                    if key == 'categories':
+                        # 备份中缺少的收入或支出类别按空列表补齐，与 normalize_ledger 一致
+                        value = {**{record_type: [] for record_type in RECORD_TYPES}, **value}
+                    # 整体替换和合并导入都会把这些部分写进账本，结构不对会让首页和设置页无法显示
+                    value = validate_meta(key, value)
+                yield ('section', key, value)
+            if reader.peek() == ',':
+                reader.pos += 1
+                continue
+            reader.expect('}')
+            break
+    if reader.peek() != '':
+        raise LedgerFormatError('JSON 结构不正确：根对象之后还有多余内容')
+    missing = [k for k in REQUIRED_SECTIONS if k not in seen]
+    if missing:
+        raise LedgerFormatError(f"JSON文件结构不正确，缺少必要的键 ({', '.join(missing)})")
+
+
+def _iter_record_batches(reader, batch_size):
+    reader.expect('[')
+    batch = []
+    index = 0
+    if reader.peek() == ']':
+        reader.pos += 1
+        return
+    while True:
+        batch.append(validate_record(reader.value(), index))
+        index += 1
+        if len(batch) >= batch_size:
+            yield ('records', batch)
+            batch = []
+        if reader.peek() == ',':
+            reader.pos += 1
+            continue
+        reader.expect(']')
+        break
+    if batch:
+        yield ('records', batch)
+
+
+def iter_ledger_json_text(meta, records):
+    """逐条生成与 json.dumps(ledger, indent=4) 相同排版的账本 JSON 文本"""
+    yield '{\n    "records": ['
+    first = True
+    for record in records:
+        text = json.dumps(dict(record), ensure_ascii=False, indent=4)
+        yield ('\n' if first else ',\n') + textwrap.indent(text, ' ' * 8)
+        first = False
+    yield '\n    ]' if not first else ']'
+    for key in ('categories', 'budgets', 'settings'):
+        text = json.dumps(meta.get(key, {}), ensure_ascii=False, indent=4)
+        yield f',\n    "{key}": ' + text.replace('\n', '\n    ')
+    yield '\n}'
@@ -0,0 +1,85 @@
+# 文件: logbuffer.py (有上限的内存日志缓冲区，供 /debuglog 查看)
+import logging
+import threading
+from collections import deque
+from itertools import islice
+
+from markupsafe import escape
+
+DEFAULT_MAX_LINES = 2000
+DEFAULT_MAX_BYTES = 512 * 1024
+
+
+class LogEntry:
+    """一条日志：序号、时间、级别和格式化后的文本；HTML 转义在写入时做一次"""
+    __slots__ = ('seq', 'created', 'levelname', 'levelno', 'text', 'html', 'size')
+
+    def __init__(self, seq, record, text):
+        self.seq = seq
+        self.created = record.created
+        self.levelname = record.levelname
+        self.levelno = record.levelno
+        self.text = text
+        self.html = str(escape(text))
+        self.size = len(text)
+
+    @property
+    def css_class(self):
+        if self.levelno >= logging.CRITICAL:
+            return 'CRITICAL'
+        if self.levelno >= logging.ERROR:
+            return 'ERROR'
+        if self.levelno >= logging.WARNING:
+            return 'WARNING'
+        return 'DIAGNOSTIC' if 'DIAGNOSTIC:' in self.text else 'INFO'
+
+    def to_dict(self):
+        return {'seq': self.seq, 'time': self.created, 'level': self.levelname,
+                'text': self.text, 'class': self.css_class}
+
+
+class RingBufferHandler(logging.Handler):
+    """只保留最近的日志，条数和总字符数任一超过上限时丢弃最旧的条目。
+
+    每条日志带有递增的序号，查看器可以只取某个序号之后的新日志。
+    """
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__()
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self._entries = deque()
+        self._bytes = 0
+        self._seq = 0
+        self._buffer_lock = threading.Lock()
+
+    def emit(self, record):
+        try:
+            text = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._buffer_lock:
+            self._seq += 1
+            entry = LogEntry(self._seq, record, text)
+            self._entries.append(entry)
+            self._bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_lines or self._bytes > self.max_bytes):
+                self._bytes -= self._entries.popleft().size
+
+    def entries(self, since=0, level=logging.NOTSET):
+        """返回 (序号大于 since、级别不低于 level 的日志, 当前最新序号)，日志按时间顺序"""
+        with self._buffer_lock:
+            # 序号连续递增，since 之后的条目数可以直接算出，只需从尾部取这么多条
+            count = min(max(self._seq - since, 0), len(self._entries))
+            selected = list(islice(reversed(self._entries), count))[::-1]
+            last_seq = self._seq
+        if level > logging.NOTSET:
+            selected = [entry for entry in selected if entry.levelno >= level]
+        return selected, last_seq
+
+    def clear(self):
+        """清空缓冲区；序号继续递增，查看器不会重复拉取旧日志"""
+        with self._buffer_lock:
+            self._entries.clear()
+            self._bytes = 0
@@ -0,0 +1,244 @@
+# 文件: metrics.py (请求耗时统计：按路由分阶段计时，滚动分位数，Prometheus 文本格式输出)
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 一次请求的耗时拆分为：读取账本、计算、写入账本、渲染模板。
+# compute 不单独计时，取总耗时减去其他三个阶段后的剩余部分。
+PHASES = ('load_data', 'compute', 'save_data', 'render_template')
+QUANTILES = (0.5, 0.9, 0.99)
+# 每个路由保留最近多少次请求用于计算分位数
+WINDOW = 1024
+
+# 存储层中按“读取账本 / 写入账本”计时的方法
+STORE_READ_METHODS = (
+    'load', 'meta', 'get_record', 'records_on', 'records_in', 'group_records', 'existing_ids',
+    'iter_records', 'query_page', 'search', 'period_summary', 'years', 'version', 'monthly_cube',
+)
+STORE_WRITE_METHODS = ('commit', 'replace', 'import_batches', 'compact', 'recover')
+
+_local = threading.local()
+
+
+class RequestTiming:
+    """一次请求内各阶段的耗时。
+
+    阶段可以嵌套（例如 commit 内部读取元数据），嵌套期间外层阶段暂停计时，
+    所以各阶段耗时之和不会超过总耗时。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._stack = []
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        if self._stack:
+            outer = self._stack[-1]
+            self.phases[outer[0]] += now - outer[1]
+        self._stack.append([phase, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        phase, started = self._stack.pop()
+        self.phases[phase] += now - started
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def finish(self):
+        """结束计时，返回 (总耗时, 各阶段耗时)"""
+        total = time.perf_counter() - self.started
+        measured = sum(seconds for phase, seconds in self.phases.items() if phase != 'compute')
+        self.phases['compute'] = max(total - measured, 0.0)
+        return total, self.phases
+
+
+def _timed_iter(phase, iterator):
+    """生成器按需取数，每次取下一条记录的耗时同样计入 phase"""
+    while True:
+        timing = getattr(_local, 'timing', None)
+        if timing is not None:
+            timing.enter(phase)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            if timing is not None:
+                timing.exit()
+        yield item
+
+
+def timed(phase):
+    """装饰器：请求处理期间调用该函数的耗时计入 phase；不在请求中调用时不做任何事"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timing = getattr(_local, 'timing', None)
+            if timing is None:
+                return func(*args, **kwargs)
+            timing.enter(phase)
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                timing.exit()
+            if inspect.isgenerator(result):
+                return _timed_iter(phase, result)
+            return result
+        return wrapper
+    return decorator
+
+
+def instrument_store(store):
+    """给存储实例的读写方法加上计时；类本身不变，只替换这个实例上的绑定方法"""
+    for names, phase in ((STORE_READ_METHODS, 'load_data'), (STORE_WRITE_METHODS, 'save_data')):
+        for name in names:
+            method = getattr(store, name, None)
+            if method is not None:
+                setattr(store, name, timed(phase)(method))
+    return store
+
+
+class StartupTimer:
+    """进程启动的耗时：phases 为各阶段各自的耗时，milestones 为从开始到某个时刻经过的时间（秒）"""
+
+    def __init__(self, started):
+        self.started = started
+        self.phases = {}
+        self.milestones = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def mark(self, milestone):
+        self.milestones[milestone] = time.perf_counter() - self.started
+
+    def summary(self):
+        parts = [f'{name}={seconds * 1000:.0f}ms' for name, seconds in self.phases.items()]
+        parts += [f'{name}@{seconds * 1000:.0f}ms' for name, seconds in self.milestones.items()]
+        return ' '.join(parts)
+
+
+def _quantile(sorted_values, q):
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class RouteStats:
+    """单个路由的累计次数/耗时，以及最近 WINDOW 次请求的各阶段耗时"""
+
+    def __init__(self, window):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.recent = deque(maxlen=window)
+
+    def add(self, total, phases):
+        self.count += 1
+        self.total_seconds += total
+        for phase in PHASES:
+            self.phase_seconds[phase] += phases[phase]
+        self.recent.append((total,) + tuple(phases[phase] for phase in PHASES))
+
+    def quantiles(self):
+        """{'total' 或阶段名: {分位数: 秒}}，基于最近的请求"""
+        columns = list(zip(*self.recent))
+        result = {}
+        for name, values in zip(('total',) + PHASES, columns):
+            values = sorted(values)
+            result[name] = {q: _quantile(values, q) for q in QUANTILES}
+        return result
+
+
+class RequestMetrics:
+    """进程内的请求耗时统计；多 worker 部署时每个进程各自统计"""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.started_at = time.time()
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def begin(self):
+        _local.timing = RequestTiming()
+
+    def end(self, route):
+        timing = getattr(_local, 'timing', None)
+        _local.timing = None
+        if timing is None or route is None:
+            return
+        total, phases = timing.finish()
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats(self.window)
+            stats.add(total, phases)
+
+    def summary(self):
+        """按路由汇总：[(路由, 请求数, 平均耗时, 分位数)]，按 p90 从慢到快排序"""
+        with self._lock:
+            rows = [(route, stats.count, stats.total_seconds / stats.count, stats.quantiles())
+                    for route, stats in self._routes.items()]
+        rows.sort(key=lambda row: row[3]['total'][0.9], reverse=True)
+        return rows
+
+    def prometheus(self, report_cache=None, startup=None):
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        with self._lock:
+            routes = sorted((route, stats.count, stats.total_seconds, dict(stats.phase_seconds), stats.quantiles())
+                            for route, stats in self._routes.items())
+        lines = [
+            '# HELP ledger_request_duration_seconds Request duration by route (quantiles over recent requests).',
+            '# TYPE ledger_request_duration_seconds summary',
+        ]
+        for route, count, total_seconds, _, quantiles in routes:
+            for q in QUANTILES:
+                lines.append(f'ledger_request_duration_seconds{{route="{route}",quantile="{q}"}} '
+                             f'{quantiles["total"][q]:.6f}')
+            lines.append(f'ledger_request_duration_seconds_sum{{route="{route}"}} {total_seconds:.6f}')
+            lines.append(f'ledger_request_duration_seconds_count{{route="{route}"}} {count}')
+        lines += [
+            '# HELP ledger_request_phase_seconds Request time spent in each phase by route.',
+            '# TYPE ledger_request_phase_seconds summary',
+        ]
+        for route, count, _, phase_seconds, quantiles in routes:
+            for phase in PHASES:
+                labels = f'route="{route}",phase="{phase}"'
+                for q in QUANTILES:
+                    lines.append(f'ledger_request_phase_seconds{{{labels},quantile="{q}"}} {quantiles[phase][q]:.6f}')
+                lines.append(f'ledger_request_phase_seconds_sum{{{labels}}} {phase_seconds[phase]:.6f}')
+                lines.append(f'ledger_request_phase_seconds_count{{{labels}}} {count}')
+        if report_cache is not None:
+            lines += [
+                '# HELP ledger_report_cache_lookups_total Report cache lookups by result.',
+                '# TYPE ledger_report_cache_lookups_total counter',
+                f'ledger_report_cache_lookups_total{{result="hit"}} {report_cache["hits"]}',
+                f'ledger_report_cache_lookups_total{{result="miss"}} {report_cache["misses"]}',
+            ]
+        if startup is not None:
+            lines += [
+                '# HELP ledger_startup_phase_seconds Time spent in each startup phase.',
+                '# TYPE ledger_startup_phase_seconds gauge',
+            ]
+            lines += [f'ledger_startup_phase_seconds{{phase="{name}"}} {seconds:.6f}'
+                      for name, seconds in startup.phases.items()]
+            lines += [
+                '# HELP ledger_startup_milestone_seconds Time from process start until each startup milestone.',
+                '# TYPE ledger_startup_milestone_seconds gauge',
+            ]
+            lines += [f'ledger_startup_milestone_seconds{{milestone="{name}"}} {seconds:.6f}'
+                      for name, seconds in startup.milestones.items()]
+        lines += [
+            '# HELP ledger_process_start_time_seconds Start time of the process since unix epoch.',
+            '# TYPE ledger_process_start_time_seconds gauge',
+            f'ledger_process_start_time_seconds {self.started_at:.3f}',
+        ]
+        return '\n'.join(lines) + '\n'
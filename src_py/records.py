@@ -0,0 +1,107 @@
+# 文件: records.py (紧凑的记录对象)
+import sys
+from collections.abc import Mapping
+from datetime import date
+from decimal import Decimal
+
+FIELDS = ('id', 'type', 'category', 'amount', 'description', 'date')
+
+# 'YYYY-MM-DD' <-> 日序号（date.toordinal()）的双向缓存，同一天的记录共享同一个 int 对象
+_day_keys = {}
+_day_texts = {}
+
+
+def day_key(text):
+    """把日期字符串转换为日序号；无法解析的日期原样保留（驻留后的字符串）"""
+    key = _day_keys.get(text)
+    if key is None:
+        try:
+            parsed = date.fromisoformat(text)
+        except (TypeError, ValueError):
+            parsed = None
+        # 只有规范格式才转为序号，保证读回的字符串与写入时完全一致
+        if parsed is not None and parsed.isoformat() == text:
+            key = parsed.toordinal()
+            _day_texts.setdefault(key, sys.intern(text))
+        else:
+            key = sys.intern(str(text))
+        _day_keys[text] = key
+    return key
+
+
+def day_text(key):
+    if isinstance(key, int):
+        text = _day_texts.get(key)
+        if text is None:
+            text = _day_texts.setdefault(key, sys.intern(date.fromordinal(key).isoformat()))
+        return text
+    return key
+
+
+def to_cents(amount):
+    return round(float(amount) * 100)
+
+
+def is_whole_cents(amount):
+    """金额最多有两位小数（按浮点数的最短十进制表示判断）；更精细的金额存储时会被 to_cents 舍去"""
+    return Decimal(repr(float(amount))).as_tuple().exponent >= -2
+
+
+class Record(Mapping):
+    """一条账单记录。
+
+    用 __slots__ 代替六个键的字典：类型和类别是驻留字符串，日期是共享的日序号，
+    金额以整数“分”存储。同时实现了只读的映射接口（record['amount']、record.get(...)），
+    视图和模板可以像使用原来的字典一样使用它。
+    """
+
+    __slots__ = ('id', 'type', 'category', 'day', 'cents', 'description')
+
+    def __init__(self, record_id, record_type, category, day, cents, description=''):
+        self.id = record_id
+        self.type = record_type
+        self.category = category
+        self.day = day
+        self.cents = cents
+        self.description = description
+
+    @classmethod
+    def from_dict(cls, data):
+        if isinstance(data, Record):
+            return data
+        return cls(
+            data['id'],
+            sys.intern(data['type']),
+            sys.intern(data['category']),
+            day_key(data['date']),
+            to_cents(data['amount']),
+            data.get('description') or '',
+        )
+
+    @property
+    def amount(self):
+        return self.cents / 100
+
+    @property
+    def date(self):
+        return day_text(self.day)
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return f"Record({self.to_dict()!r})"
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'type': self.type, 'category': self.category,
+            'amount': self.amount, 'description': self.description, 'date': self.date,
+        }
@@ -0,0 +1,64 @@
+# 文件: reportcache.py (按时间段失效的报表结果 LRU 缓存)
+from collections import OrderedDict
+
+
+def touched_periods(records):
+    """一批记录所影响的日、月、年"""
+    periods = set()
+    for record in records:
+        day = record['date']
+        periods.update((day[:10], day[:7], day[:4]))
+    return periods
+
+
+class ReportCache:
+    """缓存按年/月计算出的报表数据，键为 (报表名, 时间段)。
+
+    某条记录被增删时只丢弃它所在的日、月、年的条目，其余年份和月份的缓存继续有效；
+    超过 maxsize 时淘汰最久未使用的条目。调用方需持有存储的 lock。
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._names = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, name, period, compute):
+        """返回缓存的报表数据，没有缓存时调用 compute() 计算并缓存"""
+        key = (name, period)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        value = compute()
+        self._names.add(name)
+        self._entries[key] = value
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def invalidate(self, periods):
+        """只丢弃给定时间段的条目"""
+        for period in periods:
+            for name in self._names:
+                if self._entries.pop((name, period), None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries), 'maxsize': self.maxsize,
+            'hits': self.hits, 'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions, 'invalidations': self.invalidations,
+        }
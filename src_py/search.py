@@ -0,0 +1,137 @@
+# 文件: search.py (备注和类别的全文检索倒排索引)
+import functools
+import heapq
+import math
+import re
+
+# 中日韩文字按相邻两字（bigram）切分，其余字母/数字按整词切分
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_TOKEN_RE = re.compile(f'([{_CJK}]+)|((?:(?![{_CJK}])[^\\W_])+)')
+# 命中类别、以及备注/类别中包含完整查询串时的加分倍数
+CATEGORY_BOOST = 2.0
+PHRASE_BOOST = 1.5
+
+
+@functools.lru_cache(maxsize=4096)
+def tokenize(text):
+    """文本中的检索词集合：连续的中文取所有相邻两字，单个汉字取其本身，其余按整词（小写）"""
+    terms = set()
+    for cjk, word in _TOKEN_RE.findall(text.casefold()):
+        if word:
+            terms.add(word)
+        elif len(cjk) == 1:
+            terms.add(cjk)
+        else:
+            terms.update(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return frozenset(terms)
+
+
+def _record_terms(record):
+    return tokenize(record['description'] or '') | tokenize(record['category'])
+
+
+class SearchIndex:
+    """检索词 → 记录 id 集合的倒排索引，记录增删时增量维护。
+
+    查询中的每个词都必须命中（AND）：中文按两字切分后逐个求交集；单个汉字和英文/数字词
+    匹配所有包含它的检索词（"port" 可以找到 "airport"）。调用方需持有存储的 lock。
+    """
+
+    def __init__(self, records=()):
+        self._postings = {}
+        self._docs = {}
+        for record in records:
+            self._index(record)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, record):
+        self.remove(record['id'])
+        self._index(record)
+
+    def _index(self, record):
+        record_id = record['id']
+        self._docs[record_id] = record
+        postings = self._postings
+        for term in _record_terms(record):
+            docs = postings.get(term)
+            if docs is None:
+                docs = postings[term] = set()
+            docs.add(record_id)
+
+    def remove(self, record_id):
+        record = self._docs.pop(record_id, None)
+        if record is None:
+            return
+        for term in _record_terms(record):
+            docs = self._postings.get(term)
+            if docs is None:
+                continue
+            docs.discard(record_id)
+            if not docs:
+                del self._postings[term]
+
+    def _expand(self, kind, term):
+        """查询词对应的索引词列表；词表只有不重复的词，远小于记录数，逐个比较也很快"""
+        if kind == 'term':
+            return [term] if term in self._postings else []
+        return [t for t in self._postings if term in t]
+
+    @staticmethod
+    def _query_parts(query):
+        parts = []
+        for cjk, word in _TOKEN_RE.findall(query.casefold()):
+            if word or len(cjk) == 1:
+                parts.append(('substring', word or cjk))
+            else:
+                parts.extend(('term', cjk[i:i + 2]) for i in range(len(cjk) - 1))
+        return parts
+
+    def search(self, query, record_type=None, category=None, start=None, end=None, offset=0, limit=20):
+        """返回 (按相关度排序的第 offset 条起的 limit 条记录及得分 [(记录, 得分)], 命中总数)。
+
+        得分为各查询词的 idf 之和，查询词出现在类别中、或备注/类别包含完整查询串时加分；
+        得分相同时日期较新的排在前面。
+        """
+        groups = []
+        for kind, term in dict.fromkeys(self._query_parts(query)):
+            terms = self._expand(kind, term)
+            if not terms:
+                return [], 0
+            docs = self._postings[terms[0]] if len(terms) == 1 else set().union(*(self._postings[t] for t in terms))
+            groups.append((frozenset(terms), docs))
+        if not groups:
+            return [], 0
+
+        # 从最小的集合开始求交集
+        groups.sort(key=lambda group: len(group[1]))
+        hits = set(groups[0][1]).intersection(*(docs for _, docs in groups[1:]))
+        total_docs = len(self._docs)
+        base_score = sum(math.log(1 + total_docs / len(docs)) for _, docs in groups)
+        # 只有一个查询词时，每条命中的记录都包含完整的查询串，不必逐条检查
+        phrase = query.strip().casefold() if len(groups) > 1 else None
+        category_scores = {}  # 类别 → 类别加分后的得分，每个类别只计算一次
+        filtered = not (record_type is None and category is None and start is None and end is None)
+
+        matched = []
+        for record_id in hits:
+            record = self._docs[record_id]
+            if filtered and not (
+                    (record_type is None or record['type'] == record_type)
+                    and (category is None or record['category'] == category)
+                    and (start is None or record['date'] >= start)
+                    and (end is None or record['date'] <= end)):
+                continue
+            record_category = record['category']
+            value = category_scores.get(record_category)
+            if value is None:
+                category_terms = tokenize(record_category)
+                value = category_scores[record_category] = base_score + CATEGORY_BOOST * sum(
+                    1 for terms, _ in groups if not category_terms.isdisjoint(terms))
+            if phrase is not None and (phrase in (record['description'] or '').casefold()
+                                       or phrase in record_category.casefold()):
+                value *= PHRASE_BOOST
+            matched.append((value, record['date'], record_id))
+        top = heapq.nlargest(offset + limit, matched)[offset:]
+        return [(self._docs[record_id], round(value, 4)) for value, _, record_id in top], len(matched)
@@ -0,0 +1,78 @@
+# 文件: snapshot.py (data.json 快照的紧凑格式)
+import json
+import sys
+
+from records import Record
+
+SNAPSHOT_FORMATS = ('json', 'compact')
+COMPACT_FORMAT = 'ledger-compact'
+COMPACT_VERSION = 1
+# 紧凑快照总是以这个前缀开头，读取时据此识别格式
+COMPACT_PREFIX = '{"format":"%s"' % COMPACT_FORMAT
+
+
+def snapshot_format(head):
+    """根据文件开头的内容（str 或 bytes）判断快照格式"""
+    if isinstance(head, bytes):
+        head = head.decode('utf-8', errors='ignore')
+    return 'compact' if head.startswith(COMPACT_PREFIX) else 'json'
+
+
+def encode_compact(ledger):
+    """把内存中的账本（records 为 id → Record）编码为紧凑快照文本。
+
+    仍然是合法的 JSON，但记录按列存储：类型和类别编码为字符串表中的下标，日期为日序号，
+    金额为整数“分”，并且不缩进。与 indent=4 的 data.json 相比文件更小，解析时也不必为
+    每条记录创建一个字典。
+    """
+    string_codes = {}
+    ids, types, categories, days, cents, descriptions = [], [], [], [], [], []
+    for record in ledger.records.values():
+        ids.append(record.id)
+        types.append(string_codes.setdefault(record.type, len(string_codes)))
+        categories.append(string_codes.setdefault(record.category, len(string_codes)))
+        days.append(record.day)
+        cents.append(record.cents)
+        descriptions.append(record.description)
+    body = {
+        'version': COMPACT_VERSION,
+        'strings': list(string_codes),
+        'records': {
+            'id': ids, 'type': types, 'category': categories,
+            'day': days, 'cents': cents, 'description': descriptions,
+        },
+        'categories': ledger.categories,
+        'budgets': ledger.budgets,
+        'settings': ledger.settings,
+    }
+    text = json.dumps(body, ensure_ascii=False, separators=(',', ':'))
+    return f'{COMPACT_PREFIX},{text[1:]}'
+
+
+def decode_compact(data):
+    """把解析后的紧凑快照还原为账本字典，records 直接是 Record 对象；格式不对时抛出 ValueError"""
+    if data.get('format') != COMPACT_FORMAT:
+        raise ValueError('not a compact ledger snapshot')
+    if data.get('version') != COMPACT_VERSION:
+        raise ValueError(f"unsupported compact snapshot version {data.get('version')!r}")
+    try:
+        strings = [sys.intern(s) for s in data['strings']]
+        columns = data['records']
+        if len({len(columns[name]) for name in ('id', 'type', 'category', 'day', 'cents', 'description')}) != 1:
+            raise ValueError('record columns have different lengths')
+        rows = zip(columns['id'], columns['type'], columns['category'],
+                   columns['day'], columns['cents'], columns['description'])
+        # 规范日期以日序号（int）保存，无法解析的日期原样保存为字符串
+        records = [
+            Record(record_id, strings[type_code], strings[category_code],
+                   day if isinstance(day, int) else sys.intern(day), cents, description)
+            for record_id, type_code, category_code, day, cents, description in rows
+        ]
+        return {
+            'records': records,
+            'categories': data['categories'],
+            'budgets': data['budgets'],
+            'settings': data['settings'],
+        }
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f'malformed compact snapshot: {e!r}') from None
@@ -0,0 +1,1620 @@
+# 文件: storage.py (账本持久化层 - JSON 快照 + 追加写日志 / SQLite / 按年分区)
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+
+from aggregates import AggregateIndex
+from analytics import LedgerColumns, build_cube
+from jsonstream import LedgerFormatError, validate_record
+from records import Record
+from reportcache import ReportCache, touched_periods
+from search import SearchIndex
+from snapshot import SNAPSHOT_FORMATS, decode_compact, encode_compact, snapshot_format
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只能保证单个进程内的互斥
+    fcntl = None
+
+BACKENDS = ('json', 'sqlite', 'partitioned')
+DATA_FILENAME = 'data.json'
+SQLITE_FILENAME = 'ledger.db'
+PARTITIONS_DIRNAME = 'ledger'
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+# 分区文件名：年份-写入时的清单修订号.json，例如 2024-17.json
+PARTITION_FILE_RE = re.compile(r'^(\d{4})-(\d+)\.json$')
+JOURNAL_SUFFIX = '.journal'
+# 回放失败的日志行移到这个文件里保留，不再参与回放
+REJECTED_SUFFIX = '.rejected'
+# 无法解析的日志行（写入时被中断的最后一行、中间损坏的行）原样移到这个文件里保留
+CORRUPT_SUFFIX = '.corrupt'
+BACKUP_SUFFIX = '.bak'
+LOCK_SUFFIX = '.lock'
+# 迁移期间持有的锁文件（目标路径 + 后缀），保证多个 worker 同时启动时只有一个进程执行迁移
+MIGRATION_LOCK_SUFFIX = '.migrate.lock'
+# 日志中累计多少次变更后，合并回 data.json 快照
+JOURNAL_COMPACT_THRESHOLD = 200
+
+
+def initial_ledger():
+    return {
+        "records": [],
+        "categories": {
+            "expense": ["交通"],
+            "income": ["工资"]
+        },
+        "budgets": {},
+        "settings": {
+            "keep_last_date": False
+        }
+    }
+
+
+def normalize_ledger(data):
+    data.setdefault('records', [])
+    data.setdefault('categories', {}).setdefault('expense', [])
+    data.setdefault('categories', {}).setdefault('income', [])
+    data.setdefault('budgets', {})
+    data.setdefault('settings', {}).setdefault('keep_last_date', False)
+    return data
+
+
+class LedgerIndex:
+    """内存中的账本：id → 记录（保持录入顺序）以及 (日期, 类型, 类别) → id 的分组索引。
+
+    按 id 查找、取出同日同类别的一组记录都是 O(1)，增删记录只触及受影响的那一组，
+    不需要重建整个记录列表。记录以紧凑的 records.Record 对象保存。调用方需持有存储的 lock。
+    """
+
+    def __init__(self, data):
+        self.categories = data['categories']
+        self.budgets = data['budgets']
+        self.settings = data['settings']
+        self.records = {}
+        self.groups = {}
+        self._date_keys = None  # 按 (日期, id) 排序的键列表，首次分页查询时才建立
+        for record in data['records']:
+            self._discard(record['id'])
+            self._add(record)
+
+    @staticmethod
+    def group_key(record):
+        return (record.date, record.type, record.category)
+
+    def _add(self, record):
+        record = Record.from_dict(record)
+        self.records[record.id] = record
+        # 用 dict 充当有序集合，组内保持录入顺序
+        self.groups.setdefault(self.group_key(record), {})[record.id] = None
+        if self._date_keys is not None:
+            insort(self._date_keys, (record.date, record.id))
+        return record
+
+    def _discard(self, record_id):
+        record = self.records.pop(record_id, None)
+        if record is not None:
+            key = self.group_key(record)
+            members = self.groups[key]
+            del members[record_id]
+            if not members:
+                del self.groups[key]
+            if self._date_keys is not None:
+                del self._date_keys[bisect_left(self._date_keys, (record.date, record_id))]
+        return record
+
+    def put(self, record):
+        """新增记录，同 id 的旧记录会被替换"""
+        self._discard(record['id'])
+        return self._add(record)
+
+    def group(self, key):
+        return [self.records[i] for i in self.groups.get(key, ())]
+
+    def date_keys(self):
+        """按 (日期, id) 升序排列的全部键，之后随增删记录增量维护"""
+        if self._date_keys is None:
+            self._date_keys = sorted((r.date, r.id) for r in self.records.values())
+        return self._date_keys
+
+    def between(self, start, stop):
+        """日期在 [start, stop) 内的记录，按 (日期, id) 排序；在 date_keys() 上二分定位，不扫描全部记录"""
+        keys = self.date_keys()
+        return [self.records[keys[i][1]] for i in range(bisect_left(keys, (start,)), bisect_left(keys, (stop,)))]
+
+    def day_records(self, day):
+        """某一天的记录：同类型同类别的记录按录入顺序相邻排列（记录页合并显示时以第一条为代表）"""
+        keys = dict.fromkeys(self.group_key(r) for r in self.between(day, day + '\0'))
+        return [r for key in keys for r in self.group(key)]
+
+    def apply(self, change):
+        """原地应用一条变更，返回 (新增的记录, 被移除或被同 id 新记录覆盖的记录)。
+
+        变更是幂等的：新增记录会先按 id 去重，所以重复回放同一段日志不会产生重复记录。
+        """
+        added = change.get('add') or []
+        removed = []
+        for record_id in list(change.get('remove') or []) + [r['id'] for r in added]:
+            record = self._discard(record_id)
+            if record is not None:
+                removed.append(record)
+        added = [self._add(record) for record in added]
+        for key in ('categories', 'budgets', 'settings'):
+            if change.get(key) is not None:
+                setattr(self, key, change[key])
+        return added, removed
+
+    def to_ledger(self):
+        """导出为单文件 JSON 结构（全部是新建的普通字典和列表）"""
+        return {
+            'records': [r.to_dict() for r in self.records.values()],
+            'categories': {k: list(v) for k, v in self.categories.items()},
+            'budgets': dict(self.budgets),
+            'settings': dict(self.settings),
+        }
+
+
+def merge_meta(current, sections):
+    """合并导入时的类别/预算合并规则：类别取并集，预算只补充当前没有的类别，设置保持不变"""
+    categories = {k: list(v) for k, v in current['categories'].items()}
+    for record_type, names in (sections.get('categories') or {}).items():
+        existing = categories.setdefault(record_type, [])
+        existing.extend(n for n in names if n not in existing)
+    budgets = dict(current['budgets'])
+    for category, amount in (sections.get('budgets') or {}).items():
+        budgets.setdefault(category, amount)
+    return categories, budgets
+
+
+def make_change(add=(), remove=(), categories=None, budgets=None, settings=None):
+    """把 commit() 的参数整理成一条变更；没有任何修改时返回 None。
+
+    新增的记录在这里检查并规范化为普通字典：不合法时抛出 LedgerFormatError，
+    此时日志、数据库和分区文件都还没有被改动。
+    """
+    change = {}
+    if add:
+        change['add'] = [validate_record(record, index) for index, record in enumerate(add)]
+    if remove:
+        change['remove'] = list(remove)
+    if categories is not None:
+        change['categories'] = categories
+    if budgets is not None:
+        change['budgets'] = budgets
+    if settings is not None:
+        change['settings'] = settings
+    return change or None
+
+
+def replayable_change(change):
+    """检查从日志中读到的一条变更，返回可以安全回放的变更；格式不对时抛出 LedgerFormatError"""
+    if not isinstance(change, dict):
+        raise LedgerFormatError('变更不是对象')
+    remove = change.get('remove') or []
+    if not isinstance(remove, list) or not all(isinstance(i, str) for i in remove):
+        raise LedgerFormatError("变更中的 'remove' 不是 id 列表")
+    for section in ('categories', 'budgets', 'settings'):
+        if change.get(section) is not None and not isinstance(change[section], dict):
+            raise LedgerFormatError(f"变更中的 '{section}' 不是对象")
+    if not isinstance(change.get('add') or [], list):
+        raise LedgerFormatError("变更中的 'add' 不是记录列表")
+    return make_change(change.get('add') or (), remove, change.get('categories'),
+                       change.get('budgets'), change.get('settings')) or {}
+
+
+def matches_filters(record, record_type=None, category=None, text=None):
+    """分页查询中除日期区间以外的筛选条件；text 在备注和类别中不区分大小写地查找"""
+    if record_type is not None and record['type'] != record_type:
+        return False
+    if category is not None and record['category'] != category:
+        return False
+    if text is not None:
+        return text in record['description'].casefold() or text in record['category'].casefold()
+    return True
+
+
+def iter_sorted(ledger, start=None, end=None, after=None, descending=True):
+    """按 (日期, id) 顺序遍历 ledger（LedgerIndex）中日期在 [start, end] 内、位于游标 after 之后的记录"""
+    keys = ledger.date_keys()
+    # 日期区间和游标都用二分定位，只遍历落在区间内的那一段
+    lo = bisect_left(keys, (start,)) if start else 0
+    hi = bisect_left(keys, (end + '\0',)) if end else len(keys)
+    if after is not None:
+        if descending:
+            hi = min(hi, bisect_left(keys, after))
+        else:
+            lo = max(lo, bisect_right(keys, after))
+    positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+    return (ledger.records[keys[i][1]] for i in positions)
+
+
+def prefix_upper_bound(prefix):
+    """日期前缀对应的开区间上界：'2024-05' 覆盖 ['2024-05', '2024-05~')"""
+    return prefix + '~'
+
+
+def _file_stamp(path):
+    """返回用于判断文件是否变化的 (mtime_ns, size)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _fsync_dir(path):
+    """把目录项的变化（rename/创建）落盘；部分平台不支持对目录 fsync，忽略即可"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path, data, backup_path=None):
+    """以 indent=4 的 JSON 原子写入 data，见 atomic_write()"""
+    atomic_write(path, lambda f: json.dump(data, f, ensure_ascii=False, indent=4), backup_path)
+
+
+def atomic_write(path, write, backup_path=None):
+    """先用 write(f) 写临时文件并 fsync，再用 os.replace 原子替换目标文件。
+
+    提供 backup_path 时，旧文件会被保留为上一份完好的快照。
+    进程在任何时刻被杀掉，磁盘上要么是旧文件，要么是完整的新文件。
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    if backup_path and os.path.exists(path):
+        os.replace(path, backup_path)
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+def write_ledger_file(path, ledger, file_format='json', backup_path=None):
+    """把内存中的账本（LedgerIndex）按 file_format（json 或 compact）原子写入 path"""
+    if file_format == 'compact':
+        text = encode_compact(ledger)
+        atomic_write(path, lambda f: f.write(text), backup_path)
+    else:
+        atomic_write_json(path, ledger.to_ledger(), backup_path)
+
+
+class LedgerLock:
+    """进程内可重入、进程间互斥的锁。
+
+    多个 worker 进程共用同一个数据目录时，持有锁期间同时用 flock 锁住数据文件旁的
+    .lock 文件，使各进程的“读-改-写”、日志追加和快照合并不会互相交错。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class BaseLedgerStore:
+    """账本存储后端的公共接口。
+
+    视图只通过这里的查询方法读取记录，通过 commit()/replace() 修改账本；
+    lock 用于把路由中的“读-改-写”串行化，提供 lock_path 时在多个进程之间同样互斥。
+    """
+
+    def __init__(self, lock_path=None):
+        self.lock = LedgerLock(lock_path) if lock_path else threading.RLock()
+        self.generation = 0
+        # 进程内的 generation 从 0 开始计数，加上实例标识后，重启前后的版本号不会混淆
+        self.instance = uuid.uuid4().hex[:8]
+        self.modified_at = time.time()
+        self._aggregates = None
+        self._search = None
+        self._cube = None
+        self._cube_generation = None
+        self.reports = ReportCache()
+
+    def meta(self):
+        """返回类别、预算和设置的可修改副本"""
+        raise NotImplementedError
+
+    def get_record(self, record_id):
+        raise NotImplementedError
+
+    def records_on(self, day):
+        """某一天的全部记录"""
+        raise NotImplementedError
+
+    def records_in(self, prefix):
+        """日期以 prefix 开头的记录，prefix 为 'YYYY' 或 'YYYY-MM'"""
+        raise NotImplementedError
+
+    def group_records(self, day, record_type, category):
+        """同一天、同类型、同类别的记录（页面上合并显示为一条）"""
+        raise NotImplementedError
+
+    def existing_ids(self, ids):
+        """返回 ids 中已存在于账本里的那部分"""
+        raise NotImplementedError
+
+    def iter_records(self, start=None, end=None, record_type=None, category=None):
+        """按录入顺序遍历记录，可按日期区间 [start, end]（含两端）、类型和类别筛选"""
+        raise NotImplementedError
+
+    def query_page(self, start=None, end=None, record_type=None, category=None, text=None,
+                   after=None, limit=50, descending=True):
+        """按 (日期, id) 排序的一页记录，返回 (记录列表, 下一页的游标键或 None)。
+
+        after 是上一页最后一条记录的 (日期, id)，翻页时从它之后继续（键集分页），
+        不受前面页中记录增删的影响。start/end 为含两端的日期区间。
+        """
+        raise NotImplementedError
+
+    def load(self):
+        """返回完整账本（导出用的单文件 JSON 结构）"""
+        data = self.meta()
+        data['records'] = list(self.iter_records())
+        return data
+
+    def commit(self, add=(), remove=(), categories=None, budgets=None, settings=None):
+        raise NotImplementedError
+
+    def replace(self, data):
+        raise NotImplementedError
+
+    def import_batches(self, events, mode='replace'):
+        """从 jsonstream.iter_ledger_json() 的事件流导入账本，返回 (导入条数, 跳过的重复条数)。
+
+        replace 模式整体替换账本；merge 模式只追加账本中还没有的 id。
+        事件流中途出错时账本保持不变。
+        """
+        raise NotImplementedError
+
+    def recover(self):
+        """启动时的恢复步骤，默认无需处理"""
+
+    # --- 汇总索引 ---
+
+    def _refresh(self):
+        """派生数据依赖的底层数据被外部修改时，在这里重新加载；调用方需持有 lock"""
+
+    def _aggregate_index(self):
+        """按需（首次查询或导入后）从全部记录重建汇总索引，调用方需持有 lock"""
+        self._refresh()
+        if self._aggregates is None:
+            self._aggregates = AggregateIndex(self.iter_records())
+        return self._aggregates
+
+    def period_summary(self, period):
+        """某一天/月/年的 {(类型, 类别): 金额合计}，period 为 'YYYY-MM-DD'、'YYYY-MM' 或 'YYYY'"""
+        with self.lock:
+            return self._aggregate_index().summary(period)
+
+    def years(self):
+        """所有出现过的年份，倒序"""
+        with self.lock:
+            return self._aggregate_index().years()
+
+    def search(self, query, record_type=None, category=None, start=None, end=None, offset=0, limit=20):
+        """在备注和类别中全文检索，返回 ([(记录, 得分)], 命中总数)，按相关度排序。
+
+        倒排索引在第一次检索时建立，之后随 commit() 增量更新，导入或重新加载后重建。
+        """
+        with self.lock:
+            self._refresh()
+            if self._search is None:
+                self._search = SearchIndex(self.iter_records())
+            return self._search.search(query, record_type, category, start, end, offset, limit)
+
+    def version(self):
+        """返回 (版本标识, 最后修改时间戳)；账本的任何修改都会改变版本标识"""
+        with self.lock:
+            self._refresh()
+            return f'{self.instance}-{self.generation}', self.modified_at
+
+    def report(self, name, period, compute):
+        """按 (报表名, 时间段) 缓存 compute() 的结果，时间段内的记录变化后才重新计算。
+
+        compute 只能依赖该时间段内的记录（period 为 'YYYY'、'YYYY-MM' 或 'YYYY-MM-DD'）。
+        """
+        with self.lock:
+            self._refresh()
+            return self.reports.get(name, period, compute)
+
+    def monthly_cube(self):
+        """(月份, 类型, 类别) 的金额立方体，由月度汇总批量构建，账本变化后才重建"""
+        with self.lock:
+            aggregates = self._aggregate_index()
+            if self._cube is None or self._cube_generation != self.generation:
+                self._cube = build_cube(LedgerColumns.from_rows(aggregates.month_rows()))
+                self._cube_generation = self.generation
+            return self._cube
+
+    def _after_commit(self, added, removed):
+        """增量更新汇总索引；尚未建立索引时留待下次查询再建"""
+        self.generation += 1
+        self.modified_at = time.time()
+        self.reports.invalidate(touched_periods(list(added) + list(removed)))
+        if self._aggregates is not None:
+            for record in removed:
+                self._aggregates.remove(record)
+            for record in added:
+                self._aggregates.add(record)
+        if self._search is not None:
+            for record in removed:
+                self._search.remove(record['id'])
+            for record in added:
+                self._search.add(record)
+
+    def _invalidate(self):
+        """账本被整体替换或从磁盘重新加载后，丢弃所有派生数据"""
+        self.generation += 1
+        self.modified_at = time.time()
+        self._aggregates = None
+        self._search = None
+        self.reports.clear()
+
+
+class JsonLedgerStore(BaseLedgerStore):
+    """data.json 快照加上同目录下的 data.json.journal 追加日志。
+
+    每次修改只向日志追加一行 JSON（O(单条记录)），累计到阈值后再整体合并回快照。
+    解析后的账本缓存在内存中，按两个文件的 (mtime, size) 失效。
+    """
+
+    def __init__(self, data_file, compact_threshold=JOURNAL_COMPACT_THRESHOLD, snapshot_format='json'):
+        super().__init__(data_file + LOCK_SUFFIX)
+        self.data_file = data_file
+        # 写快照时使用的格式；读取时按文件内容自动识别，所以切换格式后旧快照仍可读取
+        self.snapshot_format = snapshot_format
+        self.journal_file = data_file + JOURNAL_SUFFIX
+        self.backup_file = data_file + BACKUP_SUFFIX
+        self.compact_threshold = compact_threshold
+        self._ledger = None
+        self._stamp = None
+        self._journal_entries = 0
+        # 已读到的日志位置 (inode, 字节偏移)；其他进程只追加了日志时，从这里接着回放新增的行
+        self._journal_position = None
+
+    # --- 读取 ---
+
+    def _stamps(self):
+        return (_file_stamp(self.data_file), _file_stamp(self.journal_file))
+
+    @staticmethod
+    def _parse_file(path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        data = json.loads(raw)
+        if snapshot_format(raw[:64]) == 'compact':
+            return decode_compact(data)
+        if not isinstance(data, dict) or not isinstance(data.get('records', []), list):
+            raise ValueError("ledger root must be an object with a 'records' list")
+        return normalize_ledger(data)
+
+    def _read_snapshot(self):
+        """读取快照；快照损坏时将其改名保留，并回退到上一份完好的 .bak 快照"""
+        try:
+            return self._parse_file(self.data_file)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, UnicodeDecodeError, ValueError) as e:
+            corrupt_path = f"{self.data_file}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            os.replace(self.data_file, corrupt_path)
+            logging.critical(f"FATAL: '{self.data_file}' is unreadable ({e}); moved aside to '{corrupt_path}'.")
+
+        try:
+            data = self._parse_file(self.backup_file)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, UnicodeDecodeError, ValueError) as e:
+            logging.critical(f"FATAL: Backup snapshot '{self.backup_file}' is unreadable too: {e}")
+            return None
+        logging.warning(f"DIAGNOSTIC: Recovered ledger from last good snapshot '{self.backup_file}'.")
+        self._dump(self.data_file, LedgerIndex(data))
+        return data
+
+    def _read_journal(self, offset=0):
+        """从 offset 字节处读取日志，返回 (变更列表, 无法解析的行, 日志是否以换行结尾, 读到的位置)。
+
+        写入时被中断的最后一行与中间损坏的行一样算作无法解析的行；没有以换行结尾时，
+        下一次追加会接在残缺的内容后面，调用方需要先合并日志。位置为 (inode, 字节偏移)，
+        日志不存在时为 None。
+        """
+        try:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(offset)
+                raw = f.read()
+                position = (os.fstat(f.fileno()).st_ino, offset + len(raw))
+        except FileNotFoundError:
+            return [], [], True, None
+        changes, unreadable = [], []
+        for line_no, line in enumerate(raw.split(b'\n'), 1):
+            if not line.strip():
+                continue
+            try:
+                changes.append(json.loads(line))
+            except ValueError:
+                unreadable.append(line)
+                logging.warning(f"DIAGNOSTIC: Skipping torn or unreadable journal line {line_no} in '{self.journal_file}'.")
+        return changes, unreadable, not raw or raw.endswith(b'\n'), position
+
+    def _reload(self):
+        data = self._read_snapshot()
+        if data is None:
+            # 日志中的变更依赖于丢失的快照，无法可靠回放；保留原文件以便人工恢复
+            if os.path.exists(self.journal_file):
+                os.replace(self.journal_file, f"{self.journal_file}.orphaned")
+            self._write_snapshot(LedgerIndex(initial_ledger()))
+        else:
+            ledger = LedgerIndex(data)
+            changes, unreadable, clean_end, position = self._read_journal()
+            rejected = []
+            for change in changes:
+                try:
+                    change = replayable_change(change)
+                except LedgerFormatError as e:
+                    rejected.append(change)
+                    logging.error(f"DIAGNOSTIC: Skipping journal entry that cannot be applied ({e}).")
+                    continue
+                ledger.apply(change)
+            self._install(ledger, len(changes))
+            self._journal_position = position
+            if unreadable or rejected or not clean_end:
+                self._quarantine(unreadable, rejected)
+        self._invalidate()
+
+    def _quarantine(self, unreadable, rejected):
+        """把无法解析的日志行追加到 .corrupt 文件、无法回放的变更追加到 .rejected 文件，
+        并立即合并日志：之后不再回放这些行，新的变更也不会接在残缺的最后一行后面"""
+        for suffix, lines in ((CORRUPT_SUFFIX, unreadable),
+                              (REJECTED_SUFFIX, [json.dumps(c, ensure_ascii=False).encode('utf-8') for c in rejected])):
+            if not lines:
+                continue
+            path = self.journal_file + suffix
+            with open(path, 'ab') as f:
+                for line in lines:
+                    f.write(line + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+            logging.critical(f"FATAL: Moved {len(lines)} unusable journal entries to '{path}'.")
+        self._write_snapshot(self._ledger)
+
+    def _install(self, ledger, journal_entries):
+        self._ledger = ledger
+        self._journal_entries = journal_entries
+        self._stamp = self._stamps()
+
+    def _current(self):
+        """返回内存中的账本索引，文件被外部修改时重新加载；调用方需持有 lock"""
+        if self._ledger is None:
+            self._reload()
+        else:
+            stamps = self._stamps()
+            if stamps != self._stamp and not self._replay_tail(stamps):
+                self._reload()
+        return self._ledger
+
+    def _replay_tail(self, stamps):
+        """快照没变、只是日志被其他进程追加了新行时，只回放新增的行并增量更新派生数据。
+        返回 False 表示需要整体重新加载（快照被合并改写、日志被替换或新增的行有问题）。"""
+        if stamps[0] != self._stamp[0] or stamps[1] is None:
+            return False
+        inode, offset = self._journal_position or (None, 0)
+        if stamps[1][1] < offset:
+            return False
+        changes, unreadable, clean_end, position = self._read_journal(offset)
+        if position is None or (inode is not None and position[0] != inode) or unreadable or not clean_end:
+            return False
+        try:
+            changes = [replayable_change(change) for change in changes]
+        except LedgerFormatError:
+            return False
+        for change in changes:
+            added, removed = self._ledger.apply(change)
+            self._after_commit(added, removed)
+        self._install(self._ledger, self._journal_entries + len(changes))
+        self._journal_position = position
+        return True
+
+    def load(self):
+        """返回账本的可修改副本"""
+        with self.lock:
+            return self._current().to_ledger()
+
+    def meta(self):
+        with self.lock:
+            data = self._current().to_ledger()
+        del data['records']
+        return data
+
+    def get_record(self, record_id):
+        with self.lock:
+            return self._current().records.get(record_id)
+
+    def records_on(self, day):
+        with self.lock:
+            return self._current().day_records(day)
+
+    def records_in(self, prefix):
+        with self.lock:
+            return self._current().between(prefix, prefix_upper_bound(prefix))
+
+    def group_records(self, day, record_type, category):
+        with self.lock:
+            return self._current().group((day, record_type, category))
+
+    def existing_ids(self, ids):
+        with self.lock:
+            records = self._current().records
+            return {i for i in ids if i in records}
+
+    def iter_records(self, start=None, end=None, record_type=None, category=None):
+        # 先在锁内取一份记录列表，遍历期间的并发修改不会影响调用方
+        with self.lock:
+            snapshot = list(self._current().records.values())
+        if start is None and end is None and record_type is None and category is None:
+            return iter(snapshot)
+        return (
+            r for r in snapshot
+            if (start is None or r['date'] >= start)
+            and (end is None or r['date'] <= end)
+            and (record_type is None or r['type'] == record_type)
+            and (category is None or r['category'] == category)
+        )
+
+    def query_page(self, start=None, end=None, record_type=None, category=None, text=None,
+                   after=None, limit=50, descending=True):
+        text = text.casefold() if text else None
+        with self.lock:
+            page = []
+            for record in iter_sorted(self._current(), start, end, after, descending):
+                if matches_filters(record, record_type, category, text):
+                    page.append(record)
+                    # 多取一条用来判断是否还有下一页
+                    if len(page) > limit:
+                        break
+        if len(page) > limit:
+            del page[limit:]
+            return page, (page[-1].date, page[-1].id)
+        return page, None
+
+    def _refresh(self):
+        # 文件被外部修改时重新加载（重新加载会丢弃旧的汇总索引和报表缓存）
+        self._current()
+
+    def version(self):
+        # 版本标识取自两个文件的 (mtime, size)，同一数据目录下的所有进程看到的版本一致
+        with self.lock:
+            self._current()
+            stamp = self._stamp
+        token = hashlib.sha1(repr(stamp).encode('utf-8')).hexdigest()[:16]
+        mtimes = [s[0] for s in stamp if s is not None]
+        return token, max(mtimes) / 1e9 if mtimes else self.modified_at
+
+    # --- 写入 ---
+
+    def _dump(self, path, ledger, backup_path=None):
+        write_ledger_file(path, ledger, self.snapshot_format, backup_path)
+
+    def _write_snapshot(self, ledger):
+        self._dump(self.data_file, ledger, backup_path=self.backup_file)
+        # 若在删除日志前崩溃，回放是幂等的，不会产生重复记录
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._install(ledger, 0)
+        self._journal_position = None
+
+    def commit(self, add=(), remove=(), categories=None, budgets=None, settings=None):
+        """以一行日志的形式记录一次修改：新增/删除记录，或替换类别、预算、设置"""
+        change = make_change(add, remove, categories, budgets, settings)
+        if change is None:
+            return
+        with self.lock:
+            ledger = self._current()
+            # 先落盘再修改内存，写日志失败时内存中的账本保持不变；
+            # 记录已由 make_change() 检查过，写入日志的行一定能够回放
+            with open(self.journal_file, 'ab') as f:
+                f.write((json.dumps(change, ensure_ascii=False) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+                position = (os.fstat(f.fileno()).st_ino, f.tell())
+            added, removed = ledger.apply(change)
+            self._install(ledger, self._journal_entries + 1)
+            self._journal_position = position
+            self._after_commit(added, removed)
+            if self._journal_entries >= self.compact_threshold:
+                self.compact()
+
+    def replace(self, data):
+        """整体替换账本（导入备份时使用），直接写入新快照并清空日志"""
+        with self.lock:
+            self._write_snapshot(LedgerIndex(normalize_ledger(data)))
+            self._invalidate()
+
+    def import_batches(self, events, mode='replace'):
+        with self.lock:
+            if mode == 'replace':
+                ledger = LedgerIndex(normalize_ledger({}))
+                for event in events:
+                    if event[0] == 'records':
+                        for record in event[1]:
+                            ledger.put(record)
+                    elif event[1] in ('categories', 'budgets', 'settings'):
+                        setattr(ledger, event[1], event[2])
+                # 补齐备份中缺失的类别/设置键（原地修改 ledger 上的字典）
+                normalize_ledger({'categories': ledger.categories, 'budgets': ledger.budgets, 'settings': ledger.settings})
+                self._write_snapshot(ledger)
+                self._invalidate()
+                return len(ledger.records), 0
+
+            existing = self._current().records
+            new_records, seen, sections, skipped = [], set(), {}, 0
+            for event in events:
+                if event[0] == 'records':
+                    for record in event[1]:
+                        if record['id'] in existing or record['id'] in seen:
+                            skipped += 1
+                            continue
+                        seen.add(record['id'])
+                        new_records.append(record)
+                else:
+                    sections[event[1]] = event[2]
+            categories, budgets = merge_meta(self.meta(), sections)
+            self.commit(add=new_records, categories=categories, budgets=budgets)
+            return len(new_records), skipped
+
+    def compact(self):
+        """把日志合并回快照"""
+        with self.lock:
+            self._write_snapshot(self._current())
+
+    def recover(self):
+        """启动时回放遗留的日志并合并进快照；快照格式与配置不同时顺便转换"""
+        with self.lock:
+            self._current()
+            if self._journal_entries:
+                logging.info(f"DIAGNOSTIC: Replayed {self._journal_entries} journal entries into '{self.data_file}'.")
+                self.compact()
+            elif self._disk_format() != self.snapshot_format:
+                logging.info(f"DIAGNOSTIC: Converting '{self.data_file}' to the {self.snapshot_format} snapshot format.")
+                self.compact()
+
+    def _disk_format(self):
+        with open(self.data_file, 'rb') as f:
+            return snapshot_format(f.read(64))
+
+
+class SqliteLedgerStore(BaseLedgerStore):
+    """SQLite 后端：记录按 date、(type, category, date) 和 id 建索引，
+    按月/日/年的筛选和“同日同类别合并”查询都走索引范围扫描。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT NOT NULL DEFAULT '',
+            date TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_records_date ON records (date);
+        CREATE INDEX IF NOT EXISTS idx_records_type_category_date ON records (type, category, date);
+        CREATE INDEX IF NOT EXISTS idx_records_date_id ON records (date, id);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+    COLUMNS = 'id, type, category, amount, description, date'
+
+    def __init__(self, db_file):
+        super().__init__(db_file + LOCK_SUFFIX)
+        self.db_file = db_file
+        self._local = threading.local()
+        self._revision = None
+        with self.lock, self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            if conn.execute("SELECT COUNT(*) FROM meta").fetchone()[0] == 0:
+                self._write_meta(conn, initial_ledger())
+            # ledger_id 标识这个数据库，revision 在每个写事务中加一，供其他进程发现数据已变化
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('ledger_id', ?)",
+                         (json.dumps(uuid.uuid4().hex[:8]),))
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', '0')")
+            self.ledger_id = json.loads(conn.execute("SELECT value FROM meta WHERE key = 'ledger_id'").fetchone()[0])
+
+    def _connect(self):
+        """每个线程使用自己的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # 文本筛选与 JSON 后端一致，按 Unicode casefold 比较（SQLite 自带的 lower() 只处理 ASCII）
+            conn.create_function('casefold', 1, lambda s: s.casefold() if s else s, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        self.lock.close()
+
+    @staticmethod
+    def _bump_revision(conn):
+        """在当前写事务中把 revision 加一，返回新值"""
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'revision'")
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0])
+
+    def _refresh(self):
+        # 其他进程提交过修改时，丢弃本进程内的汇总索引和报表缓存
+        revision = int(self._connect().execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0])
+        if revision != self._revision:
+            self._revision = revision
+            self._invalidate()
+
+    def version(self):
+        with self.lock:
+            self._refresh()
+            return f'{self.ledger_id}-{self._revision}', self.modified_at
+
+    @staticmethod
+    def _to_dict(row):
+        return {
+            'id': row['id'], 'type': row['type'], 'category': row['category'],
+            'amount': row['amount'], 'description': row['description'], 'date': row['date'],
+        }
+
+    def _query(self, sql, params=()):
+        return [self._to_dict(row) for row in self._connect().execute(sql, params)]
+
+    @staticmethod
+    def _write_meta(conn, data):
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, json.dumps(data[key], ensure_ascii=False))
+             for key in ('categories', 'budgets', 'settings') if data.get(key) is not None]
+        )
+
+    @staticmethod
+    def _insert_records(conn, records):
+        conn.executemany(
+            "INSERT OR REPLACE INTO records (id, type, category, amount, description, date) VALUES (?, ?, ?, ?, ?, ?)",
+            [(r['id'], r['type'], r['category'], r['amount'], r.get('description', ''), r['date']) for r in records]
+        )
+
+    def _fetch_by_ids(self, conn, ids, chunk_size=500):
+        """按 id 批量取记录（分块以避开 SQLite 的参数个数上限）"""
+        found = []
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = conn.execute(f"SELECT {self.COLUMNS} FROM records WHERE id IN ({placeholders})", chunk)
+            found.extend(self._to_dict(row) for row in rows)
+        return found
+
+    # --- 读取 ---
+
+    def meta(self):
+        values = {row['key']: json.loads(row['value'])
+                  for row in self._connect().execute("SELECT key, value FROM meta")}
+        data = normalize_ledger({
+            'categories': values.get('categories', {}),
+            'budgets': values.get('budgets', {}),
+            'settings': values.get('settings', {}),
+        })
+        del data['records']
+        return data
+
+    def get_record(self, record_id):
+        rows = self._query(f"SELECT {self.COLUMNS} FROM records WHERE id = ?", (record_id,))
+        return rows[0] if rows else None
+
+    def records_on(self, day):
+        return self._query(f"SELECT {self.COLUMNS} FROM records WHERE date = ? ORDER BY seq", (day,))
+
+    def records_in(self, prefix):
+        return self._query(
+            f"SELECT {self.COLUMNS} FROM records WHERE date >= ? AND date < ? ORDER BY seq",
+            (prefix, prefix_upper_bound(prefix))
+        )
+
+    def group_records(self, day, record_type, category):
+        return self._query(
+            f"SELECT {self.COLUMNS} FROM records WHERE type = ? AND category = ? AND date = ? ORDER BY seq",
+            (record_type, category, day)
+        )
+
+    def existing_ids(self, ids):
+        return {r['id'] for r in self._fetch_by_ids(self._connect(), list(ids))}
+
+    def iter_records(self, start=None, end=None, record_type=None, category=None):
+        conditions, params = [], []
+        for clause, value in (("date >= ?", start), ("date <= ?", end),
+                              ("type = ?", record_type), ("category = ?", category)):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        # 游标逐行读取，不会一次性把整张表载入内存
+        for row in self._connect().execute(f"SELECT {self.COLUMNS} FROM records{where} ORDER BY seq", params):
+            yield self._to_dict(row)
+
+    def query_page(self, start=None, end=None, record_type=None, category=None, text=None,
+                   after=None, limit=50, descending=True):
+        conditions, params = [], []
+        for clause, value in (("date >= ?", start), ("date <= ?", end),
+                              ("type = ?", record_type), ("category = ?", category)):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        if text:
+            conditions.append("(instr(casefold(description), ?) > 0 OR instr(casefold(category), ?) > 0)")
+            params.extend([text.casefold(), text.casefold()])
+        if after is not None:
+            conditions.append("(date, id) < (?, ?)" if descending else "(date, id) > (?, ?)")
+            params.extend(after)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        direction = "DESC" if descending else "ASC"
+        page = self._query(
+            f"SELECT {self.COLUMNS} FROM records{where} ORDER BY date {direction}, id {direction} LIMIT ?",
+            params + [limit + 1]
+        )
+        if len(page) > limit:
+            del page[limit:]
+            return page, (page[-1]['date'], page[-1]['id'])
+        return page, None
+
+    # --- 写入 ---
+
+    def commit(self, add=(), remove=(), categories=None, budgets=None, settings=None):
+        """在一个事务里完成一次修改"""
+        change = make_change(add, remove, categories, budgets, settings)
+        if change is None:
+            return
+        with self.lock:
+            conn = self._connect()
+            affected_ids = list(change.get('remove', [])) + [r['id'] for r in change.get('add', [])]
+            with conn:
+                removed = self._fetch_by_ids(conn, affected_ids)
+                if change.get('remove'):
+                    conn.executemany("DELETE FROM records WHERE id = ?", [(i,) for i in change['remove']])
+                if change.get('add'):
+                    self._insert_records(conn, change['add'])
+                self._write_meta(conn, change)
+                revision = self._bump_revision(conn)
+            # 先同步其他进程在此之前的修改，再增量应用本次修改
+            if revision != (self._revision or 0) + 1:
+                self._invalidate()
+            self._revision = revision
+            self._after_commit(change.get('add', []), removed)
+
+    def replace(self, data):
+        with self.lock:
+            data = normalize_ledger(data)
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM records")
+                self._insert_records(conn, data['records'])
+                self._write_meta(conn, data)
+                self._revision = self._bump_revision(conn)
+            self._invalidate()
+
+    def import_batches(self, events, mode='replace'):
+        with self.lock:
+            conn = self._connect()
+            imported = skipped = 0
+            sections = {}
+            # 整个导入在一个事务里完成，任一批出错都会整体回滚
+            with conn:
+                if mode == 'replace':
+                    conn.execute("DELETE FROM records")
+                for event in events:
+                    if event[0] != 'records':
+                        sections[event[1]] = event[2]
+                        continue
+                    if mode == 'replace':
+                        self._insert_records(conn, event[1])
+                        continue
+                    before = conn.total_changes
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO records (id, type, category, amount, description, date) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(r['id'], r['type'], r['category'], r['amount'], r['description'], r['date']) for r in event[1]]
+                    )
+                    added = conn.total_changes - before
+                    imported += added
+                    skipped += len(event[1]) - added
+                if mode == 'replace':
+                    imported = conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+                    meta = normalize_ledger({k: sections[k] for k in ('categories', 'budgets', 'settings') if k in sections})
+                else:
+                    meta = dict(zip(('categories', 'budgets'), merge_meta(self.meta(), sections)))
+                self._write_meta(conn, meta)
+                self._revision = self._bump_revision(conn)
+            self._invalidate()
+            return imported, skipped
+
+
+def partition_key(day):
+    """记录所在的分区（年份）；日期不规范的记录统一放在 0000 分区"""
+    year = day[:4]
+    return year if len(year) == 4 and year.isdigit() else '0000'
+
+
+def _partition_index(records=()):
+    return LedgerIndex({'records': records, 'categories': {}, 'budgets': {}, 'settings': {}})
+
+
+def _split_partitions(records):
+    """把记录按年份分到各自的分区索引中，同 id 的记录以最后一条为准"""
+    partitions, owners = {}, {}
+    for record in records:
+        key = partition_key(record['date'])
+        owner = owners.get(record['id'])
+        if owner is not None and owner != key:
+            partitions[owner].apply({'remove': [record['id']]})
+        owners[record['id']] = key
+        partition = partitions.get(key)
+        if partition is None:
+            partition = partitions[key] = _partition_index()
+        partition.put(record)
+    return partitions
+
+
+class PartitionedLedgerStore(BaseLedgerStore):
+    """按年分区的 JSON 存储：目录下每年一个分区文件，加上一个很小的 manifest.json。
+
+    清单保存类别、预算、设置，以及每个分区的文件名、记录数和按月汇总的金额，所以年份列表、
+    月/年合计和年度报表都不必读取分区；按日/月查询记录只加载所在年份的分区，其余年份
+    在第一次用到时才加载。记录在年份内保持录入顺序，跨年份按年份先后遍历。
+
+    分区文件写出后不再修改：一次修改先写出受影响年份的新文件，再原子地替换清单，
+    清单就是提交点，进程在任何时刻被杀掉，清单要么引用全部旧文件，要么引用全部新文件。
+    上一份清单保留为 .bak，它引用的分区文件也一并保留。
+    """
+
+    def __init__(self, data_dir, snapshot_format='json'):
+        super().__init__(data_dir + LOCK_SUFFIX)
+        self.data_dir = data_dir
+        # 写分区文件时使用的格式；读取时按内容自动识别，切换格式后各分区在下次写入时转换
+        self.snapshot_format = snapshot_format
+        self.manifest_file = os.path.join(data_dir, MANIFEST_FILENAME)
+        self.backup_file = self.manifest_file + BACKUP_SUFFIX
+        self._manifest = None
+        self._stamp = None
+        self._partitions = {}  # 已加载的分区：年份 → LedgerIndex
+
+    # --- 清单 ---
+
+    def _manifest_stamp(self):
+        # 清单总是整体替换，inode 随之变化；两次写入的 mtime 和大小恰好相同也能区分
+        try:
+            st = os.stat(self.manifest_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _parse_manifest(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('version') != MANIFEST_VERSION \
+                or not isinstance(data.get('partitions'), dict):
+            raise ValueError('not a ledger partition manifest')
+        normalize_ledger(data)
+        del data['records']
+        return data
+
+    def _read_manifest(self):
+        """读取清单；清单缺失或损坏时回退到上一份清单，两者都不可用时返回 None"""
+        try:
+            return self._parse_manifest(self.manifest_file)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, UnicodeDecodeError, ValueError) as e:
+            corrupt_path = f"{self.manifest_file}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            os.replace(self.manifest_file, corrupt_path)
+            logging.critical(f"FATAL: '{self.manifest_file}' is unreadable ({e}); moved aside to '{corrupt_path}'.")
+
+        try:
+            manifest = self._parse_manifest(self.backup_file)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, UnicodeDecodeError, ValueError) as e:
+            logging.critical(f"FATAL: Backup manifest '{self.backup_file}' is unreadable too: {e}")
+            return None
+        logging.warning(f"DIAGNOSTIC: Recovered ledger partitions from last good manifest '{self.backup_file}'.")
+        self._dump_manifest(manifest)
+        return manifest
+
+    def _rebuild_manifest(self):
+        """清单和备份都不可用时，按目录中每年修订号最大的分区文件重建清单（类别等恢复为默认值）"""
+        data = initial_ledger()
+        del data['records']
+        manifest = dict(data, version=MANIFEST_VERSION, revision=0, partitions={})
+        latest = {}
+        for name, key, revision in self._partition_files():
+            if revision > latest.get(key, (-1, None))[0]:
+                latest[key] = (revision, name)
+        for key, (revision, name) in latest.items():
+            manifest['partitions'][key] = self._partition_entry(name, self._read_partition(name))
+            manifest['revision'] = max(manifest['revision'], revision)
+        if latest:
+            logging.warning(f"DIAGNOSTIC: Rebuilt manifest for '{self.data_dir}' from {len(latest)} partition files.")
+        return manifest
+
+    def _dump_manifest(self, manifest, backup_path=None):
+        atomic_write(self.manifest_file,
+                     lambda f: json.dump(manifest, f, ensure_ascii=False, separators=(',', ':')), backup_path)
+
+    def _reload(self):
+        manifest = self._read_manifest() or self._rebuild_manifest()
+        before = self._manifest['partitions'] if self._manifest else {}
+        after = manifest['partitions']
+        # 文件名没变的分区内容也没变，继续使用已加载的索引
+        self._partitions = {
+            key: partition for key, partition in self._partitions.items()
+            if (after.get(key) or {}).get('file') == (before.get(key) or {}).get('file')
+        }
+        self._manifest = manifest
+        self._stamp = self._manifest_stamp()
+        self._invalidate()
+
+    def _current(self):
+        """返回内存中的清单，清单被其他进程替换时重新读取；调用方需持有 lock"""
+        if self._manifest is None or self._manifest_stamp() != self._stamp:
+            self._reload()
+        return self._manifest
+
+    def _discard_cache(self):
+        """写入失败后内存中的分区可能与磁盘不一致，全部丢弃，下次从磁盘重新读取"""
+        self._manifest = None
+        self._partitions = {}
+        self._invalidate()
+
+    # --- 分区 ---
+
+    def _partition_files(self):
+        """目录中的分区文件 [(文件名, 年份, 修订号)]"""
+        try:
+            names = os.listdir(self.data_dir)
+        except FileNotFoundError:
+            return []
+        return [(name, m.group(1), int(m.group(2))) for name, m in
+                ((name, PARTITION_FILE_RE.match(name)) for name in names) if m]
+
+    def _read_partition(self, name):
+        path = os.path.join(self.data_dir, name)
+        try:
+            return _partition_index(JsonLedgerStore._parse_file(path)['records'])
+        except (OSError, json.JSONDecodeError, UnicodeDecodeError, ValueError) as e:
+            # 不能当作空分区处理，否则下一次写入该年份时会丢掉其中的记录
+            logging.critical(f"FATAL: Ledger partition '{path}' is unreadable: {e}")
+            raise
+
+    @staticmethod
+    def _partition_entry(name, partition):
+        return {
+            'file': name,
+            'records': len(partition.records),
+            'months': AggregateIndex(partition.records.values()).month_cells(),
+        }
+
+    def _partition(self, key):
+        """某年的分区索引，尚未加载时才读取分区文件；调用方需持有 lock"""
+        entry = self._current()['partitions'].get(key)
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = self._read_partition(entry['file']) if entry else _partition_index()
+            if self._aggregates is not None:
+                self._aggregates.add_days(partition.records.values())
+        return partition
+
+    def _keys_between(self, start=None, end=None):
+        """日期区间 [start, end] 涉及的年份，升序"""
+        keys = sorted(self._current()['partitions'])
+        return [k for k in keys if (start is None or k >= start[:4]) and (end is None or k <= end[:4])]
+
+    def _locate(self, record_id, load=True):
+        """记录所在的年份：先查已加载的分区，找不到时（load 为真）再从新到旧逐个加载其余分区"""
+        self._current()
+        for key, partition in self._partitions.items():
+            if record_id in partition.records:
+                return key
+        if load:
+            for key in sorted(self._manifest['partitions'], reverse=True):
+                if key not in self._partitions and record_id in self._partition(key).records:
+                    return key
+        return None
+
+    def _load_all(self):
+        for key in self._current()['partitions']:
+            self._partition(key)
+
+    # --- 读取 ---
+
+    def load(self):
+        """返回账本的可修改副本（会加载全部年份）"""
+        data = self.meta()
+        data['records'] = [r.to_dict() for r in self.iter_records()]
+        return data
+
+    def meta(self):
+        with self.lock:
+            manifest = self._current()
+            return {
+                'categories': {k: list(v) for k, v in manifest['categories'].items()},
+                'budgets': dict(manifest['budgets']),
+                'settings': dict(manifest['settings']),
+            }
+
+    def get_record(self, record_id):
+        with self.lock:
+            key = self._locate(record_id)
+            return self._partitions[key].records[record_id] if key is not None else None
+
+    def records_on(self, day):
+        with self.lock:
+            return self._partition(partition_key(day)).day_records(day)
+
+    def records_in(self, prefix):
+        with self.lock:
+            return self._partition(partition_key(prefix)).between(prefix, prefix_upper_bound(prefix))
+
+    def group_records(self, day, record_type, category):
+        with self.lock:
+            return self._partition(partition_key(day)).group((day, record_type, category))
+
+    def existing_ids(self, ids):
+        with self.lock:
+            self._load_all()
+            return {i for i in ids if any(i in p.records for p in self._partitions.values())}
+
+    def iter_records(self, start=None, end=None, record_type=None, category=None):
+        # 只加载日期区间涉及的年份，在锁内取一份记录列表
+        with self.lock:
+            snapshot = []
+            for key in self._keys_between(start, end):
+                snapshot.extend(self._partition(key).records.values())
+        if start is None and end is None and record_type is None and category is None:
+            return iter(snapshot)
+        return (
+            r for r in snapshot
+            if (start is None or r['date'] >= start)
+            and (end is None or r['date'] <= end)
+            and (record_type is None or r['type'] == record_type)
+            and (category is None or r['category'] == category)
+        )
+
+    def query_page(self, start=None, end=None, record_type=None, category=None, text=None,
+                   after=None, limit=50, descending=True):
+        text = text.casefold() if text else None
+        with self.lock:
+            keys = self._keys_between(start, end)
+            if after is not None:
+                cursor = partition_key(after[0])
+                keys = [k for k in keys if (k <= cursor if descending else k >= cursor)]
+            page = []
+            # 按年份依次取，凑满一页（多取一条判断是否还有下一页）就不再加载更早/更晚的年份
+            for key in reversed(keys) if descending else keys:
+                for record in iter_sorted(self._partition(key), start, end, after, descending):
+                    if matches_filters(record, record_type, category, text):
+                        page.append(record)
+                        if len(page) > limit:
+                            break
+                if len(page) > limit:
+                    break
+        if len(page) > limit:
+            del page[limit:]
+            return page, (page[-1].date, page[-1].id)
+        return page, None
+
+    def _refresh(self):
+        self._current()
+
+    def _aggregate_index(self):
+        """月、年两级合计直接取自清单，“日”一级只汇总已加载的分区（加载新分区时补上）"""
+        manifest = self._current()
+        if self._aggregates is None:
+            aggregates = AggregateIndex()
+            for entry in manifest['partitions'].values():
+                for month, cells in entry['months'].items():
+                    for record_type, category, amount, count in cells:
+                        aggregates.add_month(month, (record_type, category), amount, count)
+            for partition in self._partitions.values():
+                aggregates.add_days(partition.records.values())
+            self._aggregates = aggregates
+        return self._aggregates
+
+    def period_summary(self, period):
+        with self.lock:
+            if len(period) == 10:
+                self._partition(partition_key(period))
+            return self._aggregate_index().summary(period)
+
+    def version(self):
+        # 版本标识取自清单文件，同一数据目录下的所有进程看到的版本一致
+        with self.lock:
+            self._current()
+            stamp = self._stamp
+        token = hashlib.sha1(repr(stamp).encode('utf-8')).hexdigest()[:16]
+        return token, stamp[1] / 1e9 if stamp else self.modified_at
+
+    # --- 写入 ---
+
+    def _write(self, partitions, meta=None, replace_all=False):
+        """写出 partitions（年份 → 分区索引）的新分区文件，再原子地替换清单；调用方需持有 lock。
+
+        replace_all 为真时新清单中只有这些分区。没有记录的分区从清单中移除。
+        """
+        previous = self._current()
+        revision = previous['revision'] + 1
+        manifest = dict(previous, revision=revision, partitions={} if replace_all else dict(previous['partitions']))
+        manifest.update(meta or {})
+        os.makedirs(self.data_dir, exist_ok=True)
+        for key, partition in partitions.items():
+            if not partition.records:
+                manifest['partitions'].pop(key, None)
+                continue
+            name = f'{key}-{revision}.json'
+            write_ledger_file(os.path.join(self.data_dir, name), partition, self.snapshot_format)
+            manifest['partitions'][key] = self._partition_entry(name, partition)
+        self._dump_manifest(manifest, backup_path=self.backup_file)
+        self._manifest = manifest
+        self._stamp = self._manifest_stamp()
+        self._collect_garbage(manifest, previous)
+
+    def _collect_garbage(self, *manifests):
+        """删除不再被 manifests（当前清单和备份清单）引用的分区文件，包括写入中断后遗留的文件"""
+        keep = {entry['file'] for manifest in manifests for entry in manifest['partitions'].values()}
+        for name, _, _ in self._partition_files():
+            if name not in keep:
+                try:
+                    os.remove(os.path.join(self.data_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def commit(self, add=(), remove=(), categories=None, budgets=None, settings=None):
+        """把一次修改写成受影响年份的新分区文件并替换清单。
+
+        add 中与已有记录同 id 的旧记录只在已加载的分区里查找（新记录的 id 都是新生成的）；
+        要替换其他年份中的记录，请同时把它的 id 放进 remove。
+        """
+        change = make_change(add, remove, categories, budgets, settings)
+        if change is None:
+            return
+        with self.lock:
+            adds, removes = {}, {}
+            for record in change.get('add', []):
+                adds.setdefault(partition_key(record['date']), []).append(record)
+            for key in adds:
+                self._partition(key)
+            for record_id in change.get('remove', []):
+                key = self._locate(record_id)
+                if key is not None:
+                    removes.setdefault(key, []).append(record_id)
+            for record in change.get('add', []):
+                key = self._locate(record['id'], load=False)
+                if key is not None:
+                    removes.setdefault(key, []).append(record['id'])
+
+            added, removed, touched = [], [], {}
+            try:
+                for key in set(adds) | set(removes):
+                    partition = touched[key] = self._partitions[key]
+                    partition_added, partition_removed = partition.apply(
+                        {'add': adds.get(key, []), 'remove': removes.get(key, [])})
+                    added.extend(partition_added)
+                    removed.extend(partition_removed)
+                self._write(touched, {k: change[k] for k in ('categories', 'budgets', 'settings') if k in change})
+            except BaseException:
+                self._discard_cache()
+                raise
+            self._after_commit(added, removed)
+
+    def _replace_all(self, partitions, meta):
+        try:
+            self._write(partitions, meta, replace_all=True)
+        except BaseException:
+            self._discard_cache()
+            raise
+        self._partitions = partitions
+        self._invalidate()
+
+    def replace(self, data):
+        """整体替换账本（导入备份时使用），全部年份写成新的分区文件"""
+        with self.lock:
+            data = normalize_ledger(data)
+            self._replace_all(_split_partitions(data['records']),
+                              {k: data[k] for k in ('categories', 'budgets', 'settings')})
+
+    def import_batches(self, events, mode='replace'):
+        with self.lock:
+            if mode == 'replace':
+                sections = {}
+
+                def records():
+                    for event in events:
+                        if event[0] == 'records':
+                            yield from event[1]
+                        elif event[1] in ('categories', 'budgets', 'settings'):
+                            sections[event[1]] = event[2]
+
+                partitions = _split_partitions(records())
+                meta = normalize_ledger(sections)
+                self._replace_all(partitions, {k: meta[k] for k in ('categories', 'budgets', 'settings')})
+                return sum(len(p.records) for p in partitions.values()), 0
+
+            self._load_all()
+            new_records, seen, sections, skipped = [], set(), {}, 0
+            for event in events:
+                if event[0] == 'records':
+                    for record in event[1]:
+                        if record['id'] in seen or self._locate(record['id'], load=False) is not None:
+                            skipped += 1
+                            continue
+                        seen.add(record['id'])
+                        new_records.append(record)
+                else:
+                    sections[event[1]] = event[2]
+            categories, budgets = merge_meta(self.meta(), sections)
+            self.commit(add=new_records, categories=categories, budgets=budgets)
+            return len(new_records), skipped
+
+    def recover(self):
+        """启动时读取清单，并清理上次写入中断后遗留的、没有被清单引用的分区文件"""
+        with self.lock:
+            manifest = self._current()
+            if self._stamp is None:
+                return
+            try:
+                previous = self._parse_manifest(self.backup_file)
+            except (OSError, json.JSONDecodeError, UnicodeDecodeError, ValueError):
+                previous = {'partitions': {}}
+            self._collect_garbage(manifest, previous)
+
+
+def _migrate_once(target, migrate):
+    """持有 target 旁的迁移锁执行 migrate()；拿到锁后 target 已存在（其他进程刚完成迁移）时
+    直接返回 None，否则返回 migrate() 的结果"""
+    lock = LedgerLock(target + MIGRATION_LOCK_SUFFIX)
+    try:
+        with lock:
+            if os.path.exists(target):
+                return None
+            return migrate()
+    finally:
+        lock.close()
+
+
+def migrate_json_to_sqlite(json_file, db_file):
+    """一次性把 data.json（含未合并的日志）迁移到 SQLite 数据库，返回迁移的记录数；
+    其他进程已经完成迁移时返回 None"""
+    return _migrate_once(db_file, lambda: _migrate_json_to_sqlite(json_file, db_file))
+
+
+def _migrate_json_to_sqlite(json_file, db_file):
+    data = JsonLedgerStore(json_file).load()
+    # 先写到同目录下的临时数据库再改名，迁移中途被打断不会留下半个数据库
+    fd, tmp_file = tempfile.mkstemp(prefix=os.path.basename(db_file) + '.migrating-',
+                                    dir=os.path.dirname(os.path.abspath(db_file)))
+    os.close(fd)
+    try:
+        target = SqliteLedgerStore(tmp_file)
+        try:
+            target.replace(data)
+        finally:
+            target.close()
+        os.replace(tmp_file, db_file)
+    finally:
+        for leftover in (tmp_file, tmp_file + '-wal', tmp_file + '-shm', tmp_file + LOCK_SUFFIX):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    _fsync_dir(db_file)
+    logging.info(f"DIAGNOSTIC: Migrated {len(data['records'])} records from '{json_file}' to '{db_file}'.")
+    return len(data['records'])
+
+
+def migrate_json_to_partitions(json_file, partitions_dir, snapshot_format='json'):
+    """一次性把 data.json（含未合并的日志）按年份拆分到 partitions_dir，返回迁移的记录数；
+    其他进程已经完成迁移时返回 None"""
+    return _migrate_once(partitions_dir,
+                         lambda: _migrate_json_to_partitions(json_file, partitions_dir, snapshot_format))
+
+
+def _migrate_json_to_partitions(json_file, partitions_dir, snapshot_format):
+    data = JsonLedgerStore(json_file).load()
+    # 先写到临时目录再改名，迁移中途被打断不会留下半个分区目录
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(partitions_dir) + '.migrating-',
+                               dir=os.path.dirname(os.path.abspath(partitions_dir)))
+    try:
+        PartitionedLedgerStore(tmp_dir, snapshot_format).replace(data)
+        os.rename(tmp_dir, partitions_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    finally:
+        if os.path.exists(tmp_dir + LOCK_SUFFIX):
+            os.remove(tmp_dir + LOCK_SUFFIX)
+    _fsync_dir(partitions_dir)
+    logging.info(f"DIAGNOSTIC: Migrated {len(data['records'])} records from '{json_file}' to '{partitions_dir}'.")
+    return len(data['records'])
+
+
+def open_ledger_store(backend, data_dir, snapshot_format='json'):
+    """按配置创建存储后端；首次切换到 SQLite 或按年分区时自动从已有的 data.json 迁移。
+    snapshot_format 对 json 和 partitioned 后端有效：json 为缩进的 JSON，compact 为紧凑快照。"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ledger backend '{backend}', expected one of {BACKENDS}")
+    if snapshot_format not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format '{snapshot_format}', expected one of {SNAPSHOT_FORMATS}")
+    json_file = os.path.join(data_dir, DATA_FILENAME)
+    if backend == 'json':
+        return JsonLedgerStore(json_file, snapshot_format=snapshot_format)
+    if backend == 'partitioned':
+        partitions_dir = os.path.join(data_dir, PARTITIONS_DIRNAME)
+        if not os.path.exists(partitions_dir) and os.path.exists(json_file):
+            migrate_json_to_partitions(json_file, partitions_dir, snapshot_format)
+        return PartitionedLedgerStore(partitions_dir, snapshot_format)
+
+    db_file = os.path.join(data_dir, SQLITE_FILENAME)
+    if not os.path.exists(db_file) and os.path.exists(json_file):
+        migrate_json_to_sqlite(json_file, db_file)
+    return SqliteLedgerStore(db_file)
@@ -0,0 +1,376 @@
+# 文件: sync.py (实例之间的增量同步：记录级变更日志、合并规则和对端客户端)
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+from jsonstream import LedgerFormatError, validate_meta, validate_record
+from records import Record
+from storage import initial_ledger
+
+SYNC_FILENAME = 'sync.db'
+SYNC_PAGE_SIZE = 500  # 每次拉取/推送的最大变更条数
+# 类别、预算、设置各自作为一条变更，id 为 'meta:categories' 等
+META_SECTIONS = ('categories', 'budgets', 'settings')
+META_PREFIX = 'meta:'
+# 对端变更的 updated_at 最多允许比本机时间超前这么多秒；更远的未来时间戳会让本机的时钟一直停在那里
+MAX_CLOCK_SKEW = 300
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def _record_body(record):
+    """记录的规范 JSON（金额按“分”取整），用来判断记录是否变化"""
+    return _dumps(Record.from_dict(record).to_dict())
+
+
+class ChangeLog:
+    """记录级的变更日志（SQLite）。
+
+    changes 表中每个记录 id（以及类别、预算、设置）只保留最新状态的一行：修改时删除旧行、
+    插入新行，所以 seq 单调递增，“某个 seq 之后的变更”就是需要同步的全部差异。
+    删除的记录保留为墓碑（deleted = 1），使删除也能传播到其他实例。
+
+    updated_at 取自混合时钟：不早于本机时间，也不早于见过的任何变更，
+    收到对端较新的修改后，本机随后的修改仍然排在它后面。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            updated_at REAL NOT NULL,
+            origin TEXT NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            body TEXT
+        );
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            # replica 标识这份日志；日志被删除重建后标识改变，对端据此从头同步
+            conn.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('replica', ?)",
+                         (json.dumps(uuid.uuid4().hex[:12]),))
+        self.replica = self.get_state('replica')
+
+    def _connect(self):
+        """每个线程使用自己的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_state(self, key, default=None):
+        row = self._connect().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    @staticmethod
+    def _set_state(conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def set_state(self, key, value):
+        with self._connect() as conn:
+            self._set_state(conn, key, value)
+
+    def _tick(self, conn, seen=0.0):
+        """混合时钟的下一个时间戳（在写事务中调用）。
+        比上一个时间戳至少大一个可表示的浮点数：时间戳很大时加上固定的小数可能不改变它的值"""
+        row = conn.execute("SELECT value FROM state WHERE key = 'clock'").fetchone()
+        clock = max(time.time(), math.nextafter(json.loads(row[0]) if row else 0.0, math.inf), seen)
+        self._set_state(conn, 'clock', clock)
+        return clock
+
+    @staticmethod
+    def _put(conn, change_id, updated_at, origin, body):
+        conn.execute("INSERT OR REPLACE INTO changes (id, updated_at, origin, deleted, body) VALUES (?, ?, ?, ?, ?)",
+                     (change_id, updated_at, origin, int(body is None), body))
+
+    def latest_seq(self):
+        return self._connect().execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def rows(self, ids):
+        """{id: (updated_at, origin, deleted)}，只包含日志中已有的 id"""
+        conn, result, ids = self._connect(), {}, list(ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            result.update(
+                (row[0], row[1:]) for row in conn.execute(
+                    f"SELECT id, updated_at, origin, deleted FROM changes WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        return result
+
+    # --- 写入 ---
+
+    def mark_dirty(self):
+        """修改账本之前调用；修改写入日志后清除。进程在两者之间退出时，启动后据此重新对账"""
+        self.set_state('dirty', True)
+
+    def is_dirty(self):
+        # 从未对账过（刚启用同步）也视为需要对账
+        return self.get_state('dirty', True)
+
+    def record_local(self, add=(), remove=(), meta=None):
+        """记下本机的一次修改（与 commit() 的参数相同）"""
+        with self._connect() as conn:
+            now = self._tick(conn)
+            for record_id in remove:
+                self._put(conn, record_id, now, self.replica, None)
+            for record in add:
+                self._put(conn, record['id'], now, self.replica, _record_body(record))
+            for section, value in (meta or {}).items():
+                self._put(conn, META_PREFIX + section, now, self.replica, _dumps(value))
+            self._set_state(conn, 'dirty', False)
+
+    def record_remote(self, changes):
+        """记下已合并进账本的对端变更，保留其原始的时间戳和来源"""
+        with self._connect() as conn:
+            self._tick(conn, max((c['updated_at'] for c in changes), default=0.0))
+            for change in changes:
+                if change['deleted']:
+                    body = None
+                elif change['id'].startswith(META_PREFIX):
+                    body = _dumps(change['data'])
+                else:
+                    body = _record_body(change['data'])
+                self._put(conn, change['id'], change['updated_at'], change['origin'], body)
+            self._set_state(conn, 'dirty', False)
+
+    def reconcile(self, store):
+        """把日志与账本的当前内容对齐，返回补记的变更条数。
+
+        用于首次启用同步、整体导入备份之后，以及上次修改账本与写日志之间被中断的情况。
+        """
+        conn = self._connect()
+        live = dict(conn.execute("SELECT id, body FROM changes WHERE deleted = 0"))
+        meta = store.meta()
+        changed = 0
+        with conn:
+            now = self._tick(conn)
+            for record in store.iter_records():
+                body = _record_body(record)
+                if live.pop(record['id'], None) != body:
+                    self._put(conn, record['id'], now, self.replica, body)
+                    changed += 1
+            defaults = initial_ledger()
+            for section in META_SECTIONS:
+                body = _dumps(meta[section])
+                if live.pop(META_PREFIX + section, None) != body:
+                    # 未修改过的默认值记为最旧，新设备首次同步时不会覆盖对端已有的类别和预算
+                    updated_at = 0.0 if meta[section] == defaults[section] else now
+                    self._put(conn, META_PREFIX + section, updated_at, self.replica, body)
+                    changed += 1
+            # 日志中还在、账本里已经没有的记录
+            for record_id in live:
+                self._put(conn, record_id, now, self.replica, None)
+                changed += 1
+            self._set_state(conn, 'dirty', False)
+        return changed
+
+    # --- 读取 ---
+
+    def changes_since(self, since, exclude_origin=None, limit=SYNC_PAGE_SIZE):
+        """seq 大于 since 的变更，返回 (变更列表, 下一次的 since, 是否还有更多)。
+
+        exclude_origin 为请求方自己的 replica，来自它的变更不必再发回去。
+        """
+        rows = self._connect().execute(
+            "SELECT seq, id, updated_at, origin, deleted, body FROM changes WHERE seq > ? ORDER BY seq LIMIT ?",
+            (since, limit)).fetchall()
+        changes = [
+            {'id': change_id, 'updated_at': updated_at, 'origin': origin, 'deleted': bool(deleted),
+             'data': None if deleted else json.loads(body)}
+            for _, change_id, updated_at, origin, deleted, body in rows if origin != exclude_origin
+        ]
+        return changes, rows[-1][0] if rows else since, len(rows) == limit
+
+
+def _validate_change(change):
+    """检查对端推送的一条变更，返回规范化后的变更；格式不对时抛出 LedgerFormatError"""
+    if not isinstance(change, dict) or not isinstance(change.get('id'), str) or not change['id'] \
+            or not isinstance(change.get('origin'), str) \
+            or isinstance(change.get('updated_at'), bool) or not isinstance(change.get('updated_at'), (int, float)) \
+            or not math.isfinite(change['updated_at']):
+        raise LedgerFormatError('变更缺少有效的 id、origin 或 updated_at')
+    if change['updated_at'] > time.time() + MAX_CLOCK_SKEW:
+        raise LedgerFormatError(f"变更 '{change['id']}' 的 updated_at 超前本机时间过多，请检查两台设备的时钟")
+    deleted = bool(change.get('deleted'))
+    data = change.get('data')
+    if change['id'].startswith(META_PREFIX):
+        section = change['id'][len(META_PREFIX):]
+        if section not in META_SECTIONS or deleted:
+            raise LedgerFormatError(f"无效的设置变更 '{change['id']}'")
+        # 类别、预算、设置会原样替换本机的对应部分，结构不对会让首页和设置页都无法显示
+        data = validate_meta(section, data)
+    elif not deleted:
+        data = validate_record(data, 0)
+        if data['id'] != change['id']:
+            raise LedgerFormatError('变更的 id 与记录的 id 不一致')
+    return {'id': change['id'], 'updated_at': float(change['updated_at']), 'origin': change['origin'],
+            'deleted': deleted, 'data': None if deleted else data}
+
+
+class LedgerSync:
+    """让账本的修改同时写入变更日志，并按“最后修改者优先”合并其他实例的变更。
+
+    构造时替换存储实例上的 commit/replace/import_batches（类本身不变）。同一条记录
+    以 (updated_at, origin) 较大的一方为准；本应用编辑记录时会换成新的 id，所以两边同时
+    编辑同一条记录时，两条新记录都会保留，旧记录在两边都被删除。
+    """
+
+    def __init__(self, store, db_file):
+        self.store = store
+        self.log = ChangeLog(db_file)
+        self._commit = store.commit
+        self._replace = store.replace
+        self._import_batches = store.import_batches
+        store.commit = self.commit
+        store.replace = self.replace
+        store.import_batches = self.import_batches
+
+    # --- 本机的修改 ---
+
+    def commit(self, add=(), remove=(), categories=None, budgets=None, settings=None):
+        add, remove = list(add), list(remove)
+        meta = {k: v for k, v in zip(META_SECTIONS, (categories, budgets, settings)) if v is not None}
+        with self.store.lock:
+            self.log.mark_dirty()
+            self._commit(add=add, remove=remove, **meta)
+            self.log.record_local(add, remove, meta)
+
+    def replace(self, data):
+        with self.store.lock:
+            self.log.mark_dirty()
+            self._replace(data)
+            self.log.reconcile(self.store)
+
+    def import_batches(self, events, mode='replace'):
+        with self.store.lock:
+            self.log.mark_dirty()
+            result = self._import_batches(events, mode)
+            self.log.reconcile(self.store)
+            return result
+
+    def recover(self):
+        """启动时调用：首次启用同步或上次写日志被中断时，把日志与账本对齐"""
+        with self.store.lock:
+            if self.log.is_dirty():
+                changed = self.log.reconcile(self.store)
+                logging.info(f"DIAGNOSTIC: Reconciled sync change log with the ledger ({changed} changes).")
+
+    # --- 与对端交换变更 ---
+
+    def changes_since(self, since, exclude_origin=None, limit=SYNC_PAGE_SIZE):
+        self.recover()
+        return self.log.changes_since(since, exclude_origin, limit)
+
+    def apply(self, changes):
+        """合并对端的变更，返回 {'applied': 条数, 'skipped': 条数, 'errors': [...]}。
+
+        本地同一 id 的状态更新（或相同）时跳过；一批变更在一次 commit() 中写入账本。
+        """
+        accepted, errors = [], []
+        for index, change in enumerate(changes):
+            try:
+                accepted.append(_validate_change(change))
+            except LedgerFormatError as e:
+                errors.append({'index': index, 'error': str(e)})
+        with self.store.lock:
+            self.recover()
+            local = self.log.rows(c['id'] for c in accepted)
+            latest = {}
+            for change in accepted:
+                state = local.get(change['id'])
+                if state is not None and (change['updated_at'], change['origin']) <= state[:2]:
+                    continue
+                previous = latest.get(change['id'])
+                if previous is None or (change['updated_at'], change['origin']) > (previous['updated_at'], previous['origin']):
+                    latest[change['id']] = change
+            winners = list(latest.values())
+            if winners:
+                add, remove, meta = [], [], {}
+                for change in winners:
+                    if change['id'].startswith(META_PREFIX):
+                        meta[change['id'][len(META_PREFIX):]] = change['data']
+                        continue
+                    # 日志与账本一致：日志中未删除的 id 就是账本里已有的记录，更新前先删除旧记录
+                    state = local.get(change['id'])
+                    if state is not None and not state[2]:
+                        remove.append(change['id'])
+                    if not change['deleted']:
+                        add.append(change['data'])
+                self.log.mark_dirty()
+                self._commit(add=add, remove=remove, **meta)
+                self.log.record_remote(winners)
+        return {'applied': len(winners), 'skipped': len(accepted) - len(winners), 'errors': errors}
+
+    def peers(self):
+        """同步过的对端 {url: 状态}"""
+        return self.log.get_state('peers', {})
+
+    def sync_with(self, url, token=None, timeout=30):
+        """与 url 处的另一个实例双向同步：先拉取并合并对端的新变更，再推送本机的新变更。
+
+        每个对端的进度（对端 replica、已拉取到的对端 seq、已推送到的本地 seq）保存在日志中，
+        之后只传输差异；对端的日志被重建时自动从头同步。返回拉取和推送的条数。
+        """
+        url = url.rstrip('/')
+        peers = self.peers()
+        peer = peers.get(url) or {'replica': None, 'pulled': 0, 'pushed': 0}
+        pulled = pushed = applied = 0
+        while True:
+            query = urllib.parse.urlencode({'since': peer['pulled'], 'replica': self.log.replica})
+            page = _request(f'{url}/sync?{query}', token, timeout=timeout)
+            if page['replica'] != peer['replica']:
+                # 第一次同步，或对端的日志已重建：双方都从头开始
+                restart = peer['pulled'] != 0
+                peer = {'replica': page['replica'], 'pulled': 0, 'pushed': 0}
+                if restart:
+                    continue
+            result = self.apply(page['changes'])
+            pulled += len(page['changes'])
+            applied += result['applied']
+            peer['pulled'] = page['next']
+            if not page['more']:
+                break
+        while True:
+            changes, last, more = self.log.changes_since(peer['pushed'], exclude_origin=peer['replica'])
+            if changes:
+                _request(f'{url}/sync', token, {'replica': self.log.replica, 'changes': changes}, timeout=timeout)
+                pushed += len(changes)
+            peer['pushed'] = last
+            if not more:
+                break
+        peers = self.peers()
+        peers[url] = dict(peer, synced_at=time.time())
+        self.log.set_state('peers', peers)
+        logging.info(f"DIAGNOSTIC: Synced with '{url}': pulled {pulled} changes ({applied} applied), pushed {pushed}.")
+        return {'pulled': pulled, 'applied': applied, 'pushed': pushed}
+
+
+def _request(url, token=None, body=None, timeout=30):
+    """向对端发送 GET（body 为 None）或 JSON POST 请求，返回解析后的 JSON"""
+    headers = {'Accept': 'application/json'}
+    data = None
+    if body is not None:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=timeout) as response:
+        return json.loads(response.read())
@@ -0,0 +1,7 @@
+# 文件: wsgi.py (生产环境的 WSGI 入口，例如: gunicorn -c gunicorn.conf.py wsgi:app)
+from app import app, start_background_warmup
+
+# 每个 worker 进程加载本模块后即可接受请求，账本和模板在后台预热
+start_background_warmup()
+
+application = app
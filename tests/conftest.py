@@ -0,0 +1,18 @@
+# 文件: tests/conftest.py (让测试可以直接导入 src_py 下的模块)
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py')
+sys.path.insert(0, os.path.abspath(SRC_DIR))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    """使用 tmp_path 作为数据目录的应用模块：每个测试重新初始化存储，不与其他测试共享账本"""
+    monkeypatch.setenv('LEDGER_DATA_DIR', str(tmp_path))
+    import app
+    monkeypatch.setattr(app, '_env_initialized', False)
+    app._initialize_app_env()
+    return app
@@ -0,0 +1,108 @@
+# 文件: tests/test_aggregates.py
+# 随机增删改序列下，增量维护的汇总索引与逐条记录暴力重算的结果一致。
+import random
+import uuid
+from collections import defaultdict
+
+import pytest
+
+from aggregates import AggregateIndex, category_totals, type_total
+from storage import BACKENDS, open_ledger_store
+
+CATEGORIES = {'expense': ['餐饮', '交通', '购物'], 'income': ['工资', '奖金']}
+DAYS = ['2023-12-31', '2024-01-01', '2024-01-15', '2024-02-29', '2024-12-31', '2025-01-01']
+
+
+def _random_record(rng):
+    record_type = rng.choice(list(CATEGORIES))
+    return {
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'type': record_type,
+        'category': rng.choice(CATEGORIES[record_type]),
+        'amount': rng.randint(1, 100000) / 100,
+        'description': '',
+        'date': rng.choice(DAYS),
+    }
+
+
+def _random_operation(rng, records):
+    """返回 (add, remove)：新增一条、编辑一条（删除旧记录并换成新 id 的记录），或删除一条/同日同类别的一组"""
+    action = rng.random() if records else 0
+    if action < 0.5:
+        return [_random_record(rng)], []
+    victim = rng.choice(list(records.values()))
+    if action < 0.8:
+        edited = dict(_random_record(rng), type=victim['type'], category=victim['category'])
+        if rng.random() < 0.5:
+            edited['date'] = victim['date']
+        return [edited], [victim['id']]
+    group = [r['id'] for r in records.values()
+             if (r['date'], r['type'], r['category']) == (victim['date'], victim['type'], victim['category'])]
+    return [], group
+
+
+def _brute_force(records, period):
+    totals = defaultdict(float)
+    for r in records.values():
+        if r['date'].startswith(period):
+            totals[(r['type'], r['category'])] += r['amount']
+    return dict(totals)
+
+
+def _periods():
+    return sorted({day[:n] for day in DAYS for n in (10, 7, 4)} | {'2024-03', '2022'})
+
+
+def _assert_matches(summary, expected):
+    assert set(summary) == set(expected)
+    for key, amount in expected.items():
+        assert summary[key] == pytest.approx(amount, abs=1e-6)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_aggregate_index_matches_brute_force(seed):
+    rng = random.Random(seed)
+    records, index = {}, AggregateIndex()
+    for _ in range(300):
+        add, remove = _random_operation(rng, records)
+        for record_id in remove:
+            index.remove(records.pop(record_id))
+        for record in add:
+            records[record['id']] = record
+            index.add(record)
+    for period in _periods():
+        _assert_matches(index.summary(period), _brute_force(records, period))
+    assert index.years() == sorted({r['date'][:4] for r in records.values()}, reverse=True)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_store_summaries_match_brute_force(tmp_path, backend):
+    rng = random.Random(backend)
+    store = open_ledger_store(backend, str(tmp_path))
+    store.recover()
+    records = {}
+    for step in range(200):
+        add, remove = _random_operation(rng, records)
+        store.commit(add=add, remove=remove)
+        for record_id in remove:
+            del records[record_id]
+        for record in add:
+            records[record['id']] = record
+        # 隔一段时间查询一次：既覆盖“首次查询时建立索引”，也覆盖之后的增量更新
+        if step % 40 == 0:
+            month = rng.choice(DAYS)[:7]
+            _assert_matches(store.period_summary(month), _brute_force(records, month))
+
+    for period in _periods():
+        summary, expected = store.period_summary(period), _brute_force(records, period)
+        _assert_matches(summary, expected)
+        for record_type in CATEGORIES:
+            assert type_total(summary, record_type) == pytest.approx(
+                sum(a for (t, _), a in expected.items() if t == record_type), abs=1e-6)
+            assert set(category_totals(summary, record_type)) == {c for (t, c) in expected if t == record_type}
+    assert store.years() == sorted({r['date'][:4] for r in records.values()}, reverse=True)
+
+    # 重新打开（索引从磁盘上的记录重建）后结果不变
+    reopened = open_ledger_store(backend, str(tmp_path))
+    for period in _periods():
+        _assert_matches(reopened.period_summary(period), _brute_force(records, period))
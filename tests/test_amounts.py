@@ -0,0 +1,31 @@
+# 文件: tests/test_amounts.py
+# 金额按“分”存储：不足一分或超过两位小数的金额在各个入口都被拒绝，而不是被悄悄舍去。
+import pytest
+
+from jsonstream import LedgerFormatError, validate_record
+
+RECORD = {'id': 'a', 'type': 'expense', 'category': '餐饮', 'description': '', 'date': '2024-01-02'}
+
+
+@pytest.mark.parametrize('amount', [0.01, 0.29, 12, 99999999.99])
+def test_validate_record_accepts_cents(amount):
+    assert validate_record(dict(RECORD, amount=amount), 0)['amount'] == amount
+
+
+@pytest.mark.parametrize('amount', [0.004, 1e-05, 1.005, 0, -1])
+def test_validate_record_rejects_sub_cent_amounts(amount):
+    with pytest.raises(LedgerFormatError):
+        validate_record(dict(RECORD, amount=amount), 0)
+
+
+def test_csv_row_rejects_sub_cent_amount(app_module):
+    row = ['', '支出', '餐饮', '0.004', '', '2024-01-02']
+    with pytest.raises(ValueError):
+        app_module._parse_csv_row(row)
+    assert app_module._parse_csv_row(row[:3] + ['1.50'] + row[4:])['amount'] == 1.5
+
+
+def test_add_record_rejects_sub_cent_amount(app_module):
+    client = app_module.app.test_client()
+    client.post('/add_record', data={'type': 'expense', 'category': '餐饮', 'amount': '0.004', 'date': '2024-01-02'})
+    assert list(app_module.ledger_store.iter_records()) == []
@@ -0,0 +1,25 @@
+# 文件: tests/test_batch.py
+# POST /api/records/batch：JSON 中的金额必须是数字，布尔值、字符串、null 都按无效记录跳过。
+import pytest
+
+ITEM = {'type': 'expense', 'category': '餐饮', 'description': '', 'date': '2024-01-02'}
+
+
+@pytest.mark.parametrize('amount', [True, False, '12.5', None, [1], {'v': 1}, 'inf'])
+def test_non_numeric_amounts_are_rejected(app_module, amount):
+    client = app_module.app.test_client()
+    response = client.post('/api/records/batch', json=[dict(ITEM, amount=amount)])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['added'] == 0 and body['failed'] == 1
+    assert 'error' in body['results'][0]
+    assert list(app_module.ledger_store.iter_records()) == []
+
+
+def test_valid_and_invalid_items_in_one_batch(app_module):
+    client = app_module.app.test_client()
+    items = [dict(ITEM, amount=12.5), dict(ITEM, amount=True), dict(ITEM, amount=3), dict(ITEM, amount='3')]
+    body = client.post('/api/records/batch', json=items).get_json()
+    assert (body['added'], body['failed']) == (2, 2)
+    assert [('id' in r) for r in body['results']] == [True, False, True, False]
+    assert sorted(r['amount'] for r in app_module.ledger_store.iter_records()) == [3, 12.5]
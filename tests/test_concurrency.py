@@ -0,0 +1,82 @@
+# 文件: tests/test_concurrency.py
+# 并发 add_record 压力测试：多个线程、多个进程（模拟 gunicorn 的多个 worker）同时向同一个数据目录添加记录，
+# 结束后从磁盘重新打开账本，检查一条记录都没有丢失。
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from storage import BACKENDS, open_ledger_store
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src_py')
+
+RECORDS_PER_THREAD = 25
+
+
+def _post_records(data_dir, backend, worker, threads):
+    """在子进程中运行：导入应用，用 threads 个线程各自提交 RECORDS_PER_THREAD 次 add_record"""
+    import sys
+    sys.path.insert(0, SRC_DIR)
+    os.environ['LEDGER_DATA_DIR'] = data_dir
+    os.environ['LEDGER_BACKEND'] = backend
+    import app as app_module
+
+    errors = []
+    start = threading.Barrier(threads)
+
+    def run(thread):
+        client = app_module.app.test_client()
+        start.wait()
+        for i in range(RECORDS_PER_THREAD):
+            response = client.post('/add_record', data={
+                'type': 'expense', 'category': '餐饮', 'amount': '1.5',
+                'description': f'w{worker}-t{thread}-{i}', 'date': '2024-05-01',
+            })
+            if response.status_code != 302:
+                errors.append(response.status_code)
+
+    workers = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    if errors:
+        raise SystemExit(f'unexpected responses: {errors[:5]}')
+
+
+def _run_workers(data_dir, backend, processes, threads):
+    # spawn：每个子进程都重新导入应用，和独立启动的 worker 进程一样各自持有存储对象
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=_post_records, args=(data_dir, backend, w, threads))
+               for w in range(processes)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(timeout=300)
+    assert all(p.exitcode == 0 for p in workers)
+    return {
+        f'w{w}-t{t}-{i}'
+        for w in range(processes) for t in range(threads) for i in range(RECORDS_PER_THREAD)
+    }
+
+
+def _stored_descriptions(data_dir, backend):
+    store = open_ledger_store(backend, data_dir)
+    return [r['description'] for r in store.iter_records()]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_parallel_threads_lose_no_records(tmp_path, backend):
+    expected = _run_workers(str(tmp_path), backend, processes=1, threads=8)
+    stored = _stored_descriptions(str(tmp_path), backend)
+    assert len(stored) == len(expected)
+    assert set(stored) == expected
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_parallel_processes_lose_no_records(tmp_path, backend):
+    expected = _run_workers(str(tmp_path), backend, processes=4, threads=2)
+    stored = _stored_descriptions(str(tmp_path), backend)
+    assert len(stored) == len(expected)
+    assert set(stored) == expected
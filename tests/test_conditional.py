@@ -0,0 +1,11 @@
+# 文件: tests/test_conditional.py
+# 只读页面的条件请求：If-Modified-Since 等于 Last-Modified 时返回 304。
+
+
+def test_if_modified_since_equal_to_last_modified(app_module):
+    client = app_module.app.test_client()
+    first = client.get('/records')
+    assert first.status_code == 200
+    last_modified = first.headers['Last-Modified']
+    assert client.get('/records', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get('/records', headers={'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'}).status_code == 200
@@ -0,0 +1,51 @@
+# 文件: tests/test_import.py
+# 导入 JSON 备份：类别、预算、设置结构不对的文件在整体替换和合并两种模式下都被拒绝，账本保持不变。
+import io
+import json
+
+import pytest
+
+from jsonstream import LedgerFormatError, iter_ledger_json
+from storage import BACKENDS, open_ledger_store
+
+RECORD = {'id': 'a', 'type': 'expense', 'category': '餐饮', 'amount': 1.5, 'description': '', 'date': '2024-01-02'}
+BAD_META = [
+    {'categories': {'expense': '交通'}, 'budgets': {}},
+    {'categories': {'expense': ['交通'], 'income': []}, 'budgets': {'交通': 'abc'}},
+    {'categories': {'expense': [], 'income': [], 'transfer': []}, 'budgets': {}},
+    {'categories': {'expense': [], 'income': []}, 'budgets': {}, 'settings': {'keep_last_date': 'yes'}},
+]
+
+
+def _backup(**sections):
+    return io.BytesIO(json.dumps(dict({'records': [RECORD]}, **sections), ensure_ascii=False).encode('utf-8'))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('mode', ['replace', 'merge'])
+@pytest.mark.parametrize('sections', BAD_META)
+def test_invalid_meta_is_rejected(tmp_path, backend, mode, sections):
+    store = open_ledger_store(backend, str(tmp_path))
+    store.recover()
+    before = store.meta()
+    with pytest.raises(LedgerFormatError):
+        store.import_batches(iter_ledger_json(_backup(**sections)), mode=mode)
+    assert store.meta() == before
+    assert store.get_record('a') is None
+
+
+def test_categories_missing_a_type_are_filled_in(tmp_path):
+    store = open_ledger_store('json', str(tmp_path))
+    store.recover()
+    store.import_batches(iter_ledger_json(_backup(categories={'expense': ['交通']}, budgets={})), mode='merge')
+    assert '交通' in store.meta()['categories']['expense']
+    assert store.meta()['categories']['income']
+
+
+def test_import_with_string_category_list_keeps_index_working(app_module):
+    client = app_module.app.test_client()
+    backup = _backup(categories={'expense': '交通'}, budgets={'交通': 'abc'})
+    response = client.post('/import_json', data={'json_file': (backup, 'backup.json'), 'mode': 'merge'})
+    assert response.status_code == 302
+    assert client.get('/').status_code == 200
+    assert '交' not in app_module.ledger_store.meta()['categories']['expense']
@@ -0,0 +1,71 @@
+# 文件: tests/test_journal.py
+# JSON 后端追加日志的恢复：写入时被中断的最后一行、中间损坏的行都不能让之后提交的记录丢失。
+import json
+import os
+
+from storage import CORRUPT_SUFFIX, DATA_FILENAME, JOURNAL_SUFFIX, open_ledger_store
+
+
+def _record(record_id, day='2024-01-02'):
+    return {'id': record_id, 'type': 'expense', 'category': '餐饮', 'amount': 1.5, 'description': '', 'date': day}
+
+
+def _journal(data_dir):
+    return os.path.join(data_dir, DATA_FILENAME + JOURNAL_SUFFIX)
+
+
+def _fresh_store(tmp_path):
+    store = open_ledger_store('json', str(tmp_path))
+    store.recover()
+    return store
+
+
+def test_commit_after_torn_last_line_survives_reopen(tmp_path):
+    _fresh_store(tmp_path)
+    with open(_journal(tmp_path), 'w', encoding='utf-8') as f:
+        f.write('{"add": [{"id": "torn", "ty')
+    store = open_ledger_store('json', str(tmp_path))
+    store.commit(add=[_record('a')])
+    reopened = open_ledger_store('json', str(tmp_path))
+    assert reopened.get_record('a') is not None
+    with open(_journal(tmp_path) + CORRUPT_SUFFIX, encoding='utf-8') as f:
+        assert f.read() == '{"add": [{"id": "torn", "ty\n'
+
+
+def test_complete_last_line_without_newline_is_kept(tmp_path):
+    _fresh_store(tmp_path)
+    with open(_journal(tmp_path), 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'add': [_record('b')]}))
+    store = open_ledger_store('json', str(tmp_path))
+    store.commit(add=[_record('a')])
+    reopened = open_ledger_store('json', str(tmp_path))
+    assert reopened.get_record('a') is not None
+    assert reopened.get_record('b') is not None
+
+
+def test_corrupt_middle_line_is_quarantined(tmp_path):
+    _fresh_store(tmp_path)
+    with open(_journal(tmp_path), 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'add': [_record('b')]}) + '\ngarbage{\n' + json.dumps({'add': [_record('c')]}) + '\n')
+    store = open_ledger_store('json', str(tmp_path))
+    assert store.get_record('b') is not None
+    assert store.get_record('c') is not None
+    with open(_journal(tmp_path) + CORRUPT_SUFFIX, encoding='utf-8') as f:
+        assert f.read() == 'garbage{\n'
+
+
+def test_other_process_appends_are_replayed_incrementally(tmp_path):
+    # 两个存储对象共用一个数据目录，相当于两个 worker 进程
+    first, second = _fresh_store(tmp_path), open_ledger_store('json', str(tmp_path))
+    second.period_summary('2024')
+    reloads = []
+    reload = second._reload
+    second._reload = lambda: (reloads.append(1), reload())
+    for i in range(20):
+        store = first if i % 2 else second
+        store.commit(add=[_record(f'r{i}', f'2024-01-{i + 1:02d}')], remove=[f'r{i - 3}'] if i >= 3 else [])
+    first.commit(categories={'expense': ['餐饮', '交通'], 'income': ['工资']})
+    assert sorted(r['id'] for r in second.iter_records()) == sorted(r['id'] for r in first.iter_records())
+    assert second.period_summary('2024') == first.period_summary('2024')
+    assert second.meta() == first.meta()
+    assert reloads == []
@@ -0,0 +1,40 @@
+# 文件: tests/test_queries.py
+# records_on / records_in 在随机增删改之后与逐条筛选全部记录的结果一致；同类别的记录保持录入顺序。
+import random
+
+import pytest
+
+from storage import BACKENDS, open_ledger_store
+from test_aggregates import DAYS, _periods, _random_operation
+
+
+def _group_order(records):
+    groups = {}
+    for r in records:
+        groups.setdefault((r['type'], r['category']), []).append(r['id'])
+    return groups
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_date_queries_match_brute_force(tmp_path, backend):
+    rng = random.Random(backend)
+    store = open_ledger_store(backend, str(tmp_path))
+    store.recover()
+    records = {}
+    for step in range(200):
+        add, remove = _random_operation(rng, records)
+        store.commit(add=add, remove=remove)
+        for record_id in remove:
+            del records[record_id]
+        for record in add:
+            records[record['id']] = record
+        if step % 40 == 0:  # 先查询一次，之后的增删走增量维护的日期索引
+            store.records_on(rng.choice(DAYS))
+
+    for day in DAYS + ['2024-03-01']:
+        expected = [r for r in records.values() if r['date'] == day]
+        assert _group_order(store.records_on(day)) == _group_order(expected)
+    for prefix in _periods():
+        if len(prefix) < 10:
+            found = sorted(r['id'] for r in store.records_in(prefix))
+            assert found == sorted(r['id'] for r in records.values() if r['date'].startswith(prefix))
@@ -0,0 +1,37 @@
+# 文件: tests/test_sync_clock.py
+# 同步的混合时钟：拒绝远在未来的对端时间戳，时间戳很大时本机时钟仍然单调递增。
+import os
+import time
+
+from storage import open_ledger_store
+from sync import MAX_CLOCK_SKEW, SYNC_FILENAME, LedgerSync
+
+
+def _sync(tmp_path):
+    store = open_ledger_store('json', str(tmp_path))
+    store.recover()
+    return LedgerSync(store, os.path.join(str(tmp_path), SYNC_FILENAME))
+
+
+def _change(record_id, updated_at):
+    return {'id': record_id, 'updated_at': updated_at, 'origin': 'peer', 'deleted': False,
+            'data': {'id': record_id, 'type': 'expense', 'category': '餐饮', 'amount': 1.5,
+                     'description': '', 'date': '2024-01-02'}}
+
+
+def test_far_future_timestamp_is_rejected(tmp_path):
+    sync = _sync(tmp_path)
+    result = sync.apply([_change('future', 9e12), _change('near', time.time() + MAX_CLOCK_SKEW / 2)])
+    assert result['applied'] == 1
+    assert [e['index'] for e in result['errors']] == [0]
+    assert sync.store.get_record('future') is None
+    assert sync.log.get_state('clock') < time.time() + MAX_CLOCK_SKEW
+
+
+def test_tick_advances_when_step_is_below_float_resolution(tmp_path):
+    sync = _sync(tmp_path)
+    sync.log.set_state('clock', 9e12)
+    with sync.log._connect() as conn:
+        ticks = [sync.log._tick(conn) for _ in range(3)]
+    assert ticks[0] > 9e12
+    assert ticks[0] < ticks[1] < ticks[2]
@@ -0,0 +1,43 @@
+# 文件: tests/test_sync_peer.py
+# POST /sync/peer 需要同步口令，且只会与 SYNC_PEERS 中配置的对端同步，口令不会发送给请求方填写的地址。
+import pytest
+
+PEER = 'http://peer.example:5001'
+
+
+@pytest.fixture
+def sync_calls(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'SYNC_TOKEN', 'secret')
+    monkeypatch.setitem(app_module.app.config, 'SYNC_PEERS', [PEER])
+    calls = []
+
+    def fake_sync_with(url, token=None):
+        calls.append((url, token))
+        return {'pulled': 0, 'applied': 0, 'pushed': 0}
+
+    monkeypatch.setattr(app_module.ledger_sync, 'sync_with', fake_sync_with)
+    return calls
+
+
+def test_requires_sync_token(app_module, sync_calls):
+    client = app_module.app.test_client()
+    assert client.post('/sync/peer', json={'url': PEER}).status_code == 401
+    assert client.post('/sync/peer', json={'url': PEER}, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert sync_calls == []
+
+
+@pytest.mark.parametrize('url', ['http://attacker.example', PEER + '/evil', 'ftp://peer.example:5001', ''])
+def test_rejects_peers_outside_allow_list(app_module, sync_calls, url):
+    client = app_module.app.test_client()
+    response = client.post('/sync/peer', json={'url': url}, headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 403
+    assert sync_calls == []
+
+
+def test_syncs_with_configured_peer(app_module, sync_calls):
+    client = app_module.app.test_client()
+    response = client.post('/sync/peer', json={'url': PEER + '/'}, headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    response = client.post('/sync/peer', data={'peer_url': PEER, 'sync_token': 'secret'})
+    assert response.status_code == 302
+    assert sync_calls == [(PEER, 'secret'), (PEER, 'secret')]